@@ -864,6 +864,7 @@ with tab2:
                     try:
                         chunks_response = requests.get(
                             f"{API_URL}/api/rag/documents/{selected_doc_id}/chunks",
+                            params={"include_full": "true"},
                             headers={"X-API-Key": API_KEY},
                             timeout=10
                         )
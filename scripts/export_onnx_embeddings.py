@@ -0,0 +1,62 @@
+"""
+Script para exportar o modelo local de embeddings para ONNX e quantizar em int8
+Usado pelo provedor sentence-transformers quando EMBEDDING_ONNX_MODEL_DIR está definido
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.modules.rag.onnx_encoder import ONNX_QUANTIZED_FILE
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def export_onnx_embeddings(model_name: str, output_dir: str):
+    """Exporta o modelo (feature-extraction) e gera a versão quantizada int8"""
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        from transformers import AutoTokenizer
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        logger.info(f"Exportando {model_name} para ONNX...")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(output_path)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(output_path)
+        
+        logger.info("Quantizando pesos para int8 (quantização dinâmica)...")
+        quantize_dynamic(
+            str(output_path / "model.onnx"),
+            str(output_path / ONNX_QUANTIZED_FILE),
+            weight_type=QuantType.QInt8
+        )
+        
+        logger.info(f"Modelo salvo em {output_path}. Defina EMBEDDING_ONNX_MODEL_DIR={output_path}")
+    
+    except ImportError:
+        logger.error("Dependências ausentes. Instale com: pip install optimum[onnxruntime]")
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao exportar modelo: {e}")
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o modelo de embeddings local para ONNX int8")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Modelo do Hugging Face a exportar")
+    parser.add_argument("--output-dir", default="data/models/embeddings-onnx", help="Diretório de saída")
+    
+    args = parser.parse_args()
+    export_onnx_embeddings(args.model, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
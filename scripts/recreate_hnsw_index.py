@@ -9,6 +9,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from sqlalchemy import create_engine, text
 from src.config.config import config
+from src.modules.rag.rag_service import hnsw_index_statements
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -26,16 +27,11 @@ def recreate_hnsw_index():
             conn.execute(text("DROP INDEX IF EXISTS document_chunks_embedding_idx"))
             conn.commit()
             
-            # Criar novo índice HNSW
-            logger.info("Criando índice HNSW...")
-            create_index_sql = """
-            CREATE INDEX document_chunks_embedding_idx 
-            ON document_chunks 
-            USING hnsw (embedding vector_cosine_ops)
-            WITH (m = 16, ef_construction = 64);
-            """
-            
-            conn.execute(text(create_index_sql))
+            # Criar novo índice HNSW (m/ef_construction conforme o volume de chunks)
+            row_count = conn.execute(text("SELECT COUNT(*) FROM document_chunks")).scalar()
+            logger.info(f"Criando índice HNSW para {row_count} chunks...")
+            for statement in hnsw_index_statements(row_count):
+                conn.execute(text(statement))
             conn.commit()
             
             logger.info("Índice HNSW criado com sucesso!")
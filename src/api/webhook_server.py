@@ -2,31 +2,48 @@
 Servidor de webhooks e API REST
 """
 import logging
+import asyncio
 import json
-from fastapi import FastAPI, Request, HTTPException, Depends, Query, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+import re
+from fastapi import FastAPI, APIRouter, Request, HTTPException, Depends, Query, UploadFile, File, Form
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    orjson = None
+    DefaultJSONResponse = JSONResponse
 from fastapi.security import APIKeyHeader
+from fastapi.routing import APIRoute
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 import os
 import shutil
 from pathlib import Path
 
-from sqlalchemy import text
-
 from src.config.config import config
 from src.core.orchestrator import AgentOrchestrator
-from src.modules.whatsapp.whatsapp_service import WhatsAppService
-from src.modules.calendly.calendly_service import CalendlyService
+from src.core.langchain_agent import close_llm_http_clients
+from src.modules.whatsapp.whatsapp_service import WhatsAppService, close_whatsapp_http_client
+from src.modules.calendly.calendly_service import CalendlyService, close_calendly_http_client
 from src.modules.followup.followup_service import FollowUpService
+from src.modules.rag.rag_service import get_rag_service
+from src.modules.rag.document_processor import shutdown_document_pools
+from src.modules.voice.voice_service import shutdown_voice_pool
 from src.api.auth import api_key_auth
+from src.utils.redis_client import redis_client
 
 logger = logging.getLogger(__name__)
 
+# Classificação de erros de banco no upload (uma única varredura da mensagem)
+_DB_UNAVAILABLE_RE = re.compile(r"pgvector|vector|extension|could not connect|connection", re.IGNORECASE)
+
 # Inicializar serviços globalmente (lazy initialization)
 _orchestrator: Optional[AgentOrchestrator] = None
 _whatsapp_service: Optional[WhatsAppService] = None
@@ -70,6 +87,28 @@ def get_followup_service() -> FollowUpService:
     return _followup_service
 
 
+class LoggedErrorRoute(APIRoute):
+    """
+    Rota que converte exceções não tratadas em HTTP 500 com log
+    
+    HTTPException e erros de validação seguem o fluxo normal do FastAPI.
+    """
+    
+    def get_route_handler(self):
+        original_handler = super().get_route_handler()
+        
+        async def handler(request: Request) -> Response:
+            try:
+                return await original_handler(request)
+            except (StarletteHTTPException, RequestValidationError):
+                raise
+            except Exception as e:
+                logger.error(f"Erro em {request.method} {request.url.path}: {e}", exc_info=True)
+                raise HTTPException(status_code=500, detail=str(e))
+        
+        return handler
+
+
 class MessageRequest(BaseModel):
     """Request para processar mensagem"""
     message: str = Field(..., description="Mensagem do usuário", example="Olá, preciso de ajuda com meu pedido")
@@ -121,6 +160,7 @@ class MessageResponse(BaseModel):
 class HealthResponse(BaseModel):
     """Resposta do health check"""
     status: str = Field(..., description="Status do serviço", example="healthy")
+    redis: Optional[str] = Field(None, description="Status do Redis (apenas em /healthz)", example="up")
 
 
 class ServiceInfoResponse(BaseModel):
@@ -195,6 +235,11 @@ class MetadataFieldRequest(BaseModel):
     field_options: Optional[Dict[str, Any]] = Field(None, description="Opções adicionais (para select, validações)", example={"options": ["TI", "Vendas", "Suporte"]})
 
 
+class MetadataFieldBatchRequest(BaseModel):
+    """Request para criar vários campos de metadata"""
+    fields: List[MetadataFieldRequest] = Field(..., description="Campos a criar/editar")
+
+
 class MetadataFieldResponse(BaseModel):
     """Resposta de campo de metadata"""
     id: int
@@ -217,11 +262,30 @@ class UpdateMetadataRequest(BaseModel):
     metadata_updates: Dict[str, Any] = Field(..., description="Campos de metadata a atualizar", example={"departamento": "TI", "categoria": "Manual"})
 
 
+class BatchMetadataItem(BaseModel):
+    """Item de atualização de metadata em lote"""
+    document_id: str = Field(..., description="ID do documento")
+    chunk_index: Optional[int] = Field(None, description="Índice do chunk (omita para atualizar todos os chunks do documento)")
+    metadata_updates: Dict[str, Any] = Field(..., description="Campos de metadata a atualizar")
+
+
+class BatchMetadataRequest(BaseModel):
+    """Request para atualizar metadata de vários documentos/chunks"""
+    updates: List[BatchMetadataItem] = Field(..., description="Lista de atualizações")
+
+
+class BatchMetadataResponse(BaseModel):
+    """Resposta de atualização de metadata em lote"""
+    status: str
+    updated: Dict[str, int] = Field(..., description="Número de chunks atualizados por documento")
+    total: int = Field(..., description="Total de chunks atualizados")
+
+
 class ChunkInfoResponse(BaseModel):
     """Informações de um chunk"""
     chunk_index: int
     content: str
-    content_full: str
+    content_full: Optional[str] = None
     metadata: Dict[str, Any]
     source: Optional[str] = None
     created_at: Optional[str] = None
@@ -240,8 +304,25 @@ class RAGAddDocumentResponse(BaseModel):
     document_id: str = Field(..., description="ID do documento adicionado")
 
 
+# Adapters das listagens: validação e serialização em uma única passada no pydantic-core
+_METADATA_FIELDS_ADAPTER = TypeAdapter(List[MetadataFieldResponse])
+_METADATA_FIELDS_LIST_ADAPTER = TypeAdapter(MetadataFieldsListResponse)
+_DOCUMENT_CHUNKS_ADAPTER = TypeAdapter(DocumentChunksResponse)
+
+
+def _validated_json_response(adapter: TypeAdapter, data: Any) -> Response:
+    """Valida os dados com o adapter e retorna o JSON já serializado (sem revalidação pelo FastAPI)"""
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(data)),
+        media_type="application/json"
+    )
+
+
 def create_app() -> FastAPI:
     """Cria e configura a aplicação FastAPI"""
+    # Flags de módulos lidas uma vez no registro das rotas (main() pode alterá-las antes via CLI)
+    enable_knowledge = config.agent.enable_knowledge
+    
     app = FastAPI(
         title=config.api.api_title,
         description="""
@@ -259,6 +340,7 @@ def create_app() -> FastAPI:
         Configure a variável `API_KEY` no arquivo `.env`.
         """,
         version=config.api.api_version,
+        default_response_class=DefaultJSONResponse,  # orjson quando disponível (listagens grandes)
         docs_url="/docs" if config.agent.environment == "development" else None,
         redoc_url="/redoc" if config.agent.environment == "development" else None,
         tags_metadata=[
@@ -281,6 +363,47 @@ def create_app() -> FastAPI:
         ]
     )
     
+    @app.on_event("startup")
+    async def warm_up_services():
+        """Conecta o Redis, inicializa o serviço RAG (pool aquecido) e inicia o loop de follow-ups na subida da aplicação"""
+        try:
+            await redis_client.connect()
+        except Exception as e:
+            # Memória/cache seguem em modo fallback e reconectam depois
+            logger.warning(f"Redis não conectado no startup: {e}")
+        
+        if enable_knowledge:
+            try:
+                rag_service = get_rag_service()
+                await asyncio.to_thread(rag_service.warm_up_pool)
+            except Exception as e:
+                # Mantém inicialização lazy: a próxima requisição tenta novamente
+                logger.warning(f"Serviço RAG não inicializado no startup: {e}")
+        
+        # Envio dos follow-ups agendados pelo webhook (mesma instância: o agendamento acorda o loop)
+        app.state.followup_task = None
+        if config.agent.enable_followup:
+            app.state.followup_task = asyncio.create_task(get_followup_service().run_forever_loop())
+    
+    @app.on_event("shutdown")
+    async def close_http_clients():
+        """Para o loop de follow-ups, conclui escritas pendentes e fecha os pools HTTP (LLM, Calendly, WhatsApp), do Redis, de documentos e de voz"""
+        followup_task = getattr(app.state, "followup_task", None)
+        if followup_task is not None:
+            followup_task.cancel()
+            try:
+                await followup_task
+            except asyncio.CancelledError:
+                pass
+        if _orchestrator is not None:
+            await _orchestrator.drain_background_tasks()
+        await close_llm_http_clients()
+        await close_calendly_http_client()
+        await close_whatsapp_http_client()
+        await redis_client.disconnect()
+        shutdown_document_pools()
+        shutdown_voice_pool()
+    
     @app.get(
         "/",
         response_model=ServiceInfoResponse,
@@ -308,6 +431,19 @@ def create_app() -> FastAPI:
         """Health check (sem autenticação)"""
         return HealthResponse(status="healthy")
     
+    @app.get(
+        "/healthz",
+        response_model=HealthResponse,
+        tags=["Geral"],
+        summary="Health check com dependências",
+        description="Verifica também o Redis com PING (não requer autenticação). Sem Redis o serviço segue em modo fallback: status `degraded`."
+    )
+    async def healthz():
+        """Health check com PING no Redis (sem autenticação)"""
+        if await redis_client.ping():
+            return HealthResponse(status="healthy", redis="up")
+        return HealthResponse(status="degraded", redis="down")
+    
     @app.post(
         "/api/message",
         response_model=MessageResponse,
@@ -371,14 +507,14 @@ def create_app() -> FastAPI:
         **Não requer autenticação** (configure validação de webhook na Evolution API)
         """
     )
-    async def whatsapp_webhook(webhook_data: dict):
+    async def whatsapp_webhook(request: Request):
         """
         Webhook para receber mensagens do WhatsApp (Evolution API)
         """
         try:
             whatsapp_service = get_whatsapp_service()
-            # Processar webhook
-            message_data = whatsapp_service.parse_webhook_message(webhook_data)
+            # Processar webhook direto do corpo bruto (só os campos usados são convertidos)
+            message_data = whatsapp_service.parse_webhook_bytes(await request.body())
             
             if not message_data:
                 return {"status": "ignored"}
@@ -470,10 +606,17 @@ def create_app() -> FastAPI:
             logger.error(f"Erro ao processar webhook Calendly: {e}", exc_info=True)
             return {"status": "error", "error": str(e)}
     
-    @app.post(
-        "/api/rag/upload",
-        response_model=RAGAddDocumentResponse,
+    # Rotas RAG: autenticação aplicada no router; só são registradas se o módulo estiver ativo
+    rag_router = APIRouter(
+        prefix="/api/rag",
         tags=["RAG"],
+        dependencies=[Depends(api_key_auth.verify_api_key)],
+        route_class=LoggedErrorRoute
+    )
+    
+    @rag_router.post(
+        "/upload",
+        response_model=RAGAddDocumentResponse,
         summary="Upload de documento",
         description="""
         Faz upload de um arquivo e adiciona à base de conhecimento RAG.
@@ -492,103 +635,86 @@ def create_app() -> FastAPI:
     async def upload_document(
         file: UploadFile = File(..., description="Arquivo a ser enviado"),
         document_id: Optional[str] = Form(None, description="ID opcional do documento"),
-        selected_metadata: Optional[str] = Form(None, description="Metadata selecionada em JSON (ex: {\"departamento\": \"TI\"})"),
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        selected_metadata: Optional[str] = Form(None, description="Metadata selecionada em JSON (ex: {\"departamento\": \"TI\"})")
     ):
         """
         Faz upload de arquivo e adiciona à base de conhecimento RAG
         """
+        # Validar extensão
+        allowed_extensions = {'.pdf', '.docx', '.doc', '.txt'}
+        file_ext = Path(file.filename).suffix.lower()
+        
+        if file_ext not in allowed_extensions:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato não suportado. Use: {', '.join(allowed_extensions)}"
+            )
+        
+        # Criar diretório de uploads se não existir
+        uploads_dir = config.agent.uploads_dir
+        uploads_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Salvar arquivo
+        file_path = uploads_dir / file.filename
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        
+        logger.info(f"Arquivo salvo em: {file_path}")
+        
+        # Processar e adicionar à base de conhecimento
         try:
-            # Validar extensão
-            allowed_extensions = {'.pdf', '.docx', '.doc', '.txt'}
-            file_ext = Path(file.filename).suffix.lower()
-            
-            if file_ext not in allowed_extensions:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Formato não suportado. Use: {', '.join(allowed_extensions)}"
-                )
+            rag_service = get_rag_service()
             
-            # Criar diretório de uploads se não existir
-            uploads_dir = config.agent.uploads_dir
-            uploads_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Salvar arquivo
-            file_path = uploads_dir / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            logger.info(f"Arquivo salvo em: {file_path}")
-            
-            # Verificar se módulo RAG está habilitado
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true ou --knowledge"
-                )
-            
-            # Processar e adicionar à base de conhecimento
-            try:
-                from src.modules.rag.rag_service import RAGService
-                rag_service = RAGService()
-                
-                # Parse selected_metadata se fornecido
-                selected_metadata_dict = None
-                if selected_metadata and selected_metadata.strip():
-                    try:
-                        selected_metadata_dict = json.loads(selected_metadata)
-                        # Validar que é um dicionário
-                        if not isinstance(selected_metadata_dict, dict):
-                            raise HTTPException(
-                                status_code=400,
-                                detail="selected_metadata deve ser um objeto JSON válido"
-                            )
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Erro ao fazer parse de selected_metadata: {e}")
+            # Parse selected_metadata se fornecido
+            selected_metadata_dict = None
+            if selected_metadata and selected_metadata.strip():
+                try:
+                    selected_metadata_dict = json.loads(selected_metadata)
+                    # Validar que é um dicionário
+                    if not isinstance(selected_metadata_dict, dict):
                         raise HTTPException(
                             status_code=400,
-                            detail=f"selected_metadata deve ser um JSON válido: {str(e)}"
+                            detail="selected_metadata deve ser um objeto JSON válido"
                         )
-                
-                logger.info(f"Adicionando documento: {file.filename}, metadata: {selected_metadata_dict}")
-                
-                doc_id = await rag_service.add_document(
-                    file_path=str(file_path),
-                    document_id=document_id,
-                    metadata={"original_filename": file.filename, "uploaded_at": datetime.utcnow().isoformat()},
-                    selected_metadata=selected_metadata_dict
-                )
-                
-                return RAGAddDocumentResponse(status="success", document_id=doc_id)
-            except HTTPException:
-                # Re-raise HTTPException para manter status code correto
-                raise
-            except Exception as rag_error:
-                logger.error(f"Erro ao processar documento RAG: {rag_error}", exc_info=True)
-                # Se for erro de banco/extensão, dar mensagem mais clara
-                error_str = str(rag_error).lower()
-                if "vector" in error_str or "extension" in error_str or "pgvector" in error_str:
+                except json.JSONDecodeError as e:
+                    logger.error(f"Erro ao fazer parse de selected_metadata: {e}")
                     raise HTTPException(
-                        status_code=503,
-                        detail="Erro ao acessar banco de dados. Verifique se PostgreSQL com pgvector está rodando (docker-compose up -d)"
+                        status_code=400,
+                        detail=f"selected_metadata deve ser um JSON válido: {str(e)}"
                     )
-                if "connection" in error_str or "could not connect" in error_str:
+            
+            logger.info(f"Adicionando documento: {file.filename}, metadata: {selected_metadata_dict}")
+            
+            doc_id = await rag_service.add_document(
+                file_path=str(file_path),
+                document_id=document_id,
+                metadata={"original_filename": file.filename, "uploaded_at": datetime.utcnow().isoformat()},
+                selected_metadata=selected_metadata_dict
+            )
+            
+            return RAGAddDocumentResponse(status="success", document_id=doc_id)
+        except HTTPException:
+            # Re-raise HTTPException para manter status code correto
+            raise
+        except Exception as rag_error:
+            logger.error(f"Erro ao processar documento RAG: {rag_error}", exc_info=True)
+            # Se for erro de banco/extensão, dar mensagem mais clara
+            match = _DB_UNAVAILABLE_RE.search(str(rag_error))
+            if match:
+                if match.group(0).lower() in ("connection", "could not connect"):
                     raise HTTPException(
                         status_code=503,
                         detail="Erro de conexão com banco de dados. Verifique se o PostgreSQL está rodando."
                     )
-                raise HTTPException(status_code=500, detail=f"Erro ao processar documento: {str(rag_error)}")
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao fazer upload de documento: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+                raise HTTPException(
+                    status_code=503,
+                    detail="Erro ao acessar banco de dados. Verifique se PostgreSQL com pgvector está rodando (docker-compose up -d)"
+                )
+            raise HTTPException(status_code=500, detail=f"Erro ao processar documento: {str(rag_error)}")
     
-    @app.post(
-        "/api/rag/add-document",
+    @rag_router.post(
+        "/add-document",
         response_model=RAGAddDocumentResponse,
-        tags=["RAG"],
         summary="Adicionar documento (por caminho)",
         description="""
         Adiciona um documento à base de conhecimento RAG usando caminho do arquivo.
@@ -607,8 +733,7 @@ def create_app() -> FastAPI:
         """
     )
     async def add_document(
-        request: RAGAddDocumentRequest,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        request: RAGAddDocumentRequest
     ):
         """
         Adiciona documento à base de conhecimento RAG por caminho
@@ -617,22 +742,15 @@ def create_app() -> FastAPI:
         
         Requer autenticação via API Key
         """
-        try:
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            doc_id = await rag_service.add_document(request.file_path, request.document_id)
-            
-            return RAGAddDocumentResponse(status="success", document_id=doc_id)
-            
-        except Exception as e:
-            logger.error(f"Erro ao adicionar documento: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        doc_id = await rag_service.add_document(request.file_path, request.document_id)
+        
+        return RAGAddDocumentResponse(status="success", document_id=doc_id)
     
-    @app.get(
-        "/api/rag/search",
+    @rag_router.get(
+        "/search",
         response_model=RAGSearchResponse,
-        tags=["RAG"],
         summary="Buscar na base de conhecimento",
         description="""
         Busca documentos relevantes na base de conhecimento usando busca vetorial.
@@ -649,48 +767,38 @@ def create_app() -> FastAPI:
         query: str = Query(..., description="Query de busca", example="Como funciona o processo de devolução?"),
         top_k: int = Query(5, description="Número de resultados a retornar", ge=1, le=20),
         similarity_threshold: float = Query(0.3, ge=0.0, le=1.0, description="Limite mínimo de similaridade (0.0 a 1.0)"),
-        metadata_filter: Optional[str] = Query(None, description="Filtros de metadata em JSON (ex: {\"departamento\": \"TI\"})"),
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        metadata_filter: Optional[str] = Query(None, description="Filtros de metadata em JSON (ex: {\"departamento\": \"TI\"})")
     ):
         """
         Busca na base de conhecimento
         
         Requer autenticação via API Key
         """
-        try:
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            # Parse metadata_filter se fornecido
-            metadata_dict = None
-            if metadata_filter:
-                try:
-                    metadata_dict = json.loads(metadata_filter)
-                except json.JSONDecodeError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="metadata_filter deve ser um JSON válido"
-                    )
-            
-            results = await rag_service.search(
-                query, 
-                top_k=top_k, 
-                similarity_threshold=similarity_threshold,
-                metadata_filter=metadata_dict
-            )
-            
-            return RAGSearchResponse(results=results)
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao buscar: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        # Parse metadata_filter se fornecido
+        metadata_dict = None
+        if metadata_filter:
+            try:
+                metadata_dict = json.loads(metadata_filter)
+            except json.JSONDecodeError:
+                raise HTTPException(
+                    status_code=400,
+                    detail="metadata_filter deve ser um JSON válido"
+                )
+        
+        results = await rag_service.search(
+            query, 
+            top_k=top_k, 
+            similarity_threshold=similarity_threshold,
+            metadata_filter=metadata_dict
+        )
+        
+        return RAGSearchResponse(results=results)
     
-    @app.get(
-        "/api/rag/documents",
+    @rag_router.get(
+        "/documents",
         response_model=RAGListDocumentsResponse,
-        tags=["RAG"],
         summary="Listar documentos",
         description="""
         Lista todos os documentos na base de conhecimento RAG.
@@ -701,41 +809,40 @@ def create_app() -> FastAPI:
         - Data de criação e atualização
         - Nome do arquivo original
         
+        Com `stream=true`, os documentos são enviados um por linha (NDJSON, `application/x-ndjson`)
+        à medida que são lidos do banco, sem montar a lista completa em memória.
+        
         **Requer autenticação via API Key**
         """
     )
     async def list_documents(
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        stream: bool = Query(False, description="Retornar documentos como NDJSON em streaming (bases grandes)")
     ):
         """
         Lista todos os documentos na base de conhecimento
         """
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            documents = await rag_service.list_documents()
+        rag_service = get_rag_service()
+        
+        if stream:
+            async def ndjson_lines():
+                async for document in rag_service.stream_documents():
+                    if orjson is not None:
+                        yield orjson.dumps(document) + b"\n"
+                    else:
+                        yield json.dumps(document).encode("utf-8") + b"\n"
             
-            return RAGListDocumentsResponse(
-                documents=documents,
-                total=len(documents)
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao listar documentos: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+            return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+        
+        documents = await rag_service.list_documents()
+        
+        return RAGListDocumentsResponse(
+            documents=documents,
+            total=len(documents)
+        )
     
-    @app.delete(
-        "/api/rag/documents/{document_id}",
+    @rag_router.delete(
+        "/documents/{document_id}",
         response_model=RAGDeleteDocumentResponse,
-        tags=["RAG"],
         summary="Excluir documento",
         description="""
         Exclui um documento da base de conhecimento RAG.
@@ -746,53 +853,31 @@ def create_app() -> FastAPI:
         """
     )
     async def delete_document(
-        document_id: str,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        document_id: str
     ):
         """
         Exclui um documento da base de conhecimento
         """
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            # Obter número de chunks antes de deletar
-            session = rag_service.SessionLocal()
-            try:
-                count_sql = text("SELECT COUNT(*) FROM document_chunks WHERE document_id = :doc_id")
-                chunk_count = session.execute(count_sql, {"doc_id": document_id}).scalar()
-            finally:
-                session.close()
-            
-            success = await rag_service.delete_document(document_id)
-            
-            if not success:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Documento {document_id} não encontrado"
-                )
-            
-            return RAGDeleteDocumentResponse(
-                status="success",
-                document_id=document_id,
-                chunks_deleted=chunk_count
+        rag_service = get_rag_service()
+        
+        # Número de chunks removidos vem do próprio DELETE (rowcount)
+        chunk_count = await rag_service.delete_document(document_id)
+        
+        if not chunk_count:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Documento {document_id} não encontrado"
             )
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao excluir documento: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        
+        return RAGDeleteDocumentResponse(
+            status="success",
+            document_id=document_id,
+            chunks_deleted=chunk_count
+        )
     
-    @app.get(
-        "/api/rag/metadata/fields",
+    @rag_router.get(
+        "/metadata/fields",
         response_model=MetadataFieldsListResponse,
-        tags=["RAG"],
         summary="Listar campos de metadata",
         description="""
         Lista todos os campos de metadata disponíveis/configurados.
@@ -800,77 +885,73 @@ def create_app() -> FastAPI:
         **Requer autenticação via API Key**
         """
     )
-    async def list_metadata_fields(
-        api_key: str = Depends(api_key_auth.verify_api_key)
-    ):
+    async def list_metadata_fields():
         """Lista campos de metadata disponíveis"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            fields = await rag_service.list_metadata_fields()
-            
-            return MetadataFieldsListResponse(
-                fields=[MetadataFieldResponse(**field) for field in fields],
-                total=len(fields)
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao listar campos de metadata: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        fields = await rag_service.list_metadata_fields()
+        
+        return _validated_json_response(
+            _METADATA_FIELDS_LIST_ADAPTER,
+            {"fields": fields, "total": len(fields)}
+        )
     
-    @app.post(
-        "/api/rag/metadata/fields",
+    @rag_router.post(
+        "/metadata/fields",
         response_model=MetadataFieldResponse,
-        tags=["RAG"],
         summary="Criar campo de metadata",
         description="""
         Cria um novo campo de metadata disponível.
         
-        Quando um novo campo é criado, todos os documentos existentes terão esse campo setado como null.
+        Os chunks existentes não são reescritos: ao listar chunks (`/documents/{document_id}/chunks`)
+        ou obter a metadata de um chunk, campos configurados ausentes aparecem como null.
+        Resultados de busca trazem apenas as chaves gravadas no chunk.
         
         **Requer autenticação via API Key**
         """
     )
     async def create_metadata_field(
-        request: MetadataFieldRequest,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        request: MetadataFieldRequest
     ):
         """Cria um novo campo de metadata"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            field = await rag_service.create_metadata_field(
-                field_key=request.field_key,
-                field_label=request.field_label,
-                field_type=request.field_type,
-                field_options=request.field_options
-            )
-            
-            return MetadataFieldResponse(**field)
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao criar campo de metadata: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        field = await rag_service.create_metadata_field(
+            field_key=request.field_key,
+            field_label=request.field_label,
+            field_type=request.field_type,
+            field_options=request.field_options
+        )
+        
+        return MetadataFieldResponse(**field)
     
-    @app.delete(
-        "/api/rag/metadata/fields/{field_key}",
-        tags=["RAG"],
+    @rag_router.post(
+        "/metadata/fields/batch",
+        response_model=List[MetadataFieldResponse],
+        summary="Criar campos de metadata em lote",
+        description="""
+        Cria (ou atualiza) vários campos de metadata em uma única operação.
+        
+        Mesma semântica do endpoint unitário: os chunks existentes não são reescritos; os novos
+        campos aparecem como null na leitura dos chunks (não nos resultados de busca).
+        
+        **Requer autenticação via API Key**
+        """
+    )
+    async def create_metadata_fields_batch(
+        request: MetadataFieldBatchRequest
+    ):
+        """Cria vários campos de metadata"""
+        rag_service = get_rag_service()
+        
+        fields = await rag_service.create_metadata_fields_bulk(
+            [field.model_dump() for field in request.fields]
+        )
+        
+        return _validated_json_response(_METADATA_FIELDS_ADAPTER, fields)
+    
+    @rag_router.delete(
+        "/metadata/fields/{field_key}",
         summary="Remover campo de metadata",
         description="""
         Remove um campo de metadata.
@@ -881,38 +962,23 @@ def create_app() -> FastAPI:
         """
     )
     async def delete_metadata_field(
-        field_key: str,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        field_key: str
     ):
         """Remove um campo de metadata"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            success = await rag_service.delete_metadata_field(field_key)
-            
-            if not success:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Campo de metadata '{field_key}' não encontrado"
-                )
-            
-            return {"status": "success", "field_key": field_key}
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao remover campo de metadata: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        success = await rag_service.delete_metadata_field(field_key)
+        
+        if not success:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Campo de metadata '{field_key}' não encontrado"
+            )
+        
+        return {"status": "success", "field_key": field_key}
     
-    @app.put(
-        "/api/rag/documents/{document_id}/metadata",
-        tags=["RAG"],
+    @rag_router.put(
+        "/documents/{document_id}/metadata",
         summary="Atualizar metadata de documento",
         description="""
         Atualiza metadata de todos os chunks de um documento.
@@ -922,41 +988,26 @@ def create_app() -> FastAPI:
     )
     async def update_document_metadata(
         document_id: str,
-        request: UpdateMetadataRequest,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        request: UpdateMetadataRequest
     ):
         """Atualiza metadata de todos os chunks de um documento"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            success = await rag_service.update_document_metadata(
-                document_id=document_id,
-                metadata_updates=request.metadata_updates
+        rag_service = get_rag_service()
+        
+        success = await rag_service.update_document_metadata(
+            document_id=document_id,
+            metadata_updates=request.metadata_updates
+        )
+        
+        if not success:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Documento {document_id} não encontrado"
             )
-            
-            if not success:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Documento {document_id} não encontrado"
-                )
-            
-            return {"status": "success", "document_id": document_id}
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao atualizar metadata do documento: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        
+        return {"status": "success", "document_id": document_id}
     
-    @app.put(
-        "/api/rag/documents/{document_id}/chunks/{chunk_index}/metadata",
-        tags=["RAG"],
+    @rag_router.put(
+        "/documents/{document_id}/chunks/{chunk_index}/metadata",
         summary="Atualizar metadata de chunk",
         description="""
         Atualiza metadata de um chunk específico.
@@ -967,82 +1018,97 @@ def create_app() -> FastAPI:
     async def update_chunk_metadata(
         document_id: str,
         chunk_index: int,
-        request: UpdateMetadataRequest,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        request: UpdateMetadataRequest
     ):
         """Atualiza metadata de um chunk específico"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            success = await rag_service.update_chunk_metadata(
-                document_id=document_id,
-                chunk_index=chunk_index,
-                metadata_updates=request.metadata_updates
+        rag_service = get_rag_service()
+        
+        success = await rag_service.update_chunk_metadata(
+            document_id=document_id,
+            chunk_index=chunk_index,
+            metadata_updates=request.metadata_updates
+        )
+        
+        if not success:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Chunk {document_id}:{chunk_index} não encontrado"
             )
-            
-            if not success:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Chunk {document_id}:{chunk_index} não encontrado"
-                )
-            
-            return {"status": "success", "document_id": document_id, "chunk_index": chunk_index}
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao atualizar metadata do chunk: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        
+        return {"status": "success", "document_id": document_id, "chunk_index": chunk_index}
     
-    @app.get(
-        "/api/rag/documents/{document_id}/chunks",
+    @rag_router.patch(
+        "/metadata/batch",
+        response_model=BatchMetadataResponse,
+        summary="Atualizar metadata em lote",
+        description="""
+        Atualiza metadata de vários documentos e/ou chunks em uma única operação.
+        
+        Cada item pode informar `chunk_index` para atualizar um chunk específico
+        ou omiti-lo para atualizar todos os chunks do documento.
+        
+        **Requer autenticação via API Key**
+        """
+    )
+    async def update_metadata_batch(
+        request: BatchMetadataRequest
+    ):
+        """Atualiza metadata de vários documentos/chunks de uma vez"""
+        rag_service = get_rag_service()
+        
+        updated = await rag_service.update_metadata_bulk(
+            [item.model_dump() for item in request.updates]
+        )
+        
+        return BatchMetadataResponse(
+            status="success",
+            updated=updated,
+            total=sum(updated.values())
+        )
+    
+    @rag_router.get(
+        "/documents/{document_id}/chunks",
         response_model=DocumentChunksResponse,
-        tags=["RAG"],
         summary="Listar chunks de documento",
         description="""
         Lista todos os chunks de um documento com suas metadata.
         
+        Com `stream=true`, os chunks são enviados um por linha (NDJSON, `application/x-ndjson`)
+        à medida que são lidos do banco, sem montar a lista completa em memória.
+        
+        `content_full` só é preenchido com `include_full=true` (por padrão apenas o preview).
+        
         **Requer autenticação via API Key**
         """
     )
     async def get_document_chunks(
         document_id: str,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        stream: bool = Query(False, description="Retornar chunks como NDJSON em streaming (documentos grandes)"),
+        include_full: bool = Query(False, description="Incluir o conteúdo completo de cada chunk (content_full)")
     ):
         """Lista todos os chunks de um documento"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            chunks = await rag_service.get_document_chunks(document_id)
+        rag_service = get_rag_service()
+        
+        if stream:
+            async def ndjson_lines():
+                async for chunk in rag_service.stream_document_chunks(document_id, include_full=include_full):
+                    if orjson is not None:
+                        yield orjson.dumps(chunk) + b"\n"
+                    else:
+                        yield json.dumps(chunk).encode("utf-8") + b"\n"
             
-            return DocumentChunksResponse(
-                document_id=document_id,
-                chunks=[ChunkInfoResponse(**chunk) for chunk in chunks],
-                total=len(chunks)
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao listar chunks do documento: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+            return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+        
+        chunks = await rag_service.get_document_chunks(document_id, include_full=include_full)
+        
+        return _validated_json_response(
+            _DOCUMENT_CHUNKS_ADAPTER,
+            {"document_id": document_id, "chunks": chunks, "total": len(chunks)}
+        )
     
-    @app.get(
-        "/api/rag/documents/{document_id}/chunks/{chunk_index}/metadata",
+    @rag_router.get(
+        "/documents/{document_id}/chunks/{chunk_index}/metadata",
         response_model=Dict[str, Any],
-        tags=["RAG"],
         summary="Obter metadata de chunk",
         description="""
         Obtém metadata de um chunk específico.
@@ -1052,34 +1118,36 @@ def create_app() -> FastAPI:
     )
     async def get_chunk_metadata(
         document_id: str,
-        chunk_index: int,
-        api_key: str = Depends(api_key_auth.verify_api_key)
+        chunk_index: int
     ):
         """Obtém metadata de um chunk específico"""
-        try:
-            if not config.agent.enable_knowledge:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true"
-                )
-            
-            from src.modules.rag.rag_service import RAGService
-            rag_service = RAGService()
-            
-            metadata = await rag_service.get_chunk_metadata(document_id, chunk_index)
-            
-            if metadata is None:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Chunk {document_id}:{chunk_index} não encontrado"
-                )
-            
-            return metadata
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Erro ao obter metadata do chunk: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
+        rag_service = get_rag_service()
+        
+        metadata = await rag_service.get_chunk_metadata(document_id, chunk_index)
+        
+        if metadata is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Chunk {document_id}:{chunk_index} não encontrado"
+            )
+        
+        return metadata
+    
+    if enable_knowledge:
+        app.include_router(rag_router)
+    else:
+        @app.api_route(
+            "/api/rag/{path:path}",
+            methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+            include_in_schema=False,
+            dependencies=[Depends(api_key_auth.verify_api_key)]
+        )
+        async def rag_disabled(path: str):
+            """Responde 503 para qualquer rota RAG quando o módulo está desabilitado"""
+            raise HTTPException(
+                status_code=503,
+                detail="Módulo RAG está desabilitado. Habilite com ENABLE_KNOWLEDGE=true ou --knowledge"
+            )
     
     return app
 
@@ -2,50 +2,61 @@
 Gerenciamento de configurações do agente
 """
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
 
+ENV_FILE = Path(__file__).parent.parent.parent / ".env"
+
+
+@lru_cache(maxsize=1)
+def _load_dotenv() -> None:
+    """
+    Carrega o .env para os.environ uma única vez por processo
+    
+    Precisa rodar antes da definição das classes abaixo, pois as instâncias
+    padrão de Config são criadas no momento da definição.
+    Variáveis já exportadas no ambiente têm prioridade.
+    """
+    if not ENV_FILE.exists():
+        return
+    with open(ENV_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                key = key.strip()
+                value = value.strip().strip('"').strip("'")
+                if key not in os.environ:
+                    os.environ[key] = value
+
+
+_load_dotenv()
+
+
 class DatabaseConfig(BaseSettings):
     """Configurações do banco de dados"""
     host: str = Field(default="127.0.0.1", env="POSTGRES_HOST")  # Usar 127.0.0.1 para forçar IPv4 e conectar ao Docker
     port: int = Field(default=5433, env="POSTGRES_PORT")  # Porta 5433 para conectar ao Docker (evita conflito com PostgreSQL local)
     user: str = Field(default="agente", env="POSTGRES_USER")
     password: str = Field(default="agente123", env="POSTGRES_PASSWORD")
-    database: str = Field(default="agente_db", env="POSTGRES_DB")
+    database: str = Field(default="agente_db", validation_alias="POSTGRES_DB")
+    pool_size: int = Field(default=10, env="POSTGRES_POOL_SIZE")  # Conexões mantidas abertas (pré-aquecidas no startup da API)
+    max_overflow: int = Field(default=20, env="POSTGRES_MAX_OVERFLOW")
+    pool_recycle: int = Field(default=1800, env="POSTGRES_POOL_RECYCLE")  # Segundos até reabrir uma conexão (evita conexões derrubadas por firewall/PgBouncer)
+    statement_timeout_ms: int = Field(default=0, env="POSTGRES_STATEMENT_TIMEOUT_MS")  # Limite por statement nas requisições (0 = sem limite)
     
     model_config = {
+        "env_prefix": "POSTGRES_",  # host/port/user/password -> POSTGRES_HOST, POSTGRES_PORT, ...
         "env_file": ".env",
         "env_file_encoding": "utf-8",
         "case_sensitive": False,
         "extra": "ignore"
     }
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Forçar uso do .env se a variável não foi definida explicitamente
-        env_file = Path(__file__).parent.parent.parent / ".env"
-        if env_file.exists():
-            with open(env_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith("#") and "=" in line:
-                        key, value = line.split("=", 1)
-                        key = key.strip()
-                        value = value.strip().strip('"').strip("'")
-                        if key == "POSTGRES_USER" and "POSTGRES_USER" not in os.environ:
-                            object.__setattr__(self, "user", value)
-                        elif key == "POSTGRES_PASSWORD" and "POSTGRES_PASSWORD" not in os.environ:
-                            object.__setattr__(self, "password", value)
-                        elif key == "POSTGRES_HOST" and "POSTGRES_HOST" not in os.environ:
-                            object.__setattr__(self, "host", value)
-                        elif key == "POSTGRES_PORT" and "POSTGRES_PORT" not in os.environ:
-                            object.__setattr__(self, "port", int(value))
-                        elif key == "POSTGRES_DB" and "POSTGRES_DB" not in os.environ:
-                            object.__setattr__(self, "database", value)
-    
     @property
     def connection_string(self) -> str:
         return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
@@ -59,6 +70,7 @@ class LLMConfig(BaseSettings):
     anthropic_api_key: Optional[str] = Field(default=None, env="ANTHROPIC_API_KEY")
     temperature: float = Field(default=0.7, env="LLM_TEMPERATURE")
     max_tokens: int = Field(default=2000, env="LLM_MAX_TOKENS")
+    max_concurrency: int = Field(default=20, validation_alias="LLM_MAX_CONCURRENCY")  # Chamadas simultâneas ao agente/LLM por processo
 
 
 class EmbeddingConfig(BaseSettings):
@@ -67,6 +79,12 @@ class EmbeddingConfig(BaseSettings):
     model: str = Field(default="text-embedding-3-small", env="EMBEDDING_MODEL")
     openai_api_key: Optional[str] = Field(default=None, env="OPENAI_API_KEY")
     dimension: int = Field(default=1536, env="EMBEDDING_DIMENSION")
+    batch_max_size: int = Field(default=64, validation_alias="EMBEDDING_BATCH_MAX_SIZE")  # Textos por chamada em lote
+    batch_wait_ms: float = Field(default=20.0, validation_alias="EMBEDDING_BATCH_WAIT_MS")  # Janela para acumular chamadas de embed_text
+    cache_size: int = Field(default=10000, validation_alias="EMBEDDING_CACHE_SIZE")  # Embeddings mantidos em memória (LRU por conteúdo)
+    disk_cache: bool = Field(default=True, validation_alias="EMBEDDING_DISK_CACHE")  # Persistir em ~/.cache/embeddings (requer diskcache)
+    onnx_model_dir: Optional[str] = Field(default=None, validation_alias="EMBEDDING_ONNX_MODEL_DIR")  # Modelo local ONNX int8 (scripts/export_onnx_embeddings.py)
+    device: Optional[str] = Field(default=None, validation_alias="EMBEDDING_DEVICE")  # Dispositivo do modelo local (ex: cuda); None = automático
 
 
 class WhatsAppConfig(BaseSettings):
@@ -92,14 +110,30 @@ class VoiceConfig(BaseSettings):
     aws_access_key: Optional[str] = Field(default=None, env="AWS_ACCESS_KEY_ID")
     aws_secret_key: Optional[str] = Field(default=None, env="AWS_SECRET_ACCESS_KEY")
     elevenlabs_api_key: Optional[str] = Field(default=None, env="ELEVENLABS_API_KEY")
+    executor_workers: int = Field(default=4, validation_alias="VOICE_EXECUTOR_WORKERS")  # Threads para as chamadas bloqueantes dos SDKs de voz
 
 
 class RAGConfig(BaseSettings):
     """Configurações do RAG"""
     top_k: int = Field(default=5, env="RAG_TOP_K")
+    top_k_max: int = Field(default=100, validation_alias="RAG_TOP_K_MAX")  # Teto de resultados por busca do retriever
     similarity_threshold: float = Field(default=0.3, env="RAG_SIMILARITY_THRESHOLD")  # Reduzido de 0.7 para 0.3 para melhorar recall
     chunk_size: int = Field(default=1000, env="RAG_CHUNK_SIZE")
     chunk_overlap: int = Field(default=200, env="RAG_CHUNK_OVERLAP")
+    vector_type: str = Field(default="halfvec", validation_alias="RAG_VECTOR_TYPE")  # halfvec (FP16, pgvector >= 0.7) ou vector (FP32)
+    ef_search: int = Field(default=100, validation_alias="RAG_EF_SEARCH")  # Candidatos do HNSW por busca (recall x latência); mínimo 4x top_k
+    binary_quantization: bool = Field(default=False, validation_alias="RAG_BINARY_QUANTIZATION")  # Busca no índice HNSW binário + reordenação (bases grandes; pgvector >= 0.7)
+    binary_rerank_factor: int = Field(default=8, validation_alias="RAG_BINARY_RERANK_FACTOR")  # Candidatos do índice binário por resultado (top_k x fator)
+    semantic_cache_size: int = Field(default=1024, validation_alias="RAG_SEMANTIC_CACHE_SIZE")  # Consultas recentes reaproveitadas por similaridade (0 desativa)
+    semantic_cache_threshold: float = Field(default=0.97, validation_alias="RAG_SEMANTIC_CACHE_THRESHOLD")  # Cosseno mínimo para reaproveitar
+    semantic_cache_ttl: float = Field(default=300.0, validation_alias="RAG_SEMANTIC_CACHE_TTL")  # Segundos
+    search_batch_max_size: int = Field(default=16, validation_alias="RAG_SEARCH_BATCH_MAX_SIZE")  # Buscas concorrentes agrupadas em um lote
+    search_batch_wait_ms: float = Field(default=2.0, validation_alias="RAG_SEARCH_BATCH_WAIT_MS")  # Janela para acumular buscas
+    max_concurrency: int = Field(default=32, validation_alias="RAG_MAX_CONCURRENCY")  # Buscas simultâneas por processo
+    max_concurrent_documents: int = Field(default=8, validation_alias="RAG_MAX_CONCURRENT_DOCUMENTS")  # Documentos processados em paralelo
+    document_io_workers: int = Field(default=16, validation_alias="RAG_DOCUMENT_IO_WORKERS")  # Threads de leitura de arquivos
+    hnsw_maintenance_work_mem: str = Field(default="1GB", validation_alias="RAG_HNSW_MAINTENANCE_WORK_MEM")  # Memória do build do índice HNSW
+    hnsw_build_workers: int = Field(default=7, validation_alias="RAG_HNSW_BUILD_WORKERS")  # Workers paralelos do build do índice HNSW
 
 
 class RedisConfig(BaseSettings):
@@ -109,6 +143,8 @@ class RedisConfig(BaseSettings):
     password: Optional[str] = Field(default=None, env="REDIS_PASSWORD")
     db: int = Field(default=0, env="REDIS_DB")
     decode_responses: bool = Field(default=True, env="REDIS_DECODE_RESPONSES")
+    max_connections: int = Field(default=50, validation_alias="REDIS_MAX_CONNECTIONS")  # Pool único compartilhado pelo processo
+    health_check_interval: int = Field(default=30, validation_alias="REDIS_HEALTH_CHECK_INTERVAL")  # Segundos ociosa antes de validar a conexão com PING
     
     @property
     def connection_url(self) -> str:
@@ -124,6 +160,8 @@ class APIConfig(BaseSettings):
     enable_auth: bool = Field(default=True, env="ENABLE_API_AUTH")
     api_title: str = Field(default="Agente IA Multicanal", env="API_TITLE")
     api_version: str = Field(default="0.1.0", env="API_VERSION")
+    workers: int = Field(default_factory=lambda: os.cpu_count() or 1, validation_alias="WEB_CONCURRENCY")  # Processos uvicorn
+    access_log: bool = Field(default=False, validation_alias="API_ACCESS_LOG")  # Log de acesso do uvicorn por requisição
 
 
 class AgentConfig(BaseSettings):
@@ -136,6 +174,9 @@ class AgentConfig(BaseSettings):
     recent_messages_count: int = Field(default=5, env="RECENT_MESSAGES_COUNT")
     enable_conversation_summary: bool = Field(default=True, env="ENABLE_CONVERSATION_SUMMARY")
     summary_update_threshold: int = Field(default=10, env="SUMMARY_UPDATE_THRESHOLD")  # Atualizar sumário a cada N mensagens
+    summary_max_input_tokens: int = Field(default=2000, validation_alias="SUMMARY_MAX_INPUT_TOKENS")  # Orçamento de tokens das mensagens enviadas ao sumário
+    summary_max_concurrency: int = Field(default=4, validation_alias="SUMMARY_MAX_CONCURRENCY")  # Sumários gerados em paralelo (background)
+    summary_cache_ttl: float = Field(default=5.0, validation_alias="SUMMARY_CACHE_TTL")  # Cache local (segundos) do sumário lido do Redis; curto: outro worker pode regerá-lo
     
     # Module flags
     enable_agendamento: bool = Field(default=True, env="ENABLE_AGENDAMENTO")
@@ -180,22 +221,4 @@ class Config(BaseSettings):
 
 
 # Instância global de configuração
-# Carregar .env manualmente antes de criar Config para garantir que variáveis sejam lidas
-import os
-from pathlib import Path
-
-env_file = Path(__file__).parent.parent.parent / ".env"
-if env_file.exists():
-    with open(env_file, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#") and "=" in line:
-                key, value = line.split("=", 1)
-                key = key.strip()
-                value = value.strip().strip('"').strip("'")
-                # Só definir se não estiver já definido no ambiente (variáveis exportadas têm prioridade)
-                if key not in os.environ:
-                    os.environ[key] = value
-
 config = Config()
-
@@ -2,9 +2,11 @@
 Agente LangChain para o sistema
 """
 import logging
-from typing import List, Dict, Optional, Any
-from datetime import datetime
+import importlib.util
+from functools import lru_cache
+from typing import List, Dict, Optional, Any, Tuple
 
+import httpx
 from langchain.agents import create_agent
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
@@ -12,9 +14,39 @@ from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from src.config.config import config
 from src.core.langchain_tools import get_available_tools
 from src.core.prompt_manager import PromptManager
+from src.utils.datetime_utils import utc_now_iso
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexões HTTP compartilhado pelos clientes ChatOpenAI (HTTP/2 se h2 estiver instalado)
+_LLM_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+_LLM_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+@lru_cache(maxsize=1)
+def get_llm_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Retorna clientes HTTP (síncrono e assíncrono) reutilizados por todos os ChatOpenAI"""
+    return (
+        httpx.Client(http2=_LLM_HTTP2, limits=_LLM_HTTP_LIMITS),
+        httpx.AsyncClient(http2=_LLM_HTTP2, limits=_LLM_HTTP_LIMITS),
+    )
+
+
+async def close_llm_http_clients():
+    """Fecha os clientes HTTP compartilhados (chamar no shutdown da aplicação)"""
+    if get_llm_http_clients.cache_info().currsize:
+        http_client, http_async_client = get_llm_http_clients()
+        http_client.close()
+        await http_async_client.aclose()
+        get_llm_http_clients.cache_clear()
+
+
+# Mapeamento role -> classe de mensagem LangChain
+_MESSAGE_CLASSES = {
+    "user": HumanMessage,
+    "assistant": AIMessage,
+}
+
 
 class LangChainAgent:
     """
@@ -25,6 +57,8 @@ class LangChainAgent:
         self.llm = self._initialize_llm()
         self.prompt_manager = PromptManager()
         self.tools = get_available_tools()
+        # Sem tools o LLM é chamado diretamente; bind feito uma única vez
+        self._llm_with_tools = self.llm.bind_tools(self.tools) if self.tools else self.llm
         self.agent = self._create_agent()
     
     def _initialize_llm(self) -> ChatOpenAI:
@@ -32,24 +66,33 @@ class LangChainAgent:
         if not config.llm.openai_api_key:
             raise ValueError("OPENAI_API_KEY não configurada")
         
+        http_client, http_async_client = get_llm_http_clients()
         return ChatOpenAI(
             model=config.llm.model,
             temperature=config.llm.temperature,
             max_tokens=config.llm.max_tokens,
             openai_api_key=config.llm.openai_api_key,
-            streaming=False
+            streaming=False,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
     
     def _create_agent(self):
         """Cria o agente LangChain usando a nova API"""
         # Prompt do sistema
         system_prompt = self.prompt_manager.get_system_prompt()
+        self._system_message = SystemMessage(content=system_prompt)
+        
+        # Sem tools o grafo do agente só adiciona overhead: usar LLM direto
+        if not self.tools:
+            logger.info("Nenhuma tool disponível. Usando LLM direto, sem create_agent.")
+            return None
         
         try:
             # Criar agente usando a nova API do LangChain 1.1.0
             agent = create_agent(
                 model=self.llm,
-                tools=self.tools if self.tools else None,
+                tools=self.tools,
                 system_prompt=system_prompt,
                 debug=False
             )
@@ -86,35 +129,42 @@ class LangChainAgent:
             
             if conversation_history:
                 # Usar apenas as últimas mensagens (já vem limitado da memória)
-                for msg in conversation_history[-5:]:
-                    if msg["role"] == "user":
-                        chat_history.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "assistant":
-                        chat_history.append(AIMessage(content=msg["content"]))
+                message_classes = _MESSAGE_CLASSES
+                chat_history = [
+                    message_classes[msg["role"]](content=msg["content"])
+                    for msg in conversation_history[-5:]
+                    if msg["role"] in message_classes
+                ]
             
-            # Construir input com contexto completo
+            # Construir input com contexto completo (um único join ao final)
             context_parts = []
             
+            # Adicionar informações do usuário se disponíveis
+            client_name = metadata.get("name") if metadata else None
+            if client_name:
+                context_parts.append(f"[Cliente: {client_name}]")
+            
             # Adicionar sumário da conversa se disponível
             if conversation_summary:
                 context_parts.append(f"## Resumo da Conversa Anterior:\n{conversation_summary}\n")
             
             # Adicionar contexto de documentos RAG se disponível
+            # (fontes coletadas na mesma passada para o retorno)
+            sources = []
             if context_documents:
                 context_parts.append("## Informações Relevantes da Base de Conhecimento:")
                 for i, doc in enumerate(context_documents, 1):
                     context_parts.append(f"\n[{i}] {doc.get('content', '')}")
-                    if doc.get('source'):
-                        context_parts.append(f"Fonte: {doc['source']}")
-            
-            # Adicionar informações do usuário se disponíveis
-            if metadata:
-                if metadata.get("name"):
-                    context_parts.insert(0, f"[Cliente: {metadata['name']}]")
+                    source = doc.get('source')
+                    sources.append(source)
+                    if source:
+                        context_parts.append(f"Fonte: {source}")
             
             # Montar input final
             if context_parts:
-                input_with_context = "\n".join(context_parts) + "\n\n## Mensagem Atual do Cliente:\n" + user_message
+                context_parts.append("\n## Mensagem Atual do Cliente:")
+                context_parts.append(user_message)
+                input_with_context = "\n".join(context_parts)
             else:
                 input_with_context = user_message
             
@@ -138,9 +188,8 @@ class LangChainAgent:
                     # Extrair resposta das mensagens retornadas
                     if isinstance(result, dict):
                         if "messages" in result:
-                            # Pegar última mensagem do assistente
-                            last_message = result["messages"][-1]
-                            response = last_message.content if hasattr(last_message, 'content') else str(last_message)
+                            # Pegar última mensagem do assistente (sempre um BaseMessage)
+                            response = result["messages"][-1].content
                         elif "output" in result:
                             response = result["output"]
                         else:
@@ -148,30 +197,26 @@ class LangChainAgent:
                     else:
                         response = str(result)
                 else:
-                    # Fallback: usar LLM diretamente com tools
-                    if self.tools:
-                        # Bind tools ao LLM
-                        llm_with_tools = self.llm.bind_tools(self.tools)
-                        response_obj = await llm_with_tools.ainvoke(messages)
-                    else:
-                        response_obj = await self.llm.ainvoke(messages)
+                    # LLM diretamente (com tools, se houver); o prompt do sistema
+                    # entra como primeira mensagem, como faria o create_agent
+                    response_obj = await self._llm_with_tools.ainvoke([self._system_message, *messages])
                     
-                    response = response_obj.content if hasattr(response_obj, 'content') else str(response_obj)
+                    response = response_obj.content
                 
             except Exception as e:
                 logger.error(f"Erro ao executar agente: {e}", exc_info=True)
                 # Fallback final: usar LLM diretamente sem tools
                 try:
                     response_obj = await self.llm.ainvoke(messages)
-                    response = response_obj.content if hasattr(response_obj, 'content') else str(response_obj)
+                    response = response_obj.content
                 except Exception as e2:
                     logger.error(f"Erro ao usar LLM diretamente: {e2}")
                     response = "Desculpe, ocorreu um erro ao processar sua mensagem."
             
             return {
                 "response": response,
-                "sources": [doc.get("source") for doc in context_documents] if context_documents else [],
-                "timestamp": datetime.utcnow().isoformat(),
+                "sources": sources,
+                "timestamp": utc_now_iso(),
                 "agent_steps": []  # Nova API não retorna intermediate_steps da mesma forma
             }
             
@@ -180,6 +225,17 @@ class LangChainAgent:
             return {
                 "response": "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now_iso()
             }
 
+
+@lru_cache(maxsize=1)
+def get_langchain_agent() -> LangChainAgent:
+    """
+    Retorna o agente compartilhado pelo processo
+    
+    LLM, prompt e tools vêm da configuração global e o estado da conversa
+    é passado a cada chamada, então uma única instância (e um único grafo
+    do create_agent) atende todas as conversas.
+    """
+    return LangChainAgent()
@@ -1,17 +1,58 @@
 """
 LangChain Tools para os módulos do agente
 """
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 
 from src.config.config import config
+from src.modules.calendly.calendly_service import CalendlyService
+from src.modules.whatsapp.whatsapp_service import WhatsAppService
 
 logger = logging.getLogger(__name__)
 
+def _run_sync(coro) -> Any:
+    """
+    Executa a coroutine de uma tool a partir do caminho síncrono
+    
+    O agente usa ainvoke/_arun; isto só cobre chamadas legadas via invoke
+    fora de um event loop (asyncio.run). Com loop ativo a chamada é recusada:
+    bloquearia o loop e usaria os clientes HTTP compartilhados (presos ao
+    loop principal) em outro loop; use ainvoke.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("Tool chamada via invoke dentro de um event loop; use ainvoke")
+
+
+# Serviços compartilhados pelas tools (criados na primeira chamada)
+_calendly_service: Optional[CalendlyService] = None
+_whatsapp_service: Optional[WhatsAppService] = None
+
+
+def _get_calendly_service() -> CalendlyService:
+    """Obtém instância do serviço Calendly"""
+    global _calendly_service
+    if _calendly_service is None:
+        _calendly_service = CalendlyService()
+    return _calendly_service
+
+
+def _get_whatsapp_service() -> WhatsAppService:
+    """Obtém instância do serviço WhatsApp"""
+    global _whatsapp_service
+    if _whatsapp_service is None:
+        _whatsapp_service = WhatsAppService()
+    return _whatsapp_service
+
 
 class CalendlySearchInput(BaseModel):
     """Input para busca de horários no Calendly"""
@@ -55,9 +96,8 @@ class CalendlySearchTool(BaseTool):
     
     def _run(self, event_type_uri: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
         """Executa busca de horários (síncrono)"""
-        import asyncio
         try:
-            return asyncio.run(self._arun(event_type_uri, start_date, end_date))
+            return _run_sync(self._arun(event_type_uri, start_date, end_date))
         except Exception as e:
             logger.error(f"Erro ao buscar horários: {e}")
             return f"Erro ao buscar horários disponíveis: {str(e)}"
@@ -65,9 +105,7 @@ class CalendlySearchTool(BaseTool):
     async def _arun(self, event_type_uri: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
         """Versão assíncrona"""
         try:
-            from src.modules.calendly.calendly_service import CalendlyService
-            
-            calendly_service = CalendlyService()
+            calendly_service = _get_calendly_service()
             
             start_time = datetime.fromisoformat(start_date) if start_date else None
             end_time = datetime.fromisoformat(end_date) if end_date else None
@@ -113,9 +151,7 @@ class CalendlyCreateEventTool(BaseTool):
     ) -> str:
         """Cria evento no Calendly"""
         try:
-            from src.modules.calendly.calendly_service import CalendlyService
-            
-            calendly_service = CalendlyService()
+            calendly_service = _get_calendly_service()
             event_datetime = datetime.fromisoformat(start_time)
             
             event = await calendly_service.create_event(
@@ -135,9 +171,8 @@ class CalendlyCreateEventTool(BaseTool):
     
     def _run(self, *args, **kwargs) -> str:
         """Versão síncrona"""
-        import asyncio
         try:
-            return asyncio.run(self._arun(*args, **kwargs))
+            return _run_sync(self._arun(*args, **kwargs))
         except Exception as e:
             logger.error(f"Erro: {e}")
             return f"Erro: {str(e)}"
@@ -156,9 +191,7 @@ class WhatsAppSendMessageTool(BaseTool):
     async def _arun(self, phone_number: str, message: str) -> str:
         """Envia mensagem WhatsApp"""
         try:
-            from src.modules.whatsapp.whatsapp_service import WhatsAppService
-            
-            whatsapp_service = WhatsAppService()
+            whatsapp_service = _get_whatsapp_service()
             result = await whatsapp_service.send_text_message(
                 phone_number=phone_number,
                 message=message
@@ -172,9 +205,8 @@ class WhatsAppSendMessageTool(BaseTool):
     
     def _run(self, *args, **kwargs) -> str:
         """Versão síncrona"""
-        import asyncio
         try:
-            return asyncio.run(self._arun(*args, **kwargs))
+            return _run_sync(self._arun(*args, **kwargs))
         except Exception as e:
             logger.error(f"Erro: {e}")
             return f"Erro: {str(e)}"
@@ -184,14 +216,24 @@ def get_available_tools() -> List[BaseTool]:
     """
     Retorna lista de tools disponíveis baseado nos módulos ativos
     """
+    return list(_build_tools(config.agent.enable_agendamento))
+
+
+@lru_cache(maxsize=4)
+def _build_tools(enable_agendamento: bool) -> Tuple[BaseTool, ...]:
+    """Instancia as tools uma única vez por combinação de módulos ativos"""
     tools = []
     
-    if config.agent.enable_agendamento:
+    if enable_agendamento:
         tools.append(CalendlySearchTool())
         tools.append(CalendlyCreateEventTool())
     
     # WhatsApp tool pode ser usado mesmo sem módulo ativo (para respostas)
     # Mas vamos incluir apenas se necessário
     
-    return tools
+    return tuple(tools)
+
 
+# Pré-instancia as tools da configuração atual na importação (flags alteradas
+# depois, ex. via CLI em main.py, caem em outra entrada do cache)
+_build_tools(config.agent.enable_agendamento)
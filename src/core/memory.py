@@ -2,18 +2,153 @@
 Gerenciamento de memória e contexto das conversas com Redis
 Implementa memória com últimas 5 mensagens + sumário da conversa
 """
+import asyncio
 import logging
+import time
+from functools import lru_cache
 from typing import List, Dict, Optional, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from dataclasses import dataclass, asdict
 import json
 
+try:
+    import orjson  # Encode/decode mais rápido no caminho quente (opcional)
+except ImportError:
+    orjson = None
+
+import tiktoken
+from langchain_openai import ChatOpenAI
+
 from src.config.config import config
 from src.utils.redis_client import redis_client
-from src.core.langchain_agent import LangChainAgent
+from src.utils.ttl_cache import TTLCache
+from src.core.langchain_agent import get_llm_http_clients
 
 logger = logging.getLogger(__name__)
 
+# TTL das chaves de conversa/perfil (expiram após 90 dias de inatividade)
+CONVERSATION_TTL_SECONDS = 90 * 24 * 60 * 60
+
+# Sorted set user_id -> timestamp (unix) da última mensagem, para listar conversas recentes
+LAST_ACTIVITY_KEY = "conversations:last_activity"
+
+# Expiração do lock de sumário (libera mesmo se o processo morrer durante a geração)
+SUMMARY_LOCK_TIMEOUT_SECONDS = 120
+
+# Formato compacto das mensagens na lista Redis: prefixo de versão + array JSON
+# [role, content, timestamp_unix, channel, metadata]. Entradas antigas (objeto JSON
+# com ISO timestamp) continuam legíveis.
+MESSAGE_FORMAT_VERSION = "1"
+_COMPACT_JSON_SEPARATORS = (",", ":")
+
+# Caches locais (por processo) das leituras do Redis; invalidados nas escritas deste processo
+_LOCAL_CACHE_MAXSIZE = 10_000
+
+# Acima deste número de entradas a decodificação roda em thread, fora do event loop
+_DECODE_OFFLOAD_THRESHOLD = 32
+_MISSING = object()
+
+
+# Partes fixas do prompt de sumário
+_SUMMARY_INSTRUCTIONS = "\n".join([
+    "Você é um assistente que cria sumários concisos de conversas.",
+    "\n## Instruções:",
+    "- Crie um sumário objetivo e conciso da conversa",
+    "- Destaque pontos principais, decisões tomadas e informações importantes",
+    "- Mantenha o sumário em português brasileiro",
+    "- Se houver sumário anterior, incorpore as novas informações",
+])
+_SUMMARY_HEADER = f"{_SUMMARY_INSTRUCTIONS}\n\n## Conversa:"
+_SUMMARY_FOOTER = "\n\nCrie um sumário atualizado desta conversa:"
+
+
+@lru_cache(maxsize=4)
+def _get_token_encoding(model: str) -> Optional["tiktoken.Encoding"]:
+    """Tokenizer do modelo (cacheado); None se indisponível"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Modelo desconhecido pelo tiktoken: usar encoding dos modelos atuais
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer indisponível para {model}: {e}. Estimando tokens por caracteres.")
+        return None
+
+
+def _count_tokens(text: str, model: str) -> int:
+    """Conta tokens do texto (estimativa de ~4 caracteres/token sem tokenizer)"""
+    encoding = _get_token_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _json_dumps(value: Any) -> str:
+    """Serializa JSON compacto (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=_COMPACT_JSON_SEPARATORS, ensure_ascii=False)
+
+
+def _json_loads(data: str) -> Any:
+    """Desserializa JSON (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _pack_message(
+    role: str,
+    content: str,
+    timestamp: float,
+    channel: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> str:
+    """Serializa mensagem no formato compacto versionado (timestamp em epoch UTC, segundos)"""
+    return MESSAGE_FORMAT_VERSION + _json_dumps([role, content, timestamp, channel, metadata or {}])
+
+
+def _unpack_message(data: str) -> Dict[str, Any]:
+    """
+    Desserializa entrada da lista Redis para dicionário com timestamp em epoch
+    
+    Sem datetime no caminho de leitura; entradas legadas (objeto JSON com ISO
+    timestamp) são convertidas.
+    """
+    if data.startswith("{"):
+        msg_dict = _json_loads(data)
+        timestamp = datetime.fromisoformat(msg_dict["timestamp"]).replace(tzinfo=timezone.utc).timestamp()
+        return {
+            "role": msg_dict["role"],
+            "content": msg_dict["content"],
+            "timestamp": timestamp,
+            "channel": msg_dict["channel"],
+            "metadata": msg_dict.get("metadata")
+        }
+    if not data.startswith(MESSAGE_FORMAT_VERSION):
+        raise ValueError(f"Formato de mensagem desconhecido: {data[:1]!r}")
+    role, content, timestamp, channel, metadata = _json_loads(data[len(MESSAGE_FORMAT_VERSION):])
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        "channel": channel,
+        "metadata": metadata
+    }
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    """Converte timestamp (epoch UTC ou ISO) para datetime UTC sem tzinfo"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    return datetime.fromisoformat(value)
+
+
+def _with_iso_timestamp(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Cópia da mensagem com timestamp em ISO (UTC sem tzinfo), formato exposto pela API pública"""
+    return {**message, "timestamp": _parse_timestamp(message["timestamp"]).isoformat()}
+
 
 @dataclass
 class Message:
@@ -34,18 +169,37 @@ class Message:
             "metadata": self.metadata or {}
         }
     
+    def to_redis(self) -> str:
+        """Serializa no formato compacto versionado usado na lista Redis"""
+        # timestamp é UTC sem tzinfo (datetime.utcnow)
+        timestamp = self.timestamp.replace(tzinfo=timezone.utc).timestamp()
+        return _pack_message(self.role, self.content, timestamp, self.channel, self.metadata)
+    
+    @classmethod
+    def from_redis(cls, data: str) -> "Message":
+        """Desserializa entrada da lista Redis (formato compacto ou JSON legado)"""
+        return cls.from_dict(_unpack_message(data))
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Message":
         """Cria Message a partir de dicionário"""
         return cls(
             role=data["role"],
             content=data["content"],
-            timestamp=datetime.fromisoformat(data["timestamp"]),
+            timestamp=_parse_timestamp(data["timestamp"]),
             channel=data["channel"],
             metadata=data.get("metadata")
         )
 
 
+@dataclass
+class TurnState:
+    """Estado da conversa lido uma única vez por turno"""
+    messages: List[Dict[str, Any]]  # Ordem cronológica (mais antigas primeiro); timestamp em epoch UTC
+    summary: Optional[str]
+    message_count: int  # Total de mensagens já registradas para o usuário
+
+
 class ConversationMemory:
     """
     Gerencia a memória de conversas dos usuários usando Redis
@@ -57,7 +211,14 @@ class ConversationMemory:
         self.recent_count = config.agent.recent_messages_count
         self.enable_summary = config.agent.enable_conversation_summary
         self.summary_threshold = config.agent.summary_update_threshold
-        self._summary_agent: Optional[LangChainAgent] = None
+        self.summary_max_input_tokens = config.agent.summary_max_input_tokens
+        self._summary_llm: Optional[ChatOpenAI] = None
+        # Sumários rodam em background com concorrência limitada (um pendente por usuário)
+        self._summary_semaphore = asyncio.Semaphore(config.agent.summary_max_concurrency)
+        self._pending_summaries: Dict[str, asyncio.Task] = {}
+        # user_id -> sumário (o histórico não tem cache local: mensagens gravadas
+        # por outro worker precisam aparecer já no turno seguinte)
+        self._summary_cache = TTLCache(_LOCAL_CACHE_MAXSIZE, config.agent.summary_cache_ttl)
     
     async def initialize(self):
         """Inicializa conexão Redis"""
@@ -70,8 +231,25 @@ class ConversationMemory:
             if not hasattr(self, '_fallback_storage'):
                 self._fallback_storage = {}
     
+    def _get_summary_llm(self) -> ChatOpenAI:
+        """LLM usado para sumários (criado na primeira atualização e reutilizado)"""
+        if self._summary_llm is None:
+            http_client, http_async_client = get_llm_http_clients()
+            self._summary_llm = ChatOpenAI(
+                model=config.llm.model,
+                temperature=0.3,  # Temperatura baixa para sumários mais consistentes
+                openai_api_key=config.llm.openai_api_key,
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
+        return self._summary_llm
+    
     def _get_conversation_key(self, user_id: str) -> str:
-        """Chave Redis para histórico de mensagens"""
+        """Chave Redis para histórico de mensagens (ordem cronológica: RPUSH)"""
+        return f"conversation:{user_id}:history"
+    
+    def _get_legacy_conversation_key(self, user_id: str) -> str:
+        """Chave Redis antiga do histórico (mais recentes primeiro: LPUSH)"""
         return f"conversation:{user_id}:messages"
     
     def _get_summary_key(self, user_id: str) -> str:
@@ -82,6 +260,10 @@ class ConversationMemory:
         """Chave Redis para perfil do usuário"""
         return f"user:{user_id}:profile"
     
+    def _get_summary_lock_key(self, user_id: str) -> str:
+        """Chave Redis do lock de geração de sumário"""
+        return f"summary_lock:{user_id}"
+    
     def _get_message_count_key(self, user_id: str) -> str:
         """Chave Redis para contador de mensagens"""
         return f"conversation:{user_id}:count"
@@ -100,35 +282,28 @@ class ConversationMemory:
         """
         await self.initialize()
         
-        message = Message(
-            role=role,
-            content=content,
-            timestamp=datetime.utcnow(),
-            channel=channel,
-            metadata=metadata
-        )
+        now = time.time()
         
         # Adicionar mensagem à lista Redis (mantém apenas últimas N)
         key = self._get_conversation_key(user_id)
-        message_data = json.dumps(message.to_dict())
-        
-        # Adicionar no início da lista
-        await self.redis.client.lpush(key, message_data)
-        
-        # Manter apenas as últimas N mensagens
-        await self.redis.client.ltrim(key, 0, self.recent_count - 1)
-        
-        # Definir TTL (expira após 90 dias de inatividade)
-        await self.redis.client.expire(key, 90 * 24 * 60 * 60)
-        
-        # Incrementar contador de mensagens
         count_key = self._get_message_count_key(user_id)
-        message_count = await self.redis.client.incr(count_key)
-        await self.redis.client.expire(count_key, 90 * 24 * 60 * 60)
-        
-        # Atualizar sumário se necessário
+        message_data = _pack_message(role, content, now, channel, metadata)
+        
+        # Todos os comandos em um único round-trip (MULTI/EXEC)
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, message_data)  # Adicionar no fim da lista (ordem cronológica)
+            pipe.ltrim(key, -self.recent_count, -1)  # Manter apenas as últimas N mensagens
+            pipe.expire(key, CONVERSATION_TTL_SECONDS)
+            pipe.incr(count_key)  # Incrementar contador de mensagens
+            pipe.expire(count_key, CONVERSATION_TTL_SECONDS)
+            # Índice de atividade (entradas mais antigas que o TTL são descartadas)
+            pipe.zadd(LAST_ACTIVITY_KEY, {user_id: now})
+            pipe.zremrangebyscore(LAST_ACTIVITY_KEY, "-inf", now - CONVERSATION_TTL_SECONDS)
+            message_count = (await pipe.execute())[3]
+        
+        # Atualizar sumário se necessário (fora do caminho da resposta)
         if self.enable_summary and message_count % self.summary_threshold == 0:
-            await self._update_summary(user_id)
+            self._schedule_summary_update(user_id)
         
         logger.debug(f"Mensagem adicionada para {user_id}. Total: {message_count}")
     
@@ -146,41 +321,52 @@ class ConversationMemory:
             max_turns: Número máximo de turnos a retornar (padrão: recent_count)
             
         Returns:
-            Lista de mensagens formatadas (mais recentes primeiro)
+            Lista de mensagens formatadas (ordem cronológica, mais antigas
+            primeiro; timestamp em ISO UTC)
         """
-        await self.initialize()
-        
-        max_turns = max_turns or self.recent_count
-        
-        # Verificar se Redis está disponível
-        if self.redis._client:
+        # Mesma leitura do estado do turno; epoch fica restrito ao TurnState interno
+        state = await self.get_turn_state(user_id, max_turns)
+        return [_with_iso_timestamp(m) for m in state.messages]
+    
+    def _parse_messages(self, messages_data: List[str]) -> List[Dict[str, Any]]:
+        """Converte mensagens do Redis (já em ordem cronológica) para dicionários"""
+        messages = []
+        for msg_data in messages_data:
             try:
-                key = self._get_conversation_key(user_id)
-                # Obter mensagens do Redis
-                messages_data = await self.redis.client.lrange(key, 0, max_turns - 1)
-                
-                messages = []
-                for msg_data in messages_data:
-                    try:
-                        msg_dict = json.loads(msg_data)
-                        messages.append({
-                            "role": msg_dict["role"],
-                            "content": msg_dict["content"],
-                            "timestamp": msg_dict["timestamp"],
-                            "channel": msg_dict["channel"]
-                        })
-                    except Exception as e:
-                        logger.error(f"Erro ao parsear mensagem: {e}")
-                
-                # Inverter para ordem cronológica (mais antigas primeiro)
-                messages.reverse()
-                return messages
+                message = _unpack_message(msg_data)
+                del message["metadata"]
+                messages.append(message)
             except Exception as e:
-                logger.error(f"Erro ao buscar mensagens do Redis: {e}. Usando fallback.")
-                return self._get_from_fallback(user_id, max_turns)
-        else:
-            # Modo fallback
-            return self._get_from_fallback(user_id, max_turns)
+                logger.error(f"Erro ao parsear mensagem: {e}")
+        
+        return messages
+    
+    async def _migrate_legacy_history(self, user_id: str, max_turns: int) -> List[str]:
+        """
+        Move o histórico da chave antiga (LPUSH) para a chave cronológica
+        
+        LPUSH dos itens na ordem antiga (mais recentes primeiro) os insere em
+        ordem cronológica antes de mensagens gravadas concorrentemente.
+        
+        Returns:
+            Últimas max_turns entradas, em ordem cronológica
+        """
+        legacy_key = self._get_legacy_conversation_key(user_id)
+        legacy_data = await self.redis.client.lrange(legacy_key, 0, -1)
+        if not legacy_data:
+            return []
+        
+        key = self._get_conversation_key(user_id)
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.lpush(key, *legacy_data)
+            pipe.ltrim(key, -self.recent_count, -1)
+            pipe.expire(key, CONVERSATION_TTL_SECONDS)
+            pipe.delete(legacy_key)
+            pipe.lrange(key, -max_turns, -1)
+            results = await pipe.execute()
+        
+        logger.info(f"Histórico de {user_id} migrado para ordem cronológica ({len(legacy_data)} mensagens)")
+        return results[-1]
     
     def _get_from_fallback(self, user_id: str, max_turns: int) -> List[Dict[str, Any]]:
         """Obtém mensagens do fallback"""
@@ -188,6 +374,52 @@ class ConversationMemory:
             return self._fallback_storage[user_id][-max_turns:]
         return []
     
+    async def get_turn_state(
+        self,
+        user_id: str,
+        max_turns: Optional[int] = None
+    ) -> TurnState:
+        """
+        Lê mensagens recentes, sumário e contador em um único round-trip
+        
+        Args:
+            user_id: ID do usuário
+            max_turns: Número máximo de mensagens a retornar (padrão: recent_count)
+        """
+        max_turns = max_turns or self.recent_count
+        
+        await self.initialize()
+        
+        if self.redis._client:
+            try:
+                async with self.redis.client.pipeline(transaction=False) as pipe:
+                    pipe.lrange(self._get_conversation_key(user_id), -max_turns, -1)
+                    pipe.get(self._get_summary_key(user_id))
+                    pipe.get(self._get_message_count_key(user_id))
+                    messages_data, summary, count = await pipe.execute()
+                
+                if not messages_data and count:
+                    # Conversa anterior ao formato cronológico: migrar uma vez
+                    messages_data = await self._migrate_legacy_history(user_id, max_turns)
+                
+                if len(messages_data) > _DECODE_OFFLOAD_THRESHOLD:
+                    messages = await asyncio.to_thread(self._parse_messages, messages_data)
+                else:
+                    messages = self._parse_messages(messages_data)
+                
+                state = TurnState(
+                    messages=messages,
+                    summary=summary or None,
+                    message_count=int(count or 0)
+                )
+                # O sumário não vai para _summary_cache: pode ser regerado em outro worker
+                return state
+            except Exception as e:
+                logger.error(f"Erro ao buscar estado da conversa no Redis: {e}. Usando fallback.")
+        
+        messages = self._get_from_fallback(user_id, max_turns)
+        return TurnState(messages=messages, summary=None, message_count=len(messages))
+    
     async def get_conversation_context(
         self,
         user_id: str
@@ -198,25 +430,29 @@ class ConversationMemory:
         - Sumário da conversa (se disponível)
         
         Returns:
-            Dict com messages e summary
+            Dict com messages (ordem cronológica, timestamp em ISO UTC) e summary
         """
-        messages = await self.get_conversation_history(user_id)
-        summary = await self.get_summary(user_id)
+        state = await self.get_turn_state(user_id)
         
         return {
-            "messages": messages,
-            "summary": summary,
-            "message_count": len(messages)
+            "messages": [_with_iso_timestamp(m) for m in state.messages],
+            "summary": state.summary,
+            "message_count": len(state.messages)
         }
     
     async def get_summary(self, user_id: str) -> Optional[str]:
         """Retorna sumário da conversa"""
+        summary = self._summary_cache.get(user_id, _MISSING)
+        if summary is not _MISSING:
+            return summary
+        
         await self.initialize()
         
         if self.redis._client:
             try:
                 summary_key = self._get_summary_key(user_id)
-                summary = await self.redis.client.get(summary_key)
+                summary = await self.redis.client.get(summary_key) or None
+                self._summary_cache.set(user_id, summary)
                 if summary:
                     return summary
             except Exception as e:
@@ -224,6 +460,44 @@ class ConversationMemory:
         
         return None
     
+    def _schedule_summary_update(self, user_id: str):
+        """Agenda atualização do sumário em background (ignora se já houver uma pendente)"""
+        if user_id in self._pending_summaries:
+            return
+        task = asyncio.create_task(self._run_summary_update(user_id))
+        self._pending_summaries[user_id] = task
+        task.add_done_callback(lambda _: self._pending_summaries.pop(user_id, None))
+    
+    async def _run_summary_update(self, user_id: str):
+        """
+        Gera o sumário respeitando o limite de concorrência
+        
+        Um lock no Redis (SET NX com expiração) evita que outro processo
+        gere o mesmo sumário ao mesmo tempo.
+        """
+        async with self._summary_semaphore:
+            try:
+                lock = self.redis.client.lock(
+                    self._get_summary_lock_key(user_id),
+                    timeout=SUMMARY_LOCK_TIMEOUT_SECONDS,
+                    blocking=False
+                )
+                if not await lock.acquire():
+                    logger.debug(f"Sumário de {user_id} já em geração em outro processo")
+                    return
+            except Exception as e:
+                logger.error(f"Erro ao obter lock de sumário para {user_id}: {e}")
+                return
+            
+            try:
+                await self._update_summary(user_id)
+            finally:
+                try:
+                    await lock.release()
+                except Exception as e:
+                    # Lock expirado (sumário mais lento que o timeout) ou Redis indisponível
+                    logger.warning(f"Erro ao liberar lock de sumário para {user_id}: {e}")
+    
     async def _update_summary(self, user_id: str):
         """
         Atualiza sumário da conversa usando LLM
@@ -231,74 +505,73 @@ class ConversationMemory:
         try:
             await self.initialize()
             
-            # Obter todas as mensagens recentes
-            all_messages = await self.get_conversation_history(user_id, max_turns=50)
+            # Obter mensagens recentes e sumário anterior (um único round-trip)
+            state = await self.get_turn_state(user_id, max_turns=50)
             
-            if len(all_messages) < 5:
+            if len(state.messages) < 5:
                 # Muito poucas mensagens, não precisa de sumário
                 return
             
-            # Obter sumário anterior
-            previous_summary = await self.get_summary(user_id)
-            
-            # Criar prompt para sumário
-            summary_prompt = self._create_summary_prompt(all_messages, previous_summary)
-            
-            # Gerar sumário usando LLM
-            if not self._summary_agent:
-                from src.core.langchain_agent import LangChainAgent
-                self._summary_agent = LangChainAgent()
+            # Criar prompt para sumário (mensagens limitadas pelo orçamento de tokens)
+            messages = self._trim_messages_to_token_budget(state.messages)
+            summary_prompt = self._create_summary_prompt(messages, state.summary)
             
-            # Usar LLM diretamente para gerar sumário
-            from langchain_openai import ChatOpenAI
-            llm = ChatOpenAI(
-                model=config.llm.model,
-                temperature=0.3,  # Temperatura baixa para sumários mais consistentes
-                openai_api_key=config.llm.openai_api_key
-            )
-            
-            response = await llm.ainvoke(summary_prompt)
-            new_summary = response.content if hasattr(response, 'content') else str(response)
+            # Gerar sumário usando LLM diretamente
+            response = await self._get_summary_llm().ainvoke(summary_prompt)
+            new_summary = response.content
             
             # Salvar sumário no Redis
             summary_key = self._get_summary_key(user_id)
-            await self.redis.client.set(summary_key, new_summary)
-            await self.redis.client.expire(summary_key, 90 * 24 * 60 * 60)
+            await self.redis.client.set(summary_key, new_summary, ex=CONVERSATION_TTL_SECONDS)
+            self._summary_cache.set(user_id, new_summary)
             
             logger.info(f"Sumário atualizado para {user_id}")
             
         except Exception as e:
             logger.error(f"Erro ao atualizar sumário: {e}")
     
+    def _trim_messages_to_token_budget(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Mantém as mensagens mais recentes que cabem em summary_max_input_tokens
+        
+        A mais recente é sempre incluída; a ordem cronológica é preservada.
+        """
+        budget = self.summary_max_input_tokens
+        selected = []
+        used = 0
+        for msg in reversed(messages):
+            tokens = _count_tokens(msg["content"], config.llm.model)
+            if selected and used + tokens > budget:
+                break
+            selected.append(msg)
+            used += tokens
+        
+        if len(selected) < len(messages):
+            logger.debug(f"Sumário: {len(messages) - len(selected)} mensagens antigas fora do orçamento de {budget} tokens")
+        
+        selected.reverse()
+        return selected
+    
     def _create_summary_prompt(
         self,
         messages: List[Dict[str, Any]],
         previous_summary: Optional[str] = None
     ) -> str:
         """Cria prompt para gerar sumário da conversa"""
-        prompt_parts = []
-        
-        prompt_parts.append("Você é um assistente que cria sumários concisos de conversas.")
-        prompt_parts.append("\n## Instruções:")
-        prompt_parts.append("- Crie um sumário objetivo e conciso da conversa")
-        prompt_parts.append("- Destaque pontos principais, decisões tomadas e informações importantes")
-        prompt_parts.append("- Mantenha o sumário em português brasileiro")
-        prompt_parts.append("- Se houver sumário anterior, incorpore as novas informações")
-        
         if previous_summary:
-            prompt_parts.append(f"\n## Sumário Anterior:\n{previous_summary}")
-            prompt_parts.append("\n## Novas Mensagens:")
+            header = f"{_SUMMARY_INSTRUCTIONS}\n\n## Sumário Anterior:\n{previous_summary}\n\n## Novas Mensagens:"
         else:
-            prompt_parts.append("\n## Conversa:")
-        
-        # Adicionar mensagens
-        for msg in messages:
-            role_name = "Cliente" if msg["role"] == "user" else "Assistente"
-            prompt_parts.append(f"\n{role_name}: {msg['content']}")
-        
-        prompt_parts.append("\n\nCrie um sumário atualizado desta conversa:")
-        
-        return "\n".join(prompt_parts)
+            header = _SUMMARY_HEADER
+        
+        # Cabeçalho + uma linha por mensagem + rodapé em um único join
+        return "\n".join([
+            header,
+            *(
+                f"\n{'Cliente' if msg['role'] == 'user' else 'Assistente'}: {msg['content']}"
+                for msg in messages
+            ),
+            _SUMMARY_FOOTER
+        ])
     
     async def get_user_profile(self, user_id: str) -> Dict[str, Any]:
         """Retorna o perfil do usuário"""
@@ -319,10 +592,14 @@ class ConversationMemory:
         
         profile_key = self._get_profile_key(user_id)
         
-        for key, value in data.items():
-            await self.redis.hset(profile_key, key, value)
-        
-        await self.redis.client.expire(profile_key, 90 * 24 * 60 * 60)
+        # Todos os campos em um único HSET + EXPIRE no mesmo round-trip
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            if data:
+                pipe.hset(profile_key, mapping={
+                    key: json.dumps(value, default=str) for key, value in data.items()
+                })
+            pipe.expire(profile_key, CONVERSATION_TTL_SECONDS)
+            await pipe.execute()
     
     async def clear_conversation(self, user_id: str):
         """Limpa o histórico de conversa de um usuário"""
@@ -330,12 +607,16 @@ class ConversationMemory:
         
         keys_to_delete = [
             self._get_conversation_key(user_id),
+            self._get_legacy_conversation_key(user_id),
             self._get_summary_key(user_id),
             self._get_message_count_key(user_id)
         ]
         
-        for key in keys_to_delete:
-            await self.redis.client.delete(key)
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys_to_delete)
+            pipe.zrem(LAST_ACTIVITY_KEY, user_id)
+            await pipe.execute()
+        self._summary_cache.pop(user_id)
         
         logger.info(f"Conversa limpa para {user_id}")
     
@@ -348,33 +629,37 @@ class ConversationMemory:
         """
         await self.initialize()
         
-        # Buscar todas as chaves de conversação
-        pattern = "conversation:*:messages"
-        keys = []
-        async for key in self.redis.client.scan_iter(match=pattern):
-            keys.append(key)
-        
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        # Usuários com atividade no período (um único ZRANGEBYSCORE)
+        cutoff = time.time() - hours * 60 * 60
+        user_ids = await self.redis.client.zrangebyscore(LAST_ACTIVITY_KEY, cutoff, "+inf")
+        if not user_ids:
+            return {}
+        
+        # Históricos de todos os usuários em um único round-trip
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.lrange(self._get_conversation_key(user_id), -self.recent_count, -1)
+            histories = await pipe.execute()
+        
+        if sum(len(messages_data) for messages_data in histories) > _DECODE_OFFLOAD_THRESHOLD:
+            return await asyncio.to_thread(self._build_recent_conversations, user_ids, histories)
+        return self._build_recent_conversations(user_ids, histories)
+    
+    def _build_recent_conversations(
+        self,
+        user_ids: List[str],
+        histories: List[List[str]]
+    ) -> Dict[str, List[Message]]:
+        """Decodifica históricos em Message (CPU-bound; pode rodar em thread)"""
         recent = {}
-        
-        for key in keys:
-            # Extrair user_id da chave
-            user_id = key.split(":")[1]
-            
-            # Obter última mensagem
-            last_msg_data = await self.redis.client.lindex(key, 0)
-            if last_msg_data:
-                try:
-                    msg_dict = json.loads(last_msg_data)
-                    msg_time = datetime.fromisoformat(msg_dict["timestamp"])
-                    
-                    if msg_time >= cutoff:
-                        messages = await self.get_conversation_history(user_id)
-                        if messages:
-                            recent[user_id] = [
-                                Message.from_dict(m) for m in messages
-                            ]
-                except Exception as e:
-                    logger.error(f"Erro ao processar conversa {user_id}: {e}")
+        for user_id, messages_data in zip(user_ids, histories):
+            try:
+                messages = self._parse_messages(messages_data)
+                if messages:
+                    recent[user_id] = [
+                        Message.from_dict(m) for m in messages
+                    ]
+            except Exception as e:
+                logger.error(f"Erro ao processar conversa {user_id}: {e}")
         
         return recent
@@ -3,16 +3,22 @@ Orquestrador principal do agente IA
 Gerencia o fluxo de conversação e coordena os módulos
 Usa LangChain para processamento de mensagens
 """
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import Dict, List, Optional, Any, Set
 
 from src.config.config import config
-from src.core.memory import ConversationMemory
-from src.core.langchain_agent import LangChainAgent
+from src.core.memory import ConversationMemory, TurnState
+from src.core.langchain_agent import LangChainAgent, get_langchain_agent
+from src.modules.rag.rag_service import RAGService, get_rag_service
+from src.utils.datetime_utils import utc_now_iso
 
 logger = logging.getLogger(__name__)
 
+# Limites de concorrência por processo (evita estourar rate limit do provedor e pools HTTP/DB)
+LLM_SEMAPHORE = asyncio.Semaphore(config.llm.max_concurrency)
+RAG_SEMAPHORE = asyncio.Semaphore(config.rag.max_concurrency)
+
 
 class AgentOrchestrator:
     """
@@ -22,7 +28,9 @@ class AgentOrchestrator:
     
     def __init__(self):
         self.memory = ConversationMemory()
-        self.langchain_agent = LangChainAgent()
+        self.langchain_agent: LangChainAgent = get_langchain_agent()
+        # Escritas de memória em andamento (referência forte até concluírem)
+        self._background_tasks: Set[asyncio.Task] = set()
         self.active_modules: Dict[str, bool] = {
             "agendamento": config.agent.enable_agendamento,
             "followup": config.agent.enable_followup,
@@ -31,6 +39,89 @@ class AgentOrchestrator:
             "transbordo_humano": config.agent.enable_transbordo_humano,
         }
     
+    def _get_rag_service(self) -> RAGService:
+        """Obtém serviço RAG (instância única do processo, compartilhada com a API)"""
+        return get_rag_service()
+    
+    async def _load_turn_state(self, user_id: str) -> TurnState:
+        """Recupera estado da conversa (últimas 5 mensagens + sumário); vazio se o Redis falhar"""
+        try:
+            return await self.memory.get_turn_state(user_id)
+        except Exception as mem_error:
+            logger.warning(f"Erro ao recuperar contexto do Redis: {mem_error}. Continuando sem histórico.")
+            return TurnState(messages=[], summary=None, message_count=0)
+    
+    async def _search_knowledge(
+        self,
+        user_message: str,
+        rag_metadata_filter: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Busca informações relevantes se módulo RAG estiver ativo"""
+        if not self.active_modules.get("knowledge"):
+            return []
+        
+        rag_service = self._get_rag_service()
+        # Usar threshold mais baixo (0.1) para melhor recall quando usado pelo agente
+        # Isso permite encontrar mais documentos relevantes mesmo com similaridade menor
+        async with RAG_SEMAPHORE:
+            context_documents = await rag_service.search(
+                query=user_message,
+                top_k=config.rag.top_k,
+                similarity_threshold=0.1,  # Threshold mais baixo para melhor recall
+                metadata_filter=rag_metadata_filter
+            )
+        logger.info(f"RAG encontrou {len(context_documents)} documentos relevantes para: {user_message}")
+        return context_documents
+    
+    async def _save_message(
+        self,
+        user_id: str,
+        role: str,
+        content: str,
+        channel: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        """Salva mensagem na memória (Redis) - continua mesmo se falhar"""
+        try:
+            await self.memory.add_message(
+                user_id=user_id,
+                role=role,
+                content=content,
+                channel=channel,
+                metadata=metadata
+            )
+        except Exception as mem_error:
+            who = "do usuário" if role == "user" else "do assistente"
+            logger.warning(f"Erro ao salvar mensagem {who} no Redis: {mem_error}. Continuando sem memória.")
+    
+    async def _save_reply(
+        self,
+        user_save_task: asyncio.Task,
+        user_id: str,
+        response: str,
+        channel: str
+    ):
+        """Salva a resposta do assistente após a mensagem do usuário (preserva a ordem no Redis)"""
+        await user_save_task
+        await self._save_message(
+            user_id=user_id,
+            role="assistant",
+            content=response,
+            channel=channel
+        )
+    
+    def _run_in_background(self, coro) -> asyncio.Task:
+        """Executa coroutine em background mantendo referência até concluir"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    async def drain_background_tasks(self):
+        """Aguarda escritas de memória pendentes (chamar no shutdown da aplicação)"""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+    
     async def process_message(
         self,
         user_message: str,
@@ -54,68 +145,41 @@ class AgentOrchestrator:
             Dict com a resposta do agente e metadados
         """
         try:
-            # Recuperar contexto completo da conversa (últimas 5 mensagens + sumário)
-            try:
-                conversation_context = await self.memory.get_conversation_context(user_id)
-                conversation_history = conversation_context.get("messages", [])
-                conversation_summary = conversation_context.get("summary")
-            except Exception as mem_error:
-                logger.warning(f"Erro ao recuperar contexto do Redis: {mem_error}. Continuando sem histórico.")
-                conversation_history = []
-                conversation_summary = None
-            
-            # Buscar informações relevantes se módulo RAG estiver ativo
-            context_documents = []
-            if self.active_modules.get("knowledge"):
-                from src.modules.rag.rag_service import RAGService
-                rag_service = RAGService()
-                # Usar threshold mais baixo (0.1) para melhor recall quando usado pelo agente
-                # Isso permite encontrar mais documentos relevantes mesmo com similaridade menor
-                context_documents = await rag_service.search(
-                    query=user_message,
-                    top_k=config.rag.top_k,
-                    similarity_threshold=0.1,  # Threshold mais baixo para melhor recall
-                    metadata_filter=rag_metadata_filter
-                )
-                logger.info(f"RAG encontrou {len(context_documents)} documentos relevantes para: {user_message}")
-            
-            # Processar mensagem usando LangChain Agent
-            result = await self.langchain_agent.process_message(
-                user_message=user_message,
-                conversation_history=conversation_history,
-                conversation_summary=conversation_summary,
-                context_documents=context_documents,
-                metadata=metadata
+            # Contexto da conversa (Redis) e busca RAG são independentes: rodar em paralelo
+            turn_state, context_documents = await asyncio.gather(
+                self._load_turn_state(user_id),
+                self._search_knowledge(user_message, rag_metadata_filter)
             )
             
-            response = result.get("response", "")
+            # Salvar mensagem do usuário enquanto o LLM processa
+            # (o contexto já foi lido, então ela não aparece duplicada no histórico)
+            user_save_task = self._run_in_background(self._save_message(
+                user_id=user_id,
+                role="user",
+                content=user_message,
+                channel=channel,
+                metadata=metadata
+            ))
             
-            # Salvar na memória (Redis) - continuar mesmo se falhar
-            try:
-                await self.memory.add_message(
-                    user_id=user_id,
-                    role="user",
-                    content=user_message,
-                    channel=channel,
+            # Processar mensagem usando LangChain Agent
+            async with LLM_SEMAPHORE:
+                result = await self.langchain_agent.process_message(
+                    user_message=user_message,
+                    conversation_history=turn_state.messages,
+                    conversation_summary=turn_state.summary,
+                    context_documents=context_documents,
                     metadata=metadata
                 )
-            except Exception as mem_error:
-                logger.warning(f"Erro ao salvar mensagem do usuário no Redis: {mem_error}. Continuando sem memória.")
             
-            try:
-                await self.memory.add_message(
-                    user_id=user_id,
-                    role="assistant",
-                    content=response,
-                    channel=channel
-                )
-            except Exception as mem_error:
-                logger.warning(f"Erro ao salvar resposta do assistente no Redis: {mem_error}. Continuando sem memória.")
+            response = result.get("response", "")
+            
+            # Resposta é persistida em background, sem atrasar o retorno ao usuário
+            self._run_in_background(self._save_reply(user_save_task, user_id, response, channel))
             
             return {
                 "response": response,
                 "sources": result.get("sources", []),
-                "timestamp": result.get("timestamp", datetime.utcnow().isoformat()),
+                "timestamp": result.get("timestamp") or utc_now_iso(),
                 "agent_steps": result.get("agent_steps", [])
             }
             
@@ -124,7 +188,7 @@ class AgentOrchestrator:
             return {
                 "response": "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now_iso()
             }
     
 
@@ -3,6 +3,7 @@ Gerenciador de prompts do sistema
 Carrega e gerencia o prompt fixo e instruções extras
 """
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -11,6 +12,27 @@ from src.config.config import config
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4)
+def _read_prompt_file_cached(path: Path, mtime_ns: int) -> str:
+    """Lê arquivo de prompt uma única vez por (caminho, mtime)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _read_prompt_file(path: Path) -> Optional[str]:
+    """
+    Retorna conteúdo do arquivo de prompt (None se não existir)
+    
+    Só um stat por chamada: o conteúdo vem do cache enquanto o arquivo não
+    for modificado (edições externas são detectadas pelo mtime).
+    """
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _read_prompt_file_cached(path, mtime_ns)
+
+
 class PromptManager:
     """
     Gerencia prompts do sistema e instruções extras
@@ -24,9 +46,9 @@ class PromptManager:
     def _load_system_prompt(self):
         """Carrega o prompt fixo do sistema"""
         try:
-            if self.system_prompt_path.exists():
-                with open(self.system_prompt_path, "r", encoding="utf-8") as f:
-                    self._system_prompt = f.read()
+            prompt = _read_prompt_file(self.system_prompt_path)
+            if prompt is not None:
+                self._system_prompt = prompt
             else:
                 logger.warning(f"Arquivo de prompt não encontrado: {self.system_prompt_path}")
                 self._system_prompt = self._get_default_prompt()
@@ -34,6 +56,11 @@ class PromptManager:
             logger.error(f"Erro ao carregar prompt do sistema: {e}")
             self._system_prompt = self._get_default_prompt()
     
+    def reload(self):
+        """Descarta o prompt em cache e relê o arquivo"""
+        _read_prompt_file_cached.cache_clear()
+        self._load_system_prompt()
+    
     def get_system_prompt(self) -> str:
         """Retorna o prompt fixo do sistema"""
         if not self._system_prompt:
@@ -47,6 +74,7 @@ class PromptManager:
         try:
             with open(self.system_prompt_path, "w", encoding="utf-8") as f:
                 f.write(new_prompt)
+            _read_prompt_file_cached.cache_clear()
             self._system_prompt = new_prompt
             logger.info("Prompt do sistema atualizado com sucesso")
         except Exception as e:
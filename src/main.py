@@ -4,11 +4,12 @@ Ponto de entrada principal do Agente IA Multicanal
 import asyncio
 import logging
 import argparse
+import os
 from pathlib import Path
 
 from src.config.config import config
 from src.core.orchestrator import AgentOrchestrator
-from src.api.webhook_server import create_app
+from src.modules.followup.followup_service import FollowUpService
 
 # Configurar logging
 logging.basicConfig(
@@ -72,6 +73,12 @@ async def run_cli_mode():
     """Modo CLI - interação direta via terminal"""
     logger.info("Iniciando modo CLI")
     orchestrator = AgentOrchestrator()
+    loop = asyncio.get_running_loop()
+    
+    # Mesmo pipeline em background do modo API (follow-ups processados enquanto o usuário digita)
+    followup_task = None
+    if config.agent.enable_followup:
+        followup_task = asyncio.create_task(FollowUpService().run_forever_loop())
     
     print("Agente IA Multicanal - Modo CLI")
     print("Digite 'sair' para encerrar\n")
@@ -80,7 +87,8 @@ async def run_cli_mode():
     
     while True:
         try:
-            user_input = input("Você: ")
+            # input() em thread para não bloquear o event loop
+            user_input = await loop.run_in_executor(None, input, "Você: ")
             
             if user_input.lower() in ["sair", "exit", "quit"]:
                 print("Encerrando...")
@@ -101,25 +109,35 @@ async def run_cli_mode():
             if result.get("sources"):
                 print(f"Fontes: {', '.join(result['sources'])}\n")
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\nEncerrando...")
             break
         except Exception as e:
             logger.error(f"Erro: {e}")
             print(f"Erro: {e}\n")
+    
+    if followup_task is not None:
+        followup_task.cancel()
+    # Salvamentos de histórico ainda em background
+    await orchestrator.drain_background_tasks()
 
 
 def run_api_mode(port: int):
     """Modo API - servidor webhook/API"""
     import uvicorn
     
-    app = create_app()
-    
-    logger.info(f"Iniciando servidor API na porta {port}")
+    workers = config.api.workers
+    logger.info(f"Iniciando servidor API na porta {port} ({workers} workers)")
+    # App por import string (factory): cada worker cria a sua instância
     uvicorn.run(
-        app,
+        "src.api.webhook_server:create_app",
+        factory=True,
         host="0.0.0.0",
         port=port,
+        workers=workers,
+        loop="auto",  # uvloop/httptools quando instalados
+        http="auto",
+        access_log=config.api.access_log,
         log_level=config.agent.log_level.lower()
     )
 
@@ -159,6 +177,10 @@ def main():
     if args.no_transbordo:
         config.agent.enable_transbordo_humano = False
     
+    # Workers da API são processos novos: repassar as flags via ambiente
+    for flag in ("enable_agendamento", "enable_followup", "enable_voz", "enable_knowledge", "enable_transbordo_humano"):
+        os.environ[flag.upper()] = str(getattr(config.agent, flag)).lower()
+    
     logger.info("Iniciando Agente IA Multicanal")
     logger.info(f"Módulos ativos: agendamento={config.agent.enable_agendamento}, "
                 f"followup={config.agent.enable_followup}, "
@@ -2,14 +2,91 @@
 Serviço de integração com Calendly API
 """
 import logging
+import importlib.util
+import json
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 import httpx
 
+try:
+    import orjson  # Parse/serialização mais rápidos das respostas (opcional)
+except ImportError:
+    orjson = None
+
 from src.config.config import config
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexões compartilhado por todas as instâncias (keep-alive; HTTP/2 se h2 estiver instalado)
+_CALENDLY_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+_CALENDLY_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def _json_dumps(payload: Dict[str, Any]) -> bytes:
+    """Serializa o corpo da requisição (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _json_loads(response: httpx.Response) -> Any:
+    """Desserializa o corpo da resposta (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+@lru_cache(maxsize=1)
+def get_calendly_http_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP reutilizado nas chamadas à API do Calendly"""
+    return httpx.AsyncClient(
+        http2=_CALENDLY_HTTP2,
+        limits=_CALENDLY_HTTP_LIMITS,
+        timeout=10.0
+    )
+
+
+async def close_calendly_http_client():
+    """Fecha o cliente HTTP compartilhado (chamar no shutdown da aplicação)"""
+    if get_calendly_http_client.cache_info().currsize:
+        await get_calendly_http_client().aclose()
+        get_calendly_http_client.cache_clear()
+
+
+def _parse_invitee_created(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Formata o webhook invitee.created"""
+    event = payload.get("event", {})
+    invitee = payload.get("invitee", {})
+    
+    return {
+        "type": "event_created",
+        "event_uri": event.get("uri"),
+        "start_time": event.get("start_time"),
+        "invitee_name": invitee.get("name"),
+        "invitee_email": invitee.get("email"),
+        "cancel_url": invitee.get("cancel_url")
+    }
+
+
+def _parse_invitee_canceled(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Formata o webhook invitee.canceled"""
+    event = payload.get("event", {})
+    invitee = payload.get("invitee", {})
+    
+    return {
+        "type": "event_canceled",
+        "event_uri": event.get("uri"),
+        "invitee_email": invitee.get("email")
+    }
+
+
+# Tipo de evento do webhook -> função que formata o payload
+_WEBHOOK_HANDLERS = {
+    "invitee.created": _parse_invitee_created,
+    "invitee.canceled": _parse_invitee_canceled,
+}
+
 
 class CalendlyService:
     """
@@ -19,16 +96,15 @@ class CalendlyService:
     def __init__(self):
         self.api_key = config.calendly.api_key
         self.base_url = config.calendly.base_url
-        
-        if not self.api_key:
-            logger.warning("Calendly API key não configurada")
-    
-    def _get_headers(self) -> Dict[str, str]:
-        """Retorna headers para requisições à API"""
-        return {
+        self._client = get_calendly_http_client()
+        # Headers montados uma vez e reutilizados em todas as requisições
+        self._headers: Dict[str, str] = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        
+        if not self.api_key:
+            logger.warning("Calendly API key não configurada")
     
     async def get_available_times(
         self,
@@ -58,16 +134,15 @@ class CalendlyService:
             if end_time:
                 params["end_time"] = end_time.isoformat()
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("collection", [])
-                
+            response = await self._client.get(
+                url,
+                headers=self._headers,
+                params=params
+            )
+            response.raise_for_status()
+            data = _json_loads(response)
+            return data.get("collection", [])
+            
         except Exception as e:
             logger.error(f"Erro ao buscar horários disponíveis: {e}")
             return []
@@ -114,15 +189,14 @@ class CalendlyService:
                     "answer": additional_info
                 }]
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    headers=self._get_headers(),
-                    json=payload
-                )
-                response.raise_for_status()
-                return response.json()
-                
+            response = await self._client.post(
+                url,
+                headers=self._headers,
+                content=_json_dumps(payload)
+            )
+            response.raise_for_status()
+            return _json_loads(response)
+            
         except Exception as e:
             logger.error(f"Erro ao criar evento: {e}")
             raise
@@ -149,15 +223,14 @@ class CalendlyService:
             if reason:
                 payload["reason"] = reason
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    headers=self._get_headers(),
-                    json=payload
-                )
-                response.raise_for_status()
-                return True
-                
+            response = await self._client.post(
+                url,
+                headers=self._headers,
+                content=_json_dumps(payload)
+            )
+            response.raise_for_status()
+            return True
+            
         except Exception as e:
             logger.error(f"Erro ao cancelar evento: {e}")
             return False
@@ -172,15 +245,14 @@ class CalendlyService:
         try:
             url = f"{self.base_url}/api/v1/event_types"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    headers=self._get_headers()
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("collection", [])
-                
+            response = await self._client.get(
+                url,
+                headers=self._headers
+            )
+            response.raise_for_status()
+            data = _json_loads(response)
+            return data.get("collection", [])
+            
         except Exception as e:
             logger.error(f"Erro ao listar tipos de eventos: {e}")
             return []
@@ -196,14 +268,13 @@ class CalendlyService:
             Dados do evento ou None se não encontrado
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    event_uri,
-                    headers=self._get_headers()
-                )
-                response.raise_for_status()
-                return response.json()
-                
+            response = await self._client.get(
+                event_uri,
+                headers=self._headers
+            )
+            response.raise_for_status()
+            return _json_loads(response)
+            
         except Exception as e:
             logger.error(f"Erro ao obter evento: {e}")
             return None
@@ -219,33 +290,8 @@ class CalendlyService:
             Evento formatado ou None
         """
         try:
-            event_type = webhook_data.get("event")
-            
-            if event_type == "invitee.created":
-                payload = webhook_data.get("payload", {})
-                event = payload.get("event", {})
-                invitee = payload.get("invitee", {})
-                
-                return {
-                    "type": "event_created",
-                    "event_uri": event.get("uri"),
-                    "start_time": event.get("start_time"),
-                    "invitee_name": invitee.get("name"),
-                    "invitee_email": invitee.get("email"),
-                    "cancel_url": invitee.get("cancel_url")
-                }
-            elif event_type == "invitee.canceled":
-                payload = webhook_data.get("payload", {})
-                event = payload.get("event", {})
-                invitee = payload.get("invitee", {})
-                
-                return {
-                    "type": "event_canceled",
-                    "event_uri": event.get("uri"),
-                    "invitee_email": invitee.get("email")
-                }
-            
-            return None
+            handler = _WEBHOOK_HANDLERS.get(webhook_data.get("event"))
+            return handler(webhook_data.get("payload", {})) if handler else None
             
         except Exception as e:
             logger.error(f"Erro ao processar webhook Calendly: {e}")
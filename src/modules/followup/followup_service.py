@@ -2,16 +2,25 @@
 Serviço de follow-up automático
 Gerencia envio de mensagens de acompanhamento e reengajamento
 """
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import uuid
+from typing import Dict, List, Optional, Any, TYPE_CHECKING
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
 from src.config.config import config
+from src.utils.redis_client import redis_client
+
+if TYPE_CHECKING:
+    from src.modules.followup.followup_store import FollowUpStore
 
 logger = logging.getLogger(__name__)
 
+# Espera máxima de run_forever_loop entre verificações (agendamentos de outros processos)
+FOLLOWUP_MAX_SLEEP_SECONDS = 60
+
 
 class FollowUpType(Enum):
     """Tipos de follow-up"""
@@ -31,6 +40,7 @@ class FollowUpTask:
     message_template: str
     metadata: Optional[Dict[str, Any]] = None
     status: str = "pending"  # pending, sent, cancelled
+    task_id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
 
 class FollowUpService:
@@ -38,10 +48,24 @@ class FollowUpService:
     Serviço para gerenciar follow-ups automáticos
     """
     
-    def __init__(self):
-        # Em produção, isso seria um banco de dados ou fila (Redis/Celery)
-        self._pending_followups: List[FollowUpTask] = []
+    def __init__(self, store: Optional["FollowUpStore"] = None):
+        # Sem store explícito: Redis (persistente, compartilhado entre workers) com fallback em memória
+        self._store = store
         self._sent_followups: List[FollowUpTask] = []
+        # Acorda run_forever_loop quando um follow-up é agendado
+        self._wake = asyncio.Event()
+    
+    async def _get_store(self) -> "FollowUpStore":
+        """Retorna o armazenamento, escolhendo Redis ou memória no primeiro uso"""
+        if self._store is None:
+            from src.modules.followup.followup_store import InMemoryFollowUpStore, RedisFollowUpStore
+            try:
+                await redis_client.connect()
+                self._store = RedisFollowUpStore(redis_client)
+            except Exception as e:
+                logger.warning(f"Redis indisponível para follow-ups: {e}. Usando armazenamento em memória.")
+                self._store = InMemoryFollowUpStore()
+        return self._store
     
     async def schedule_followup(
         self,
@@ -77,7 +101,9 @@ class FollowUpService:
             metadata=metadata
         )
         
-        self._pending_followups.append(task)
+        store = await self._get_store()
+        await store.add(task)
+        self._wake.set()
         logger.info(f"Follow-up agendado para {user_id} em {scheduled_time}")
         
         return task
@@ -127,24 +153,44 @@ class FollowUpService:
     async def process_pending_followups(self):
         """
         Processa follow-ups pendentes que estão prontos para envio
-        Deve ser chamado periodicamente (ex: via Celery beat ou cron)
+        Chamado por run_forever_loop (ou periodicamente via Celery beat/cron)
         """
-        now = datetime.utcnow()
-        ready_followups = [
-            task for task in self._pending_followups
-            if task.status == "pending" and task.scheduled_time <= now
-        ]
-        
-        for task in ready_followups:
+        store = await self._get_store()
+        for task in await store.pop_ready(datetime.utcnow()):
             try:
                 await self._send_followup(task)
                 task.status = "sent"
                 self._sent_followups.append(task)
-                self._pending_followups.remove(task)
             except Exception as e:
                 logger.error(f"Erro ao enviar follow-up para {task.user_id}: {e}")
                 task.status = "error"
     
+    async def run_forever_loop(self, max_sleep_seconds: float = FOLLOWUP_MAX_SLEEP_SECONDS):
+        """
+        Processa follow-ups até ser cancelado, dormindo até o próximo horário agendado
+        
+        schedule_followup acorda o loop na hora (tarefa nova pode vencer antes);
+        max_sleep_seconds cobre agendamentos feitos por outros processos (store no Redis)
+        """
+        while True:
+            # Limpar antes de consultar: um agendamento durante a consulta não se perde
+            self._wake.clear()
+            try:
+                await self.process_pending_followups()
+                store = await self._get_store()
+                next_due = await store.next_due()
+            except Exception as e:
+                logger.error(f"Erro ao processar follow-ups pendentes: {e}", exc_info=True)
+                next_due = None
+            
+            delay = max_sleep_seconds
+            if next_due is not None:
+                delay = min(max((next_due - datetime.utcnow()).total_seconds(), 0), max_sleep_seconds)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    
     async def _send_followup(self, task: FollowUpTask):
         """
         Envia um follow-up específico
@@ -176,24 +222,16 @@ class FollowUpService:
         """
         Cancela follow-ups pendentes de um usuário
         """
-        cancelled = []
-        for task in self._pending_followups:
-            if task.user_id == user_id:
-                if followup_type is None or task.followup_type == followup_type:
-                    task.status = "cancelled"
-                    cancelled.append(task)
-        
-        for task in cancelled:
-            self._pending_followups.remove(task)
+        store = await self._get_store()
+        cancelled = await store.cancel(user_id, followup_type)
         
-        logger.info(f"Cancelled {len(cancelled)} follow-ups para {user_id}")
-        return len(cancelled)
+        logger.info(f"Cancelled {cancelled} follow-ups para {user_id}")
+        return cancelled
     
-    def get_pending_followups(self, user_id: Optional[str] = None) -> List[FollowUpTask]:
+    async def get_pending_followups(self, user_id: Optional[str] = None) -> List[FollowUpTask]:
         """
         Retorna follow-ups pendentes
         """
-        if user_id:
-            return [task for task in self._pending_followups if task.user_id == user_id]
-        return self._pending_followups.copy()
+        store = await self._get_store()
+        return await store.get_pending(user_id)
 
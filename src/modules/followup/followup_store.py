@@ -0,0 +1,226 @@
+"""
+Armazenamento dos follow-ups agendados
+Em memória (processo único) ou no Redis (persistente e compartilhado entre workers)
+"""
+import heapq
+import itertools
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from src.modules.followup.followup_service import FollowUpTask, FollowUpType
+from src.utils.redis_client import RedisClient
+
+logger = logging.getLogger(__name__)
+
+# Máximo de tarefas retiradas por chamada ao Redis em pop_ready
+POP_READY_BATCH_SIZE = 100
+
+
+class FollowUpStore(Protocol):
+    """Interface dos armazenamentos de follow-up"""
+    
+    async def add(self, task: FollowUpTask): ...
+    
+    async def pop_ready(self, now: datetime) -> List[FollowUpTask]: ...
+    
+    async def next_due(self) -> Optional[datetime]: ...
+    
+    async def cancel(self, user_id: str, followup_type: Optional[FollowUpType] = None) -> int: ...
+    
+    async def get_pending(self, user_id: Optional[str] = None) -> List[FollowUpTask]: ...
+
+
+class InMemoryFollowUpStore:
+    """
+    Follow-ups em memória (perdidos no restart; um por processo)
+    
+    Min-heap por horário (contador desempata); cancelados saem do heap só
+    quando chegam ao topo.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, FollowUpTask]] = []
+        self._counter = itertools.count()
+        # Índice dos pendentes por usuário (cancelamento e consulta sem varrer o heap)
+        self._by_user: Dict[str, List[FollowUpTask]] = {}
+    
+    async def add(self, task: FollowUpTask):
+        heapq.heappush(self._heap, (task.scheduled_time, next(self._counter), task))
+        self._by_user.setdefault(task.user_id, []).append(task)
+    
+    async def pop_ready(self, now: datetime) -> List[FollowUpTask]:
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, task = heapq.heappop(self._heap)
+            if task.status != "pending":
+                continue
+            self._remove_from_user_index(task)
+            ready.append(task)
+        return ready
+    
+    async def next_due(self) -> Optional[datetime]:
+        # Pode ser uma tarefa cancelada (remoção preguiçosa): só causa um despertar sem envio
+        return self._heap[0][0] if self._heap else None
+    
+    def _remove_from_user_index(self, task: FollowUpTask):
+        """Remove a tarefa do índice de pendentes do usuário"""
+        user_tasks = self._by_user.get(task.user_id)
+        if not user_tasks:
+            return
+        user_tasks.remove(task)
+        if not user_tasks:
+            del self._by_user[task.user_id]
+    
+    async def cancel(self, user_id: str, followup_type: Optional[FollowUpType] = None) -> int:
+        cancelled = 0
+        remaining = []
+        for task in self._by_user.pop(user_id, []):
+            if followup_type is None or task.followup_type == followup_type:
+                task.status = "cancelled"  # Removida do heap quando chegar ao topo
+                cancelled += 1
+            else:
+                remaining.append(task)
+        
+        if remaining:
+            self._by_user[user_id] = remaining
+        return cancelled
+    
+    async def get_pending(self, user_id: Optional[str] = None) -> List[FollowUpTask]:
+        if user_id:
+            return list(self._by_user.get(user_id, []))
+        return [task for user_tasks in self._by_user.values() for task in user_tasks]
+
+
+class RedisFollowUpStore:
+    """
+    Follow-ups no Redis: sobrevivem a restarts e são compartilhados entre workers
+    
+    - followups:schedule      sorted set (score = horário agendado, epoch UTC)
+    - followups:tasks         hash task_id -> JSON da tarefa
+    - followups:user:{id}     set com os task_ids pendentes do usuário
+    
+    A retirada das tarefas prontas é atômica (script Lua), então vários
+    workers podem processar a fila sem envio duplicado.
+    """
+    
+    SCHEDULE_KEY = "followups:schedule"
+    TASKS_KEY = "followups:tasks"
+    
+    # KEYS[1]=schedule, KEYS[2]=tasks; ARGV[1]=agora (epoch), ARGV[2]=limite
+    _POP_READY_SCRIPT = """
+        local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+        if #ids == 0 then
+            return {}
+        end
+        redis.call('ZREM', KEYS[1], unpack(ids))
+        local payloads = redis.call('HMGET', KEYS[2], unpack(ids))
+        redis.call('HDEL', KEYS[2], unpack(ids))
+        return payloads
+    """
+    
+    def __init__(self, redis: RedisClient):
+        self.redis = redis
+    
+    @staticmethod
+    def _get_user_key(user_id: str) -> str:
+        return f"followups:user:{user_id}"
+    
+    @staticmethod
+    def _to_timestamp(value: datetime) -> float:
+        """datetime UTC (naive) -> epoch"""
+        return value.replace(tzinfo=timezone.utc).timestamp()
+    
+    @classmethod
+    def _serialize(cls, task: FollowUpTask) -> str:
+        return json.dumps({
+            "task_id": task.task_id,
+            "user_id": task.user_id,
+            "channel": task.channel,
+            "followup_type": task.followup_type.value,
+            "scheduled_time": cls._to_timestamp(task.scheduled_time),
+            "message_template": task.message_template,
+            "metadata": task.metadata,
+            "status": task.status
+        }, default=str)
+    
+    @staticmethod
+    def _deserialize(payload: str) -> FollowUpTask:
+        data: Dict[str, Any] = json.loads(payload)
+        return FollowUpTask(
+            task_id=data["task_id"],
+            user_id=data["user_id"],
+            channel=data["channel"],
+            followup_type=FollowUpType(data["followup_type"]),
+            scheduled_time=datetime.fromtimestamp(data["scheduled_time"], timezone.utc).replace(tzinfo=None),
+            message_template=data["message_template"],
+            metadata=data.get("metadata"),
+            status=data.get("status", "pending")
+        )
+    
+    async def add(self, task: FollowUpTask):
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.TASKS_KEY, task.task_id, self._serialize(task))
+            pipe.zadd(self.SCHEDULE_KEY, {task.task_id: self._to_timestamp(task.scheduled_time)})
+            pipe.sadd(self._get_user_key(task.user_id), task.task_id)
+            await pipe.execute()
+    
+    async def pop_ready(self, now: datetime) -> List[FollowUpTask]:
+        # Registrado a cada chamada: o cliente pode ter sido recriado (reconexão)
+        pop_ready_script = self.redis.client.register_script(self._POP_READY_SCRIPT)
+        
+        ready = []
+        while True:
+            payloads = await pop_ready_script(
+                keys=[self.SCHEDULE_KEY, self.TASKS_KEY],
+                args=[self._to_timestamp(now), POP_READY_BATCH_SIZE]
+            )
+            ready.extend(self._deserialize(payload) for payload in payloads if payload)
+            if len(payloads) < POP_READY_BATCH_SIZE:
+                break
+        
+        if ready:
+            # Índice por usuário é auxiliar: atualizado fora do script
+            async with self.redis.client.pipeline(transaction=False) as pipe:
+                for task in ready:
+                    pipe.srem(self._get_user_key(task.user_id), task.task_id)
+                await pipe.execute()
+        return ready
+    
+    async def next_due(self) -> Optional[datetime]:
+        head = await self.redis.client.zrange(self.SCHEDULE_KEY, 0, 0, withscores=True)
+        if not head:
+            return None
+        _, score = head[0]
+        return datetime.fromtimestamp(score, timezone.utc).replace(tzinfo=None)
+    
+    async def cancel(self, user_id: str, followup_type: Optional[FollowUpType] = None) -> int:
+        tasks = await self.get_pending(user_id)
+        task_ids = [
+            task.task_id for task in tasks
+            if followup_type is None or task.followup_type == followup_type
+        ]
+        if not task_ids:
+            return 0
+        
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.SCHEDULE_KEY, *task_ids)
+            pipe.hdel(self.TASKS_KEY, *task_ids)
+            pipe.srem(self._get_user_key(user_id), *task_ids)
+            removed, _, _ = await pipe.execute()
+        # Tarefas retiradas por outro worker no meio do caminho não contam
+        return removed
+    
+    async def get_pending(self, user_id: Optional[str] = None) -> List[FollowUpTask]:
+        if user_id:
+            task_ids = list(await self.redis.client.smembers(self._get_user_key(user_id)))
+            if not task_ids:
+                return []
+            payloads = await self.redis.client.hmget(self.TASKS_KEY, task_ids)
+        else:
+            payloads = await self.redis.client.hvals(self.TASKS_KEY)
+        
+        tasks = [self._deserialize(payload) for payload in payloads if payload]
+        tasks.sort(key=lambda task: task.scheduled_time)
+        return tasks
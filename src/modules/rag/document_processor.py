@@ -2,7 +2,10 @@
 Processador de documentos - Extrai texto e divide em chunks
 """
 import logging
-from typing import List, Dict
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict
 from pathlib import Path
 import asyncio
 
@@ -10,6 +13,106 @@ from src.config.config import config
 
 logger = logging.getLogger(__name__)
 
+# Abaixo disso o custo de abrir o PDF em cada processo não compensa
+PDF_PARALLEL_MIN_PAGES = 8
+
+# Linhas de texto (aprox. em caracteres) lidas por vez de arquivos .txt
+TEXT_READ_HINT = 1024 * 1024
+
+
+@lru_cache(maxsize=1)
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado para extração de texto de PDFs (CPU-bound)"""
+    return ProcessPoolExecutor(max_workers=os.cpu_count())
+
+
+@lru_cache(maxsize=1)
+def _get_io_pool() -> ThreadPoolExecutor:
+    """Pool de threads dedicado à leitura de arquivos (não disputa o executor padrão do loop)"""
+    return ThreadPoolExecutor(
+        max_workers=config.rag.document_io_workers,
+        thread_name_prefix="docproc-io"
+    )
+
+
+def shutdown_document_pools():
+    """Encerra os pools de leitura/extração (chamar no shutdown da aplicação)"""
+    for get_pool in (_get_io_pool, _get_pdf_pool):
+        if get_pool.cache_info().currsize:
+            get_pool().shutdown(wait=False, cancel_futures=True)
+            get_pool.cache_clear()
+
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extrai o texto das páginas [start, stop) (executado em processo separado)"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+class ChunkSplitter:
+    """
+    Divide texto em chunks com overlap, recebendo o documento em partes
+    (páginas, blocos de linhas) para não materializar o texto inteiro
+    
+    Mantém só o chunk em aberto + a parte ainda não dividida. O texto é
+    normalizado (palavras separadas por um espaço, com espaço final) e cada
+    chunk é uma fatia contígua dele: os limites saem de find/rfind (em C),
+    sem percorrer palavra a palavra em Python.
+    """
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int, source: str):
+        self.chunk_size = chunk_size
+        self.overlap_words = int(chunk_overlap / 10)  # Aproximação
+        self.source = source
+        self._buffer = ""
+        self._min_end = 0  # Fim mínimo do chunk em aberto: palavra que o abriu sempre entra
+    
+    def feed(self, text: str) -> List[Dict[str, str]]:
+        """Adiciona texto e retorna os chunks que já não podem mais crescer"""
+        normalized = " ".join(text.split())
+        if not normalized:
+            return []
+        
+        buffer = self._buffer + normalized + " "
+        min_end = self._min_end or buffer.find(" ") + 1
+        chunks = []
+        start = 0
+        while True:
+            # Último espaço que cabe em chunk_size a partir do início do chunk
+            end = max(buffer.rfind(" ", start, start + self.chunk_size) + 1, min_end)
+            if end >= len(buffer):
+                break  # Chunk ainda pode crescer com o próximo texto
+            chunks.append({
+                "content": buffer[start:end - 1],
+                "source": self.source
+            })
+            
+            # Novo chunk: últimas overlap_words palavras do anterior + próxima palavra
+            if self.overlap_words:
+                head = chunks[-1]["content"].rsplit(" ", self.overlap_words)
+                if len(head) > self.overlap_words:
+                    start += len(head[0]) + 1
+            else:
+                start = end
+            min_end = buffer.find(" ", end) + 1
+        
+        self._buffer = buffer[start:]
+        self._min_end = min_end - start
+        return chunks
+    
+    def finish(self) -> List[Dict[str, str]]:
+        """Retorna o último chunk (texto restante)"""
+        if not self._buffer:
+            return []
+        chunk = {
+            "content": self._buffer[:-1],
+            "source": self.source
+        }
+        self._buffer = ""
+        self._min_end = 0
+        return [chunk]
+
 
 class DocumentProcessor:
     """
@@ -19,72 +122,106 @@ class DocumentProcessor:
     def __init__(self):
         self.chunk_size = config.rag.chunk_size
         self.chunk_overlap = config.rag.chunk_overlap
+        # Limita documentos processados ao mesmo tempo (uploads em rajada)
+        self._semaphore = asyncio.Semaphore(config.rag.max_concurrent_documents)
     
-    async def process_document(self, file_path: str) -> List[Dict[str, str]]:
+    async def process_document(self, file_path: str) -> AsyncIterator[Dict[str, str]]:
         """
-        Processa um documento e retorna chunks de texto
+        Processa um documento, gerando os chunks de texto conforme é lido
+        
+        O texto é lido em partes (páginas do PDF, blocos de linhas do .txt),
+        então o documento inteiro nunca fica em memória
         
         Args:
             file_path: Caminho do arquivo
             
-        Returns:
-            Lista de chunks com conteúdo e metadados
+        Yields:
+            Chunks com conteúdo e metadados
         """
         file_path_obj = Path(file_path)
         extension = file_path_obj.suffix.lower()
         
         # Extrair texto baseado na extensão
         if extension == ".txt":
-            text = await self._read_text_file(file_path)
+            parts = self._read_text_file(file_path)
         elif extension == ".pdf":
-            text = await self._read_pdf_file(file_path)
+            parts = self._read_pdf_file(file_path)
         elif extension in [".doc", ".docx"]:
-            text = await self._read_docx_file(file_path)
+            parts = self._read_docx_file(file_path)
         else:
             raise ValueError(f"Formato de arquivo não suportado: {extension}")
         
         # Dividir em chunks
-        chunks = self._split_into_chunks(text, file_path)
-        
-        return chunks
+        splitter = ChunkSplitter(self.chunk_size, self.chunk_overlap, file_path)
+        async with self._semaphore:
+            async for text in parts:
+                for chunk in splitter.feed(text):
+                    yield chunk
+            for chunk in splitter.finish():
+                yield chunk
     
-    async def _read_text_file(self, file_path: str) -> str:
-        """Lê arquivo de texto"""
+    async def _read_text_file(self, file_path: str) -> AsyncIterator[str]:
+        """Lê arquivo de texto em blocos de linhas completas"""
         loop = asyncio.get_event_loop()
         with open(file_path, "r", encoding="utf-8") as f:
-            return await loop.run_in_executor(None, f.read)
+            while True:
+                lines = await loop.run_in_executor(_get_io_pool(), f.readlines, TEXT_READ_HINT)
+                if not lines:
+                    break
+                yield "".join(lines)
     
-    async def _read_pdf_file(self, file_path: str) -> str:
-        """Lê arquivo PDF"""
+    async def _read_pdf_file(self, file_path: str) -> AsyncIterator[str]:
+        """
+        Lê arquivo PDF, gerando o texto página a página
+        
+        PDFs grandes têm as páginas divididas em faixas extraídas em paralelo
+        no pool de processos (uma abertura do arquivo por faixa)
+        """
         try:
             from pypdf import PdfReader
-            loop = asyncio.get_event_loop()
-            
-            def read_pdf():
-                reader = PdfReader(file_path)
-                text_parts = []
-                for page in reader.pages:
-                    text_parts.append(page.extract_text())
-                return "\n".join(text_parts)
-            
-            return await loop.run_in_executor(None, read_pdf)
         except ImportError:
             raise ImportError("pypdf não instalado. Instale com: pip install pypdf")
+        
+        loop = asyncio.get_event_loop()
+        reader = await loop.run_in_executor(_get_io_pool(), PdfReader, file_path)
+        page_count = len(reader.pages)
+        
+        if page_count < PDF_PARALLEL_MIN_PAGES:
+            for page in reader.pages:
+                yield await loop.run_in_executor(_get_io_pool(), page.extract_text)
+            return
+        
+        workers = min(os.cpu_count() or 1, page_count)
+        step = -(-page_count // workers)
+        pool = _get_pdf_pool()
+        ranges = [
+            loop.run_in_executor(pool, _extract_pdf_pages, file_path, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        try:
+            # Todas as faixas já estão rodando; entregues em ordem
+            for pending in ranges:
+                for text in await pending:
+                    yield text
+        finally:
+            for pending in ranges:
+                pending.cancel()
     
-    async def _read_docx_file(self, file_path: str) -> str:
+    async def _read_docx_file(self, file_path: str) -> AsyncIterator[str]:
         """Lê arquivo DOCX"""
         try:
             from docx import Document
-            loop = asyncio.get_event_loop()
-            
-            def read_docx():
-                doc = Document(file_path)
-                paragraphs = [p.text for p in doc.paragraphs]
-                return "\n".join(paragraphs)
-            
-            return await loop.run_in_executor(None, read_docx)
         except ImportError:
             raise ImportError("python-docx não instalado. Instale com: pip install python-docx")
+        
+        loop = asyncio.get_event_loop()
+        
+        def read_docx():
+            doc = Document(file_path)
+            paragraphs = [p.text for p in doc.paragraphs]
+            return "\n".join(paragraphs)
+        
+        yield await loop.run_in_executor(_get_io_pool(), read_docx)
     
     def _split_into_chunks(self, text: str, source: str) -> List[Dict[str, str]]:
         """
@@ -97,39 +234,5 @@ class DocumentProcessor:
         Returns:
             Lista de chunks
         """
-        chunks = []
-        words = text.split()
-        
-        # Dividir em chunks de palavras (aproximadamente chunk_size caracteres)
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            word_length = len(word) + 1  # +1 para espaço
-            
-            if current_length + word_length > self.chunk_size and current_chunk:
-                # Finalizar chunk atual
-                chunk_text = " ".join(current_chunk)
-                chunks.append({
-                    "content": chunk_text,
-                    "source": source
-                })
-                
-                # Iniciar novo chunk com overlap
-                overlap_words = int(self.chunk_overlap / 10)  # Aproximação
-                current_chunk = current_chunk[-overlap_words:] + [word]
-                current_length = sum(len(w) + 1 for w in current_chunk)
-            else:
-                current_chunk.append(word)
-                current_length += word_length
-        
-        # Adicionar último chunk
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
-            chunks.append({
-                "content": chunk_text,
-                "source": source
-            })
-        
-        return chunks
-
+        splitter = ChunkSplitter(self.chunk_size, self.chunk_overlap, source)
+        return splitter.feed(text) + splitter.finish()
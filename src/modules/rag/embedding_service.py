@@ -2,13 +2,41 @@
 Serviço de geração de embeddings
 """
 import logging
-from typing import List
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
 import asyncio
 
+try:
+    import diskcache  # Cache de embeddings em disco (opcional)
+except ImportError:
+    diskcache = None
+
 from src.config.config import config
+from src.utils.batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_DISK_CACHE_DIR = Path.home() / ".cache" / "embeddings"
+
+# Limites por requisição da API de embeddings da OpenAI (2048 entradas; ~300k tokens).
+# Caracteres como proxy de tokens (~4 por token), com folga
+OPENAI_MAX_INPUTS_PER_REQUEST = 2048
+OPENAI_MAX_CHARS_PER_REQUEST = 800_000
+
+
+@lru_cache(maxsize=1)
+def _get_encode_pool() -> ThreadPoolExecutor:
+    """
+    Thread única para o modelo local: um encode por vez usando todos os cores
+    (evita oversubscription de threads do torch e disputa com o executor padrão)
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="st-encode")
+
 
 class EmbeddingService:
     """
@@ -18,7 +46,35 @@ class EmbeddingService:
     def __init__(self):
         self.provider = config.embedding.provider.lower()
         self.model = config.embedding.model
-        self._initialize_client()
+        if self.provider not in ("openai", "sentence-transformers"):
+            raise ValueError(f"Provedor de embeddings não suportado: {self.provider}")
+        # Clientes (openai / sentence_transformers + torch) carregados só no primeiro uso
+        self.client = None
+        self.model_local = None
+        self._client_ready = False
+        self._client_lock = asyncio.Lock()
+        # Cache por conteúdo: blake2b(texto) -> embedding (LRU em memória + disco opcional)
+        self._cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._cache_maxsize = config.embedding.cache_size
+        self._disk_cache = None  # Aberto junto com o cliente (depende do provedor efetivo)
+        # Chamadas concorrentes a embed_text viram uma única chamada a embed_batch
+        self._batcher = MicroBatcher(
+            self.embed_batch,
+            max_batch_size=config.embedding.batch_max_size,
+            max_wait=config.embedding.batch_wait_ms / 1000
+        )
+    
+    async def _ensure_client(self):
+        """Inicializa cliente e cache em disco na primeira geração de embeddings"""
+        if self._client_ready:
+            return
+        async with self._client_lock:
+            if self._client_ready:
+                return
+            # Import/carga do modelo pode levar segundos: fora do event loop
+            await asyncio.to_thread(self._initialize_client)
+            self._disk_cache = self._initialize_disk_cache()
+            self._client_ready = True
     
     def _initialize_client(self):
         """Inicializa o cliente de embeddings"""
@@ -29,9 +85,16 @@ class EmbeddingService:
             self.client = OpenAI(api_key=config.embedding.openai_api_key)
         elif self.provider == "sentence-transformers":
             # Usar modelo local
+            if config.embedding.onnx_model_dir and self._initialize_onnx_model():
+                return
             try:
                 from sentence_transformers import SentenceTransformer
-                self.model_local = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+                import torch
+                torch.set_num_threads(os.cpu_count() or 1)
+                self.model_local = SentenceTransformer(
+                    'paraphrase-multilingual-MiniLM-L12-v2',
+                    device=config.embedding.device
+                )
                 self.client = None
             except ImportError:
                 logger.warning("sentence-transformers não instalado, usando OpenAI")
@@ -41,10 +104,73 @@ class EmbeddingService:
         else:
             raise ValueError(f"Provedor de embeddings não suportado: {self.provider}")
     
+    def _initialize_onnx_model(self) -> bool:
+        """
+        Carrega o modelo local exportado para ONNX int8 (scripts/export_onnx_embeddings.py)
+        
+        Returns:
+            True se carregou; False para cair no SentenceTransformer
+        """
+        try:
+            from src.modules.rag.onnx_encoder import OnnxSentenceEncoder
+            self.model_local = OnnxSentenceEncoder(config.embedding.onnx_model_dir)
+            self.client = None
+            return True
+        except Exception as e:
+            logger.warning(f"Modelo ONNX indisponível ({e}), usando SentenceTransformer")
+            return False
+    
+    def _initialize_disk_cache(self):
+        """Abre o cache em disco (diskcache), se habilitado e instalado"""
+        if not config.embedding.disk_cache or diskcache is None:
+            return None
+        try:
+            directory = EMBEDDING_DISK_CACHE_DIR / f"{self.provider}_{self.model}".replace("/", "_")
+            return diskcache.Cache(str(directory))
+        except Exception as e:
+            logger.warning(f"Cache de embeddings em disco indisponível: {e}")
+            return None
+    
+    @staticmethod
+    def _cache_key(text: str) -> bytes:
+        """Chave do cache (o cache já é separado por provedor/modelo)"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    
+    def _cache_get(self, key: bytes) -> Optional[List[float]]:
+        """Busca no LRU em memória"""
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+        return embedding
+    
+    def _cache_set(self, key: bytes, embedding: List[float]):
+        """Armazena no LRU em memória, descartando as entradas menos usadas"""
+        self._cache[key] = embedding
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_maxsize:
+            self._cache.popitem(last=False)
+    
+    def _disk_get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Lê várias chaves do cache em disco (executado em thread)"""
+        found = {}
+        for key in keys:
+            embedding = self._disk_cache.get(key)
+            if embedding is not None:
+                found[key] = embedding
+        return found
+    
+    def _disk_set_many(self, items: Dict[bytes, List[float]]):
+        """Grava várias chaves no cache em disco (executado em thread)"""
+        with self._disk_cache.transact():
+            for key, embedding in items.items():
+                self._disk_cache.set(key, embedding)
+    
     async def embed_text(self, text: str) -> List[float]:
         """
         Gera embedding para um texto
         
+        Chamadas concorrentes são agrupadas (micro-batching) em embed_batch
+        
         Args:
             text: Texto a ser vetorizado
             
@@ -52,27 +178,7 @@ class EmbeddingService:
             Lista de floats representando o embedding
         """
         try:
-            if self.provider == "openai":
-                # OpenAI API é síncrona, então executamos em thread
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self.client.embeddings.create(
-                        model=self.model,
-                        input=text
-                    )
-                )
-                return response.data[0].embedding
-            elif self.provider == "sentence-transformers":
-                # Modelo local
-                loop = asyncio.get_event_loop()
-                embedding = await loop.run_in_executor(
-                    None,
-                    lambda: self.model_local.encode(text, convert_to_numpy=True)
-                )
-                return embedding.tolist()
-            else:
-                raise ValueError(f"Provedor não suportado: {self.provider}")
+            return await self._batcher.load(text)
         except Exception as e:
             logger.error(f"Erro ao gerar embedding: {e}")
             raise
@@ -81,27 +187,91 @@ class EmbeddingService:
         """
         Gera embeddings para múltiplos textos
         
+        Textos já vistos vêm do cache; só os ausentes (sem repetição) vão ao provedor
+        
         Args:
             texts: Lista de textos
             
         Returns:
             Lista de embeddings
         """
+        await self._ensure_client()
+        keys = [self._cache_key(text) for text in texts]
+        results: Dict[bytes, List[float]] = {}
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in results or key in missing:
+                continue
+            embedding = self._cache_get(key)
+            if embedding is not None:
+                results[key] = embedding
+            else:
+                missing[key] = text
+        
+        if missing and self._disk_cache is not None:
+            try:
+                found = await asyncio.to_thread(self._disk_get_many, list(missing))
+            except Exception as e:
+                logger.warning(f"Erro ao ler cache de embeddings em disco: {e}")
+                found = {}
+            for key, embedding in found.items():
+                del missing[key]
+                results[key] = embedding
+                self._cache_set(key, embedding)
+        
+        if missing:
+            embeddings = await self._embed_uncached(list(missing.values()))
+            computed = dict(zip(missing, embeddings))
+            for key, embedding in computed.items():
+                results[key] = embedding
+                self._cache_set(key, embedding)
+            if self._disk_cache is not None:
+                try:
+                    await asyncio.to_thread(self._disk_set_many, computed)
+                except Exception as e:
+                    logger.warning(f"Erro ao gravar cache de embeddings em disco: {e}")
+        
+        return [results[key] for key in keys]
+    
+    @staticmethod
+    def _split_openai_requests(texts: List[str]) -> List[List[str]]:
+        """Divide os textos em fatias que respeitam os limites por requisição da OpenAI"""
+        requests: List[List[str]] = []
+        current: List[str] = []
+        current_chars = 0
+        for text in texts:
+            if current and (
+                len(current) >= OPENAI_MAX_INPUTS_PER_REQUEST
+                or current_chars + len(text) > OPENAI_MAX_CHARS_PER_REQUEST
+            ):
+                requests.append(current)
+                current, current_chars = [], 0
+            current.append(text)
+            current_chars += len(text)
+        if current:
+            requests.append(current)
+        return requests
+    
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Chama o provedor de embeddings para os textos informados"""
         if self.provider == "openai":
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.embeddings.create(
-                    model=self.model,
-                    input=texts
-                )
-            )
-            return [item.embedding for item in response.data]
+            # Uma requisição por fatia dentro dos limites da API, em paralelo
+            responses = await asyncio.gather(*(
+                asyncio.to_thread(self.client.embeddings.create, model=self.model, input=request_texts)
+                for request_texts in self._split_openai_requests(texts)
+            ))
+            return [item.embedding for response in responses for item in response.data]
         elif self.provider == "sentence-transformers":
             loop = asyncio.get_event_loop()
             embeddings = await loop.run_in_executor(
-                None,
-                lambda: self.model_local.encode(texts, convert_to_numpy=True)
+                _get_encode_pool(),
+                lambda: self.model_local.encode(
+                    texts,
+                    batch_size=config.embedding.batch_max_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,  # Norma unitária, como os embeddings da OpenAI
+                    show_progress_bar=False
+                )
             )
             return embeddings.tolist()
         else:
@@ -1,92 +1,340 @@
 """
 Retriever LangChain para integração RAG
 """
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Dict, Any
+import threading
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Any, Hashable, NamedTuple, Optional, Tuple, Union
 
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
+from pydantic import ConfigDict, PrivateAttr, field_validator
 
+from src.config.config import config
 from src.modules.rag.rag_service import RAGService
+from src.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+# A partir deste número de resultados, os Documents são montados fora do event loop
+DOCUMENT_BUILD_THREAD_THRESHOLD = 32
+
+# Loop em thread dedicada para o caminho síncrono (criado no primeiro uso)
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Retorna o loop de background do retriever
+    
+    Coroutines enviadas com run_coroutine_threadsafe rodam nele, então a busca
+    síncrona funciona mesmo quando a thread chamadora já tem um loop rodando.
+    """
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="retriever-loop", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+class _Row(NamedTuple):
+    """Resultado de busca compacto (é o que fica no cache)"""
+    content: str
+    source: str
+    document_id: str
+    similarity: float
+
+
+def _results_to_rows(results: List[Dict[str, Any]]) -> Tuple[_Row, ...]:
+    """
+    Converte resultados do RAGService.search em _Rows
+    
+    search sempre preenche content/source/document_id/similarity, então as
+    chaves são lidas direto; linhas incompletas caem no fallback com .get.
+    """
+    rows = []
+    for result in results:
+        try:
+            row = _Row(result["content"], result["source"], result["document_id"], result["similarity"])
+        except KeyError:
+            row = _Row(
+                result.get("content", ""),
+                result.get("source", ""),
+                result.get("document_id", ""),
+                result.get("similarity", 0.0)
+            )
+        rows.append(row)
+    return tuple(rows)
+
+
+def _rows_to_documents(rows: Tuple[_Row, ...]) -> List[Document]:
+    """Materializa Documents do LangChain (novos a cada chamada: o chamador pode alterá-los)"""
+    make_document = Document  # Local: evita LOAD_GLOBAL por linha
+    return [
+        make_document(
+            page_content=content,
+            metadata={"source": source, "document_id": document_id, "similarity": similarity}
+        )
+        for content, source, document_id, similarity in rows
+    ]
+
+
+class QueryCache(TTLCache):
+    """
+    Cache de resultados por consulta (TTL + LRU), seguro entre threads
+    
+    Usado tanto pelo caminho síncrono (threads) quanto pelo assíncrono;
+    contabiliza hits/misses/evictions para observabilidade.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            value = super().get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            expected = len(self) + (0 if key in self._data else 1)
+            super().set(key, value, ttl)
+            self.evictions += expected - len(self)
+    
+    def pop(self, key: Hashable):
+        with self._lock:
+            super().pop(key)
+    
+    def clear(self):
+        with self._lock:
+            super().clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Retorna contadores do cache"""
+        with self._lock:
+            return {
+                "size": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
 
 class PGVectorRetriever(BaseRetriever):
     """
     Retriever LangChain que usa PostgreSQL + PGVector
+    
+    Resultados ficam em cache por (consulta, top_k, filtro) como tuplas
+    compactas, inclusive vazios (com TTL menor); os Documents são montados a
+    cada chamada. O cache é limpo quando o RAGService insere/remove
+    documentos ou altera metadata.
     """
     
-    def __init__(self, rag_service: RAGService, top_k: int = 5):
-        super().__init__()
-        self.rag_service = rag_service
-        self.top_k = top_k
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
+    rag_service: RAGService
+    top_k: int = 5
+    cache_size: int = 1024
+    cache_ttl: float = 300
+    cache_ttl_negative: float = 30  # Consultas sem resultado (erros não entram no cache)
+    
+    _search: Callable[..., Awaitable[List[Dict[str, Any]]]] = PrivateAttr()
+    _cache: "QueryCache" = PrivateAttr()
+    
+    @field_validator("top_k")
+    @classmethod
+    def _validate_top_k(cls, top_k: int) -> int:
+        return cls._clamp_top_k(top_k)
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._search = self.rag_service.search  # Pré-vinculado (caminho quente)
+        self._cache = QueryCache(self.cache_size, self.cache_ttl)
+        self.rag_service.add_change_listener(self.invalidate)
+    
+    def invalidate(self):
+        """Limpa o cache de consultas"""
+        self._cache.clear()
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Estatísticas do cache de consultas (size, hits, misses, evictions)"""
+        return self._cache.stats()
+    
+    @staticmethod
+    def _clamp_top_k(top_k: int) -> int:
+        """Limita top_k a [1, RAG_TOP_K_MAX] (evita trazer milhares de chunks do banco)"""
+        clamped = min(max(1, top_k), config.rag.top_k_max)
+        if clamped != top_k:
+            logger.warning(f"top_k={top_k} fora do limite; usando {clamped}")
+        return clamped
+    
+    def _get_cache_key(self, query: str, top_k: int, filter: Optional[Dict[str, Any]]) -> tuple:
+        """
+        Chave do cache: digest da query normalizada (caixa e espaços) + top_k + filtro
+        
+        Variações triviais da mesma pergunta caem na mesma entrada. Os valores
+        do filtro entram como JSON: 2 e "2" filtram linhas diferentes (containment JSONB).
+        """
+        normalized = " ".join(query.lower().split())
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        filter_key = tuple(sorted(
+            (key, json.dumps(value, sort_keys=True, default=str)) for key, value in filter.items()
+        )) if filter else ()
+        return (digest, top_k, filter_key)
     
     def _get_relevant_documents(
         self,
         query: str,
         *,
-        run_manager: CallbackManagerForRetrieverRun
+        run_manager: CallbackManagerForRetrieverRun,
+        top_k: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Document]:
         """
         Busca documentos relevantes para a query
-        """
-        import asyncio
         
-        try:
-            # Executar busca assíncrona
-            loop = asyncio.get_event_loop()
-            results = loop.run_until_complete(
-                self.rag_service.search(query, top_k=self.top_k)
-            )
-            
-            # Converter para Document do LangChain
-            documents = []
-            for result in results:
-                doc = Document(
-                    page_content=result.get("content", ""),
-                    metadata={
-                        "source": result.get("source", ""),
-                        "document_id": result.get("document_id", ""),
-                        "similarity": result.get("similarity", 0.0)
-                    }
-                )
-                documents.append(doc)
-            
-            return documents
-            
-        except Exception as e:
-            logger.error(f"Erro ao buscar documentos: {e}")
-            return []
+        Delega para a versão assíncrona no loop de background.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._aget_relevant_documents(
+                query,
+                run_manager=run_manager,
+                top_k=top_k,
+                filter=filter,
+                query_embedding=query_embedding
+            ),
+            _get_background_loop()
+        ).result()
     
     async def _aget_relevant_documents(
         self,
         query: str,
         *,
-        run_manager: CallbackManagerForRetrieverRun
+        run_manager: CallbackManagerForRetrieverRun,
+        top_k: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Document]:
         """
-        Versão assíncrona da busca
+        Busca documentos relevantes para a query (implementação principal)
+        
+        Args:
+            query: Texto da consulta
+            top_k: Sobrescreve o top_k do retriever nesta chamada
+            filter: Filtros de metadata aplicados no banco (ex: {"departamento": "TI"})
+            query_embedding: Vetor da query já calculado; também lido de
+                config["metadata"]["query_embedding"] (evita embutir de novo)
         """
+        if not query or not query.strip():
+            return []  # Nada a embutir/buscar
+        
+        top_k = self._clamp_top_k(top_k) if top_k is not None else self.top_k
+        cache_key = self._get_cache_key(query, top_k, filter)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return await self._to_documents(cached)
+        
         try:
-            results = await self.rag_service.search(query, top_k=self.top_k)
+            if query_embedding is None and run_manager is not None:
+                query_embedding = run_manager.metadata.get("query_embedding")
             
-            documents = []
-            for result in results:
-                doc = Document(
-                    page_content=result.get("content", ""),
-                    metadata={
-                        "source": result.get("source", ""),
-                        "document_id": result.get("document_id", ""),
-                        "similarity": result.get("similarity", 0.0)
-                    }
-                )
-                documents.append(doc)
+            results = await self._search(
+                query,
+                top_k=top_k,
+                metadata_filter=filter,
+                raise_errors=True,
+                query_embedding=query_embedding
+            )
+            rows = _results_to_rows(results)
             
-            return documents
+            # Vazio fica menos tempo: a base pode ganhar documentos que respondem
+            self._cache.set(cache_key, rows, None if rows else self.cache_ttl_negative)
+            return await self._to_documents(rows)
             
         except Exception as e:
-            logger.error(f"Erro ao buscar documentos: {e}")
+            logger.error(f"Erro ao buscar documentos: {e}", exc_info=True)
             return []
-
+    
+    @staticmethod
+    async def _to_documents(rows: Tuple[_Row, ...]) -> List[Document]:
+        """Monta os Documents; listas grandes fora do event loop"""
+        if len(rows) >= DOCUMENT_BUILD_THREAD_THRESHOLD:
+            return await asyncio.to_thread(_rows_to_documents, rows)
+        return _rows_to_documents(rows)
+    
+    async def abatch_get_relevant_documents(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Busca várias queries em paralelo (uma lista de documentos por query)
+        
+        Cada query usa o cache individualmente: só as ausentes vão ao banco,
+        e essas são agrupadas pelo micro-batcher do RAGService.
+        """
+        return list(await asyncio.gather(*(
+            self._aget_relevant_documents(query, run_manager=None)
+            for query in queries
+        )))
+    
+    async def astream_documents(
+        self,
+        queries: Union[str, List[str]],
+        *,
+        top_k: Optional[int] = None,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Document]:
+        """
+        Entrega documentos à medida que cada busca termina (recuperação progressiva)
+        
+        Útil com várias formulações da mesma pergunta: os resultados da primeira
+        busca concluída (ou já em cache) saem sem esperar as demais. Chunks
+        repetidos entre buscas são entregues uma única vez.
+        
+        Args:
+            queries: Query ou lista de queries
+            top_k: Sobrescreve o top_k do retriever
+            filter: Filtros de metadata aplicados no banco
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        
+        tasks = [
+            asyncio.ensure_future(
+                self._aget_relevant_documents(query, run_manager=None, top_k=top_k, filter=filter)
+            )
+            for query in queries
+        ]
+        seen = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for document in await next_done:
+                    key = (document.metadata.get("document_id"), document.page_content)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield document
+        finally:
+            # Consumidor parou antes do fim: não deixar buscas órfãs
+            for task in tasks:
+                task.cancel()
+    
+    def batch_get_relevant_documents(self, queries: List[str]) -> List[List[Document]]:
+        """Versão síncrona de abatch_get_relevant_documents (executa no loop de background)"""
+        return asyncio.run_coroutine_threadsafe(
+            self.abatch_get_relevant_documents(queries),
+            _get_background_loop()
+        ).result()
@@ -0,0 +1,83 @@
+"""
+Encoder de sentenças via ONNX Runtime (modelo exportado e quantizado em int8)
+Substitui o SentenceTransformer (PyTorch FP32) no provedor local de embeddings
+"""
+import logging
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Arquivo gerado por scripts/export_onnx_embeddings.py
+ONNX_QUANTIZED_FILE = "model-int8.onnx"
+
+# Mesmo limite de tokens do SentenceTransformer para o MiniLM
+ONNX_MAX_SEQ_LENGTH = 128
+
+
+class OnnxSentenceEncoder:
+    """
+    Encoder com a mesma interface de `SentenceTransformer.encode`
+    
+    Aplica mean pooling sobre o last_hidden_state (como o pipeline do
+    paraphrase-multilingual-MiniLM-L12-v2), então os vetores são compatíveis
+    com os gerados pelo modelo original.
+    """
+    
+    def __init__(self, model_dir: str):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        
+        model_path = Path(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_path,
+            file_name=ONNX_QUANTIZED_FILE,
+            provider="CPUExecutionProvider"
+        )
+        logger.info(f"Modelo de embeddings ONNX carregado de {model_path}")
+    
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        """
+        Gera embeddings (um vetor para str, matriz para lista)
+        
+        Args:
+            sentences: Texto ou lista de textos
+            batch_size: Textos por execução do modelo
+            convert_to_numpy: Mantido por compatibilidade (sempre retorna numpy)
+            normalize_embeddings: Normaliza os vetores (norma L2 unitária)
+            show_progress_bar: Mantido por compatibilidade (ignorado)
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            hidden = np.asarray(self.model(**inputs).last_hidden_state)
+            
+            # Mean pooling ignorando padding
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            summed = (hidden * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(summed / counts)
+        
+        embeddings = np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
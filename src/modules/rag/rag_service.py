@@ -2,21 +2,201 @@
 Serviço RAG - Busca e recuperação de informações da base de conhecimento
 """
 import logging
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, AsyncIterator, Callable, Tuple, TypeVar
 import asyncio
+import inspect
 import json
 import uuid
+import weakref
+from functools import lru_cache
 
+from psycopg2.extras import execute_values
 from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import numpy as np
 
+try:
+    import orjson  # Serialização rápida dos vetores enviados ao banco (opcional)
+except ImportError:
+    orjson = None
+
 from src.config.config import config
 from src.modules.rag.embedding_service import EmbeddingService
 from src.modules.rag.document_processor import DocumentProcessor
+from src.modules.rag.semantic_cache import SemanticSearchCache
+from src.utils.redis_client import redis_client
+from src.utils.ttl_cache import TTLCache
+from src.utils.batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def _json_dumps(value: Any) -> str:
+    """JSON compacto; arrays numpy são serializados direto (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(value, separators=(",", ":"), default=lambda array: array.tolist())
+
+
+def unit_vector(embedding: Any) -> np.ndarray:
+    """
+    Embedding em float32 com norma L2 unitária
+    
+    Com vetores unitários o produto interno é o cosseno: o índice usa
+    *_ip_ops (`<#>`), sem calcular as normas a cada distância.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def vector_literal(embedding: Any) -> str:
+    """
+    Embedding (normalizado) no formato texto do pgvector ('[x,y,...]')
+    
+    Em float32, a precisão que o pgvector armazena: menos dígitos por valor
+    (payload ~40% menor) e nenhuma conversão float -> str em Python com orjson.
+    """
+    return _json_dumps(unit_vector(embedding))
+
+# Tipo da coluna de embeddings: halfvec (FP16, metade do espaço e da banda de
+# memória do HNSW; requer pgvector >= 0.7) ou vector (FP32)
+VECTOR_TYPE = config.rag.vector_type
+if VECTOR_TYPE not in ("halfvec", "vector"):
+    raise ValueError(f"RAG_VECTOR_TYPE inválido: {VECTOR_TYPE} (use halfvec ou vector)")
+EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_COLUMN_TYPE = f"{VECTOR_TYPE}({EMBEDDING_DIMENSIONS})"
+
+# Embeddings gravados normalizados: similaridade por produto interno (= cosseno)
+EMBEDDING_OPCLASS = f"{VECTOR_TYPE}_ip_ops"
+
+# Quantização binária (opcional): um bit por dimensão (sinal), índice HNSW por
+# distância de Hamming ~32x menor que o de halfvec/vector. Os candidatos do
+# índice binário são reordenados pelo embedding completo
+BINARY_QUANTIZATION = config.rag.binary_quantization
+BINARY_QUANTIZED_EMBEDDING = f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS}))"
+
+# Parâmetros do HNSW por volume de chunks: (até N linhas, m, ef_construction).
+# Grafos mais densos/builds mais largos melhoram o recall em bases grandes
+HNSW_PARAMS_BY_ROWS = (
+    (100_000, 16, 64),
+    (1_000_000, 24, 100),
+    (None, 32, 128)
+)
+
+
+def hnsw_params(row_count: int) -> Tuple[int, int]:
+    """Retorna (m, ef_construction) para o número de chunks indexados"""
+    for max_rows, m, ef_construction in HNSW_PARAMS_BY_ROWS:
+        if max_rows is None or row_count <= max_rows:
+            return m, ef_construction
+
+
+def hnsw_index_statements(row_count: int, if_not_exists: bool = False) -> List[str]:
+    """
+    SQL de criação do índice HNSW de document_chunks (rodar em uma transação)
+    
+    A memória e os workers do build valem só para a transação (SET LOCAL).
+    """
+    m, ef_construction = hnsw_params(row_count)
+    return [
+        f"SET LOCAL maintenance_work_mem = '{config.rag.hnsw_maintenance_work_mem}'",
+        f"SET LOCAL max_parallel_maintenance_workers = {int(config.rag.hnsw_build_workers)}",
+        f"""
+        CREATE INDEX {"IF NOT EXISTS " if if_not_exists else ""}document_chunks_embedding_idx 
+        ON document_chunks 
+        USING hnsw (embedding {EMBEDDING_OPCLASS})
+        WITH (m = {m}, ef_construction = {ef_construction})
+        """
+    ]
+
+
+def binary_index_statements(row_count: int) -> List[str]:
+    """SQL de criação do índice HNSW binário (RAG_BINARY_QUANTIZATION), se ainda não existir"""
+    m, ef_construction = hnsw_params(row_count)
+    return [
+        f"SET LOCAL maintenance_work_mem = '{config.rag.hnsw_maintenance_work_mem}'",
+        f"SET LOCAL max_parallel_maintenance_workers = {int(config.rag.hnsw_build_workers)}",
+        f"""
+        CREATE INDEX IF NOT EXISTS document_chunks_embedding_bq_idx 
+        ON document_chunks 
+        USING hnsw ({BINARY_QUANTIZED_EMBEDDING} bit_hamming_ops)
+        WITH (m = {m}, ef_construction = {ef_construction})
+        """
+    ]
+
+
+def migrate_embedding_column(conn) -> bool:
+    """
+    Converte document_chunks.embedding para EMBEDDING_COLUMN_TYPE e o índice
+    HNSW para EMBEDDING_OPCLASS, se preciso
+    
+    Remove o índice HNSW (a classe de operadores depende do tipo), altera a
+    coluna e recria o índice. Um advisory lock evita que vários workers
+    migrem ao mesmo tempo. Faz commit da transação de `conn`.
+    
+    Returns:
+        True se a coluna ou o índice foram convertidos
+    """
+    current_state_sql = text("""
+        SELECT
+            (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+             WHERE attrelid = to_regclass('document_chunks') AND attname = 'embedding'),
+            (SELECT opc.opcname FROM pg_index i JOIN pg_opclass opc ON opc.oid = i.indclass[0]
+             WHERE i.indexrelid = to_regclass('document_chunks_embedding_idx'))
+    """)
+    
+    def up_to_date(column_type, opclass) -> bool:
+        # Tabela/índice ainda inexistentes são criados já no formato atual
+        return column_type in (None, EMBEDDING_COLUMN_TYPE) and opclass in (None, EMBEDDING_OPCLASS)
+    
+    if up_to_date(*conn.execute(current_state_sql).one()):
+        conn.commit()
+        return False
+    
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('document_chunks_embedding_migration'))"))
+    current_type, current_opclass = conn.execute(current_state_sql).one()
+    if up_to_date(current_type, current_opclass):  # Outro worker já migrou
+        conn.commit()
+        return False
+    
+    row_count = conn.execute(text("SELECT COUNT(*) FROM document_chunks")).scalar()
+    conn.execute(text("DROP INDEX IF EXISTS document_chunks_embedding_idx"))
+    if current_type != EMBEDDING_COLUMN_TYPE:
+        logger.warning(f"Convertendo document_chunks.embedding de {current_type} para {EMBEDDING_COLUMN_TYPE} (recria o índice HNSW)")
+        conn.execute(text(
+            f"ALTER TABLE document_chunks ALTER COLUMN embedding TYPE {EMBEDDING_COLUMN_TYPE} "
+            f"USING embedding::{EMBEDDING_COLUMN_TYPE}"
+        ))
+    else:
+        logger.warning(f"Recriando o índice HNSW com {EMBEDDING_OPCLASS} (era {current_opclass})")
+    for statement in hnsw_index_statements(row_count):
+        conn.execute(text(statement))
+    conn.commit()
+    logger.info(f"Embeddings migrados ({row_count} chunks)")
+    return True
+
+
+# Cache Redis da lista de campos de metadata (invalidado em create/delete)
+METADATA_FIELDS_CACHE_KEY = "rag:metadata:fields"
+METADATA_FIELDS_CACHE_TTL = 300
+
+# Cópia local (por processo) da lista de campos: evita ir ao Redis/banco a cada
+# documento indexado. Invalidada localmente em create/delete; nos outros workers
+# expira por TTL
+METADATA_FIELDS_LOCAL_CACHE_TTL = 60
+
+# Chunks por chamada ao provedor de embeddings na indexação de documentos
+INGEST_EMBED_BATCH_SIZE = 256
+
+# Buscas com filtro de metadata avaliam mais candidatos no HNSW (filtrados depois do índice)
+FILTERED_EF_SEARCH_FACTOR = 3
+
+# Limite do pgvector para hnsw.ef_search
+HNSW_EF_SEARCH_MAX = 1000
+
 
 class RAGService:
     """
@@ -27,8 +207,55 @@ class RAGService:
     def __init__(self):
         self.embedding_service = EmbeddingService()
         self.document_processor = DocumentProcessor()
+        self._cache_available: Optional[bool] = None
+        self._metadata_fields_cache = TTLCache(1, METADATA_FIELDS_LOCAL_CACHE_TTL)
+        # Chamados quando o conteúdo indexado muda (ex: caches de consulta dos retrievers)
+        # Referências fracas: retrievers criados por requisição não ficam presos ao serviço
+        self._change_listeners: List[Callable[[], Optional[Callable[[], None]]]] = []
+        # Resultados de consultas recentes por similaridade do embedding (0 desativa)
+        self._semantic_cache = (
+            SemanticSearchCache(
+                config.rag.semantic_cache_size,
+                threshold=config.rag.semantic_cache_threshold,
+                ttl=config.rag.semantic_cache_ttl
+            )
+            if config.rag.semantic_cache_size > 0 else None
+        )
+        self._search_batcher = self._create_search_batcher()
         self._initialize_database()
     
+    def add_change_listener(self, listener: Callable[[], None]):
+        """
+        Registra callback chamado após inserir/remover documentos ou alterar metadata
+        
+        Métodos são guardados por referência fraca (saem sozinhos quando o
+        objeto é coletado); funções, por referência forte.
+        """
+        if inspect.ismethod(listener):
+            self._change_listeners.append(weakref.WeakMethod(listener))
+        else:
+            self._change_listeners.append(lambda: listener)
+    
+    def remove_change_listener(self, listener: Callable[[], None]):
+        """Remove um callback registrado com add_change_listener"""
+        self._change_listeners = [ref for ref in self._change_listeners if ref() != listener]
+    
+    def _notify_change(self):
+        """Avisa os listeners de que o conteúdo indexado mudou"""
+        if self._semantic_cache:
+            self._semantic_cache.clear()
+        alive = []
+        for ref in self._change_listeners:
+            listener = ref()
+            if listener is None:
+                continue
+            alive.append(ref)
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Erro ao notificar alteração da base de conhecimento: {e}")
+        self._change_listeners = alive
+    
     def _initialize_database(self):
         """Inicializa conexão com PostgreSQL e cria extensão PGVector se necessário"""
         try:
@@ -59,7 +286,20 @@ class RAGService:
                     database = os.getenv("POSTGRES_DB", "agente_db")
                     conn_str = f"postgresql://{user}:{password}@{host}:{port}/{database}"
             
-            self.engine = create_engine(conn_str)
+            # Timeout por statement definido na conexão: consultas presas não seguram o pool
+            connect_args = {}
+            if config.database.statement_timeout_ms > 0:
+                connect_args["options"] = f"-c statement_timeout={int(config.database.statement_timeout_ms)}"
+            
+            self.engine = create_engine(
+                conn_str,
+                pool_size=config.database.pool_size,
+                max_overflow=config.database.max_overflow,
+                pool_recycle=config.database.pool_recycle,
+                # executemany de UPDATE/DELETE em lotes (execute_batch), não linha a linha
+                executemany_mode="values_plus_batch",
+                connect_args=connect_args
+            )
             self.SessionLocal = sessionmaker(bind=self.engine)
             
             # Testar conexão
@@ -103,15 +343,74 @@ class RAGService:
             logger.error(f"Erro ao inicializar banco de dados: {e}")
             raise
     
+    def warm_up_pool(self) -> int:
+        """
+        Abre antecipadamente as conexões do pool (pool_size)
+        
+        Evita que as primeiras requisições concorrentes paguem o custo de conexão.
+        
+        Returns:
+            Número de conexões abertas
+        """
+        connections = []
+        try:
+            for _ in range(config.database.pool_size):
+                conn = self.engine.connect()
+                connections.append(conn)
+                conn.execute(text("SELECT 1"))
+        finally:
+            # Devolver ao pool (permanecem abertas)
+            for conn in connections:
+                conn.close()
+        logger.info(f"Pool do PostgreSQL aquecido com {len(connections)} conexões")
+        return len(connections)
+    
+    async def _get_cache(self):
+        """Retorna cliente Redis para cache ou None se indisponível (tenta conectar uma vez)"""
+        if redis_client._client:
+            return redis_client
+        if self._cache_available is None:
+            try:
+                await redis_client.connect()
+                self._cache_available = True
+                return redis_client
+            except Exception as e:
+                logger.warning(f"Redis indisponível para cache do RAG: {e}. Continuando sem cache.")
+                self._cache_available = False
+        return None
+    
+    async def _invalidate_metadata_fields_cache(self):
+        """Remove lista de campos de metadata do cache"""
+        self._metadata_fields_cache.pop(METADATA_FIELDS_CACHE_KEY)
+        cache = await self._get_cache()
+        if cache:
+            await cache.delete(METADATA_FIELDS_CACHE_KEY)
+    
+    async def _run_in_session(self, fn: Callable[[Session], T]) -> T:
+        """
+        Executa fn(session) em uma thread, fora do event loop
+        
+        As consultas usam o driver síncrono (psycopg2); rodar em thread libera o
+        loop para outras requisições enquanto a conexão do pool espera o banco.
+        """
+        def run():
+            session = self.SessionLocal()
+            try:
+                return fn(session)
+            finally:
+                session.close()
+        
+        return await asyncio.to_thread(run)
+    
     def _create_tables(self):
         """Cria tabelas necessárias para armazenar documentos vetorizados"""
-        create_table_sql = """
+        create_table_sql = f"""
         CREATE TABLE IF NOT EXISTS document_chunks (
             id SERIAL PRIMARY KEY,
             document_id VARCHAR(255) NOT NULL,
             chunk_index INTEGER NOT NULL,
             content TEXT NOT NULL,
-            embedding vector(1536),
+            embedding {EMBEDDING_COLUMN_TYPE},
             metadata JSONB,
             source VARCHAR(500),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -128,21 +427,57 @@ class RAGService:
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         
-        CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx 
-        ON document_chunks 
-        USING hnsw (embedding vector_cosine_ops)
-        WITH (m = 16, ef_construction = 64);
-        
         CREATE INDEX IF NOT EXISTS document_chunks_document_id_idx 
         ON document_chunks(document_id);
         
         CREATE INDEX IF NOT EXISTS rag_metadata_fields_key_idx 
         ON rag_metadata_fields(field_key);
+        
+        -- Filtros de metadata por containment (metadata @> filtro)
+        CREATE INDEX IF NOT EXISTS document_chunks_metadata_gin 
+        ON document_chunks USING GIN (metadata jsonb_path_ops);
         """
         
         with self.engine.connect() as conn:
+            # DDL, migração e build de índices podem passar do statement_timeout das requisições
+            conn.execute(text("SET statement_timeout = 0"))
             conn.execute(text(create_table_sql))
             conn.commit()
+            
+            # Tabelas criadas com outro tipo de vetor são convertidas (uma vez)
+            migrate_embedding_column(conn)
+            
+            # Índice vetorial: parâmetros escolhidos pelo volume atual (estimativa do planner)
+            row_count = conn.execute(text("""
+                SELECT GREATEST(reltuples, 0)::bigint FROM pg_class
+                WHERE oid = to_regclass('document_chunks')
+            """)).scalar() or 0
+            for statement in hnsw_index_statements(row_count, if_not_exists=True):
+                conn.execute(text(statement))
+            conn.commit()
+            
+            # Índice binário só existe com a quantização ligada (cada índice custa nas escritas)
+            if BINARY_QUANTIZATION:
+                for statement in binary_index_statements(row_count):
+                    conn.execute(text(statement))
+            else:
+                conn.execute(text("DROP INDEX IF EXISTS document_chunks_embedding_bq_idx"))
+            conn.commit()
+            
+            # Volta ao limite configurado antes de devolver a conexão ao pool
+            conn.execute(text("RESET statement_timeout"))
+            conn.commit()
+    
+    _BULK_INSERT_CHUNKS_SQL = """
+        INSERT INTO document_chunks 
+        (document_id, chunk_index, content, embedding, metadata, source)
+        VALUES %s
+        ON CONFLICT (document_id, chunk_index) 
+        DO UPDATE SET 
+            content = EXCLUDED.content,
+            embedding = EXCLUDED.embedding,
+            metadata = EXCLUDED.metadata
+    """
     
     async def add_document(
         self,
@@ -164,106 +499,296 @@ class RAGService:
             ID do documento adicionado
         """
         try:
-            # Processar documento em chunks
-            chunks = await self.document_processor.process_document(file_path)
-            
             if not document_id:
                 document_id = str(uuid.uuid4())
             
-            # Obter todos os campos de metadata disponíveis
-            try:
-                available_fields = await self.list_metadata_fields()
-                field_keys = {field["field_key"] for field in available_fields if field and isinstance(field, dict) and "field_key" in field}
-            except Exception as e:
-                logger.warning(f"Erro ao listar campos de metadata: {e}. Continuando sem campos de metadata.")
-                field_keys = set()
-            
-            # Preparar metadata final: incluir selected_metadata e garantir que todos os campos disponíveis estejam presentes
-            final_metadata = {}
-            
-            # Adicionar campos de metadata disponíveis
-            for field_key in field_keys:
-                if selected_metadata and isinstance(selected_metadata, dict) and field_key in selected_metadata:
-                    final_metadata[field_key] = selected_metadata[field_key]
-                else:
-                    final_metadata[field_key] = None  # null se não selecionado
+            # Campos de metadata buscados enquanto o arquivo é lido e dividido em chunks
+            fields_task = asyncio.create_task(self.list_metadata_fields())
+            field_keys: Optional[set] = None
+            # Metadata final: selected_metadata + todos os campos disponíveis presentes
+            final_metadata: Dict[str, Any] = {}
             
-            # Adicionar metadata adicional (chunk_index, document_id, etc.)
-            if metadata:
-                final_metadata.update(metadata)
+            async def resolve_metadata():
+                """Metadata comum a todos os chunks (na primeira vez que um lote é gravado)"""
+                nonlocal field_keys
+                # Obter todos os campos de metadata disponíveis
+                try:
+                    available_fields = await fields_task
+                    field_keys = {field["field_key"] for field in available_fields if field and isinstance(field, dict) and "field_key" in field}
+                except Exception as e:
+                    logger.warning(f"Erro ao listar campos de metadata: {e}. Continuando sem campos de metadata.")
+                    field_keys = set()
+                
+                # Adicionar campos de metadata disponíveis
+                for field_key in field_keys:
+                    if selected_metadata and isinstance(selected_metadata, dict) and field_key in selected_metadata:
+                        final_metadata[field_key] = selected_metadata[field_key]
+                    else:
+                        final_metadata[field_key] = None  # null se não selecionado
+                
+                # Adicionar metadata adicional (chunk_index, document_id, etc.)
+                if metadata:
+                    final_metadata.update(metadata)
             
-            # Gerar embeddings para cada chunk
+            # Processar documento em chunks (gerados conforme o arquivo é lido);
+            # embeddings gerados em lotes (uma chamada ao provedor por lote).
+            # Pipeline: o INSERT de um lote roda enquanto o próximo é lido e embedado
             session = self.SessionLocal()
+            insert_task: Optional[asyncio.Future] = None
             try:
-                for i, chunk in enumerate(chunks):
-                    # Gerar embedding
-                    embedding = await self.embedding_service.embed_text(chunk["content"])
-                    
-                    # Converter para formato PostgreSQL
-                    embedding_str = "[" + ",".join(map(str, embedding)) + "]"
-                    
-                    # Inserir no banco
-                    # Usar bindparam para garantir que os tipos sejam tratados corretamente
-                    from sqlalchemy import bindparam
-                    
-                    chunk_metadata = {
-                        **final_metadata,
-                        "chunk_index": i,
-                        "document_id": document_id
-                    }
-                    
-                    # Garantir que todos os campos de metadata disponíveis estejam no chunk_metadata
-                    for field_key in field_keys:
-                        if field_key not in chunk_metadata:
-                            chunk_metadata[field_key] = None
+                chunk_count = 0
+                
+                def insert_rows(rows: List[tuple]):
+                    # Lote inteiro em um único INSERT multi-VALUES (um round-trip),
+                    # na mesma transação da sessão
+                    with session.connection().connection.cursor() as cursor:
+                        execute_values(
+                            cursor,
+                            self._BULK_INSERT_CHUNKS_SQL,
+                            rows,
+                            template=f"(%s, %s, %s, CAST(%s AS {VECTOR_TYPE}), CAST(%s AS jsonb), %s)",
+                            page_size=len(rows)
+                        )
+                
+                async def store_batch(batch: List[Dict[str, Any]]):
+                    nonlocal chunk_count, insert_task
+                    embeddings = await self.embedding_service.embed_batch([chunk["content"] for chunk in batch])
+                    if field_keys is None:
+                        await resolve_metadata()
                     
-                    # Usar SQL direto com placeholders do psycopg2
-                    insert_sql = text("""
-                        INSERT INTO document_chunks 
-                        (document_id, chunk_index, content, embedding, metadata, source)
-                        VALUES (:doc_id, :chunk_idx, :content, CAST(:embedding AS vector), CAST(:metadata AS jsonb), :source)
-                        ON CONFLICT (document_id, chunk_index) 
-                        DO UPDATE SET 
-                            content = EXCLUDED.content,
-                            embedding = EXCLUDED.embedding,
-                            metadata = EXCLUDED.metadata
-                    """)
+                    rows = []
+                    for chunk, embedding in zip(batch, embeddings):
+                        i = chunk_count
+                        chunk_count += 1
+                        
+                        chunk_metadata = {
+                            **final_metadata,
+                            "chunk_index": i,
+                            "document_id": document_id
+                        }
+                        
+                        # Garantir que todos os campos de metadata disponíveis estejam no chunk_metadata
+                        for field_key in field_keys:
+                            if field_key not in chunk_metadata:
+                                chunk_metadata[field_key] = None
+                        
+                        rows.append((
+                            document_id,
+                            i,
+                            chunk["content"],
+                            vector_literal(embedding),
+                            json.dumps(chunk_metadata),
+                            chunk.get("source", file_path)
+                        ))
                     
-                    session.execute(insert_sql, {
-                        "doc_id": document_id,
-                        "chunk_idx": i,
-                        "content": chunk["content"],
-                        "embedding": embedding_str,
-                        "metadata": json.dumps(chunk_metadata),
-                        "source": chunk.get("source", file_path)
-                    })
+                    # Um INSERT por vez na sessão: o lote anterior termina antes deste começar
+                    if insert_task is not None:
+                        await insert_task
+                    insert_task = asyncio.ensure_future(asyncio.to_thread(insert_rows, rows))
                 
-                session.commit()
-                logger.info(f"Documento {document_id} adicionado com {len(chunks)} chunks")
+                batch: List[Dict[str, Any]] = []
+                async for chunk in self.document_processor.process_document(file_path):
+                    batch.append(chunk)
+                    if len(batch) >= INGEST_EMBED_BATCH_SIZE:
+                        await store_batch(batch)
+                        batch = []
+                if batch:
+                    await store_batch(batch)
+                if insert_task is not None:
+                    await insert_task
+                
+                await asyncio.to_thread(session.commit)
+                self._notify_change()
+                logger.info(f"Documento {document_id} adicionado com {chunk_count} chunks")
                 return document_id
                 
             finally:
+                fields_task.cancel()
+                # Em caso de erro, a thread do INSERT ainda pode estar usando a sessão
+                if insert_task is not None and not insert_task.done():
+                    await asyncio.gather(insert_task, return_exceptions=True)
                 session.close()
                 
         except Exception as e:
             logger.error(f"Erro ao adicionar documento: {e}", exc_info=True)
             raise
     
+    def _create_search_batcher(self) -> MicroBatcher:
+        """Agrupa buscas concorrentes (um embedding em lote + uma query vetorial)"""
+        return MicroBatcher(
+            self._batched_search,
+            max_batch_size=config.rag.search_batch_max_size,
+            max_wait=config.rag.search_batch_wait_ms / 1000
+        )
+    
+    # Candidatos de cada busca: a tabela inteira (HNSW do embedding) ou, com quantização
+    # binária, os top_k * fator mais próximos pelo índice de bits (reordenados abaixo)
+    _SEARCH_CANDIDATES_SQL = f"""(
+                SELECT content, metadata, source, document_id, embedding
+                FROM document_chunks
+                WHERE metadata @> q.filter
+                ORDER BY {BINARY_QUANTIZED_EMBEDDING} <~> binary_quantize(CAST(q.query_embedding AS {VECTOR_TYPE}))
+                LIMIT q.top_k * {int(config.rag.binary_rerank_factor)}
+            ) candidates""" if BINARY_QUANTIZATION else "document_chunks"
+    
+    # Uma linha por busca do lote; cada uma faz sua própria varredura vetorial (LATERAL).
+    # Filtro de metadata por containment (índice GIN): o chunk deve ter todos os pares de q.filter.
+    _BATCH_SEARCH_SQL = text(f"""
+        SELECT
+            q.idx,
+            c.content,
+            c.metadata,
+            c.source,
+            c.document_id,
+            c.similarity
+        FROM jsonb_to_recordset(CAST(:requests AS jsonb))
+            AS q(idx int, query_embedding text, threshold float8, top_k int, filter jsonb)
+        CROSS JOIN LATERAL (
+            SELECT
+                content,
+                metadata,
+                source,
+                document_id,
+                -(embedding <#> CAST(q.query_embedding AS {VECTOR_TYPE})) as similarity
+            FROM {_SEARCH_CANDIDATES_SQL}
+            WHERE -(embedding <#> CAST(q.query_embedding AS {VECTOR_TYPE})) >= q.threshold
+              AND metadata @> q.filter
+            ORDER BY embedding <#> CAST(q.query_embedding AS {VECTOR_TYPE})
+            LIMIT q.top_k
+        ) c
+        ORDER BY q.idx, c.similarity DESC
+    """)
+    
+    @staticmethod
+    def _filter_cache_key(filters: Tuple[Tuple[str, Any], ...]) -> Tuple[Tuple[str, str], ...]:
+        """
+        Filtros como chave de cache: pares ordenados com o valor em JSON
+        
+        O containment JSONB diferencia tipos (True != 1, 2 != "2"), ao contrário
+        do == do Python; a ordem das chaves não importa.
+        """
+        return tuple(sorted(
+            (field_key, json.dumps(field_value, sort_keys=True, default=str))
+            for field_key, field_value in filters
+        ))
+    
+    async def _batched_search(self, requests: List[tuple]) -> List[List[Dict[str, Any]]]:
+        """
+        Executa um lote de buscas: (query, top_k, threshold, filtros, embedding) por item
+        
+        Returns:
+            Lista de resultados na mesma ordem das requisições
+        """
+        # Embeddings das queries sem vetor pré-calculado em uma única chamada.
+        # Espaços normalizados: variações da mesma pergunta caem na mesma entrada
+        # do cache de embeddings (LRU + disco, compartilhado entre workers)
+        texts = [" ".join(query.split()) for query, _, _, _, embedding in requests if embedding is None]
+        computed = iter(await self.embedding_service.embed_batch(texts) if texts else [])
+        embeddings = [
+            embedding if embedding is not None else next(computed)
+            for _, _, _, _, embedding in requests
+        ]
+        
+        results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        
+        # Paráfrases de consultas recentes (mesmos parâmetros) não vão ao banco
+        cache_params = (
+            [
+                (top_k, threshold, self._filter_cache_key(filters))
+                for _, top_k, threshold, filters, _ in requests
+            ]
+            if self._semantic_cache else []
+        )
+        cached = (
+            self._semantic_cache.get_many(embeddings, cache_params)
+            if self._semantic_cache else [None] * len(requests)
+        )
+        pending = []
+        for idx, hit in enumerate(cached):
+            if hit is not None:
+                results[idx] = hit
+            else:
+                pending.append(idx)
+        if not pending:
+            return results
+        
+        payload = [
+            {
+                "idx": idx,
+                # Array JSON: o recordset entrega como texto '[x, y, ...]', aceito pelo pgvector.
+                # Normalizado como os chunks: `<#>` (produto interno negativo) = -cosseno
+                "query_embedding": unit_vector(embeddings[idx]),
+                "threshold": requests[idx][2],
+                "top_k": requests[idx][1],
+                "filter": dict(requests[idx][3])
+            }
+            for idx in pending
+        ]
+        
+        # Candidatos avaliados pelo HNSW: precisa cobrir o maior top_k do lote.
+        # Com filtro, parte dos candidatos é descartada depois do índice: avalia mais
+        has_filter = any(requests[idx][3] for idx in pending)
+        max_top_k = max(requests[idx][1] for idx in pending)
+        ef_search = max(config.rag.ef_search, max_top_k * 4)
+        if BINARY_QUANTIZATION:
+            # O índice binário precisa entregar todos os candidatos do reranking
+            ef_search = max(ef_search, max_top_k * config.rag.binary_rerank_factor)
+        if has_filter:
+            ef_search *= FILTERED_EF_SEARCH_FACTOR
+        ef_search = min(ef_search, HNSW_EF_SEARCH_MAX)
+        
+        def run_query(session):
+            if not has_filter:
+                # Sem filtro só o HNSW interessa: o planner não troca por bitmap scan.
+                # Com filtro, o GIN de metadata (bitmap) fica disponível para filtros
+                # seletivos; vale só para esta transação
+                session.execute(text("SET LOCAL enable_bitmapscan = off"))
+            # Equivale a SET LOCAL hnsw.ef_search (SET não aceita parâmetros)
+            session.execute(text("SELECT set_config('hnsw.ef_search', :ef_search, true)"), {"ef_search": str(ef_search)})
+            return session.execute(self._BATCH_SEARCH_SQL, {"requests": _json_dumps(payload)}).fetchall()
+        
+        rows = await self._run_in_session(run_query)
+        
+        # Desempacotamento posicional (mesma ordem do SELECT): evita o acesso por nome do Row
+        for idx, content, metadata, source, document_id, similarity in rows:
+            results[idx].append({
+                "content": content,
+                "source": source,
+                "document_id": document_id,
+                "similarity": float(similarity),
+                "metadata": metadata
+            })
+        
+        if self._semantic_cache:
+            for idx in pending:
+                self._semantic_cache.put(embeddings[idx], cache_params[idx], results[idx])
+        
+        if len(requests) > 1:
+            logger.debug(f"Busca RAG em lote: {len(requests)} consultas")
+        return results
+    
     async def search(
         self,
         query: str,
         top_k: Optional[int] = None,
         similarity_threshold: Optional[float] = None,
-        metadata_filter: Optional[Dict[str, Any]] = None
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        raise_errors: bool = False,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Busca documentos relevantes para uma consulta
         
+        Buscas concorrentes (vários usuários/steps) são agrupadas pelo
+        micro-batcher em uma chamada de embedding e uma query vetorial.
+        
         Args:
             query: Texto da consulta
             top_k: Número de resultados a retornar
             similarity_threshold: Limite mínimo de similaridade
             metadata_filter: Filtros de metadata (ex: {"departamento": "TI"})
+            raise_errors: Propaga exceções em vez de retornar [] (distingue erro de vazio)
+            query_embedding: Vetor da query já calculado (pula o modelo de embeddings)
             
         Returns:
             Lista de documentos relevantes com conteúdo e metadados
@@ -272,67 +797,46 @@ class RAGService:
             top_k = top_k or config.rag.top_k
             similarity_threshold = similarity_threshold or config.rag.similarity_threshold
             
-            # Gerar embedding da query
-            query_embedding = await self.embedding_service.embed_text(query)
-            embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+            # Filtros por containment: valor comparado com o tipo JSON (None é ignorado)
+            filters = tuple(
+                (field_key, field_value)
+                for field_key, field_value in (metadata_filter or {}).items()
+                if field_value is not None
+            )
             
-            # Construir filtros de metadata na query SQL
-            metadata_conditions = []
-            query_params = {
-                "query_embedding": embedding_str,
-                "threshold": similarity_threshold,
-                "top_k": top_k
-            }
-            
-            if metadata_filter:
-                for idx, (field_key, field_value) in enumerate(metadata_filter.items()):
-                    if field_value is not None:  # Ignorar valores None
-                        param_name = f"metadata_value_{idx}"
-                        # Filtrar usando JSONB: metadata->>'field_key' = value
-                        metadata_conditions.append(f"metadata->>'{field_key}' = :{param_name}")
-                        query_params[param_name] = str(field_value)
-            
-            # Construir WHERE clause
-            where_clauses = ["1 - (embedding <=> CAST(:query_embedding AS vector)) >= :threshold"]
-            where_clauses.extend(metadata_conditions)
-            where_clause = " AND ".join(where_clauses)
-            
-            # Buscar chunks similares usando cosine similarity
-            # Usar CAST para converter string para vector
-            search_sql = text(f"""
-                SELECT 
-                    content,
-                    metadata,
-                    source,
-                    document_id,
-                    1 - (embedding <=> CAST(:query_embedding AS vector)) as similarity
-                FROM document_chunks
-                WHERE {where_clause}
-                ORDER BY embedding <=> CAST(:query_embedding AS vector)
-                LIMIT :top_k
-            """)
-            
-            session = self.SessionLocal()
-            try:
-                results = session.execute(search_sql, query_params).fetchall()
-                
-                return [
-                    {
-                        "content": row.content,
-                        "source": row.source,
-                        "document_id": row.document_id,
-                        "similarity": float(row.similarity),
-                        "metadata": row.metadata
-                    }
-                    for row in results
-                ]
-            finally:
-                session.close()
+            return await self._search_batcher.load((query, top_k, similarity_threshold, filters, query_embedding))
                 
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"Erro ao buscar documentos: {e}", exc_info=True)
             return []
     
+    _LIST_DOCUMENTS_SQL = text("""
+        SELECT 
+            document_id,
+            COUNT(*) as chunk_count,
+            MIN(created_at) as created_at,
+            MAX(created_at) as updated_at,
+            MAX(source) as source,
+            MAX(metadata->>'original_filename') as filename
+        FROM document_chunks
+        GROUP BY document_id
+        ORDER BY created_at DESC
+    """)
+    
+    @staticmethod
+    def _document_row_to_dict(row) -> Dict[str, Any]:
+        """Converte linha agregada de documento no formato retornado pela API"""
+        return {
+            "document_id": row.document_id,
+            "chunk_count": row.chunk_count,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            "source": row.source,
+            "filename": row.filename or "N/A"
+        }
+    
     async def list_documents(self) -> List[Dict[str, Any]]:
         """
         Lista todos os documentos na base de conhecimento
@@ -341,42 +845,48 @@ class RAGService:
             Lista de documentos com informações agregadas
         """
         try:
-            session = self.SessionLocal()
-            try:
-                list_sql = text("""
-                    SELECT 
-                        document_id,
-                        COUNT(*) as chunk_count,
-                        MIN(created_at) as created_at,
-                        MAX(created_at) as updated_at,
-                        MAX(source) as source,
-                        MAX(metadata->>'original_filename') as filename
-                    FROM document_chunks
-                    GROUP BY document_id
-                    ORDER BY created_at DESC
-                """)
-                
-                results = session.execute(list_sql).fetchall()
-                
-                documents = []
-                for row in results:
-                    documents.append({
-                        "document_id": row.document_id,
-                        "chunk_count": row.chunk_count,
-                        "created_at": row.created_at.isoformat() if row.created_at else None,
-                        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
-                        "source": row.source,
-                        "filename": row.filename or "N/A"
-                    })
-                
-                return documents
-            finally:
-                session.close()
+            def run(session):
+                results = session.execute(self._LIST_DOCUMENTS_SQL)
+                return [self._document_row_to_dict(row) for row in results]
+            
+            return await self._run_in_session(run)
         except Exception as e:
             logger.error(f"Erro ao listar documentos: {e}", exc_info=True)
             raise
     
-    async def delete_document(self, document_id: str) -> bool:
+    async def stream_documents(self, batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera sobre os documentos sem carregar a lista completa em memória
+        
+        Usa cursor no servidor (stream_results), buscando batch_size linhas por vez.
+        
+        Args:
+            batch_size: Número de linhas buscadas por vez
+            
+        Yields:
+            Documentos no mesmo formato de list_documents
+        """
+        session = self.SessionLocal()
+        try:
+            result = await asyncio.to_thread(
+                session.execute,
+                self._LIST_DOCUMENTS_SQL.execution_options(stream_results=True, yield_per=batch_size)
+            )
+            partitions = result.partitions()
+            while True:
+                # Cada lote é buscado do cursor em uma thread (não bloqueia o event loop)
+                partition = await asyncio.to_thread(next, partitions, None)
+                if partition is None:
+                    break
+                for row in partition:
+                    yield self._document_row_to_dict(row)
+        except Exception as e:
+            logger.error(f"Erro ao fazer streaming dos documentos: {e}", exc_info=True)
+            raise
+        finally:
+            session.close()
+    
+    async def delete_document(self, document_id: str) -> int:
         """
         Remove um documento da base de conhecimento
         
@@ -384,33 +894,43 @@ class RAGService:
             document_id: ID do documento a ser removido
             
         Returns:
-            True se o documento foi removido com sucesso
+            Número de chunks removidos (0 se o documento não existe)
         """
         try:
-            session = self.SessionLocal()
-            try:
-                # Verificar se documento existe
-                check_sql = text("SELECT COUNT(*) FROM document_chunks WHERE document_id = :doc_id")
-                count = session.execute(check_sql, {"doc_id": document_id}).scalar()
-                
-                if count == 0:
-                    logger.warning(f"Documento {document_id} não encontrado")
-                    return False
-                
-                # Deletar todos os chunks do documento
+            def run(session):
+                # Deletar todos os chunks do documento (rowcount 0: documento não existe)
                 delete_sql = text("DELETE FROM document_chunks WHERE document_id = :doc_id")
                 result = session.execute(delete_sql, {"doc_id": document_id})
                 session.commit()
                 
                 deleted_count = result.rowcount
-                logger.info(f"Documento {document_id} removido ({deleted_count} chunks deletados)")
-                return True
-            finally:
-                session.close()
+                if deleted_count == 0:
+                    logger.warning(f"Documento {document_id} não encontrado")
+                else:
+                    logger.info(f"Documento {document_id} removido ({deleted_count} chunks deletados)")
+                return deleted_count
+            
+            deleted_count = await self._run_in_session(run)
+            if deleted_count:
+                self._notify_change()
+            return deleted_count
         except Exception as e:
             logger.error(f"Erro ao remover documento: {e}", exc_info=True)
             raise
     
+    @staticmethod
+    def _metadata_field_row_to_dict(row) -> Dict[str, Any]:
+        """Converte linha de rag_metadata_fields no formato retornado pela API"""
+        return {
+            "id": row.id,
+            "field_key": row.field_key,
+            "field_label": row.field_label,
+            "field_type": row.field_type,
+            "field_options": row.field_options,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "updated_at": row.updated_at.isoformat() if row.updated_at else None
+        }
+    
     async def list_metadata_fields(self) -> List[Dict[str, Any]]:
         """
         Lista todos os campos de metadata disponíveis
@@ -418,9 +938,19 @@ class RAGService:
         Returns:
             Lista de campos de metadata configurados
         """
+        local_fields = self._metadata_fields_cache.get(METADATA_FIELDS_CACHE_KEY)
+        if local_fields is not None:
+            return list(local_fields)
+        
+        cache = await self._get_cache()
+        if cache:
+            cached_fields = await cache.get(METADATA_FIELDS_CACHE_KEY)
+            if cached_fields is not None:
+                self._metadata_fields_cache.set(METADATA_FIELDS_CACHE_KEY, cached_fields)
+                return list(cached_fields)
+        
         try:
-            session = self.SessionLocal()
-            try:
+            def run(session):
                 list_sql = text("""
                     SELECT 
                         id,
@@ -436,21 +966,15 @@ class RAGService:
                 
                 results = session.execute(list_sql).fetchall()
                 
-                fields = []
-                for row in results:
-                    fields.append({
-                        "id": row.id,
-                        "field_key": row.field_key,
-                        "field_label": row.field_label,
-                        "field_type": row.field_type,
-                        "field_options": row.field_options,
-                        "created_at": row.created_at.isoformat() if row.created_at else None,
-                        "updated_at": row.updated_at.isoformat() if row.updated_at else None
-                    })
-                
-                return fields
-            finally:
-                session.close()
+                return [self._metadata_field_row_to_dict(row) for row in results]
+            
+            fields = await self._run_in_session(run)
+            
+            if cache:
+                await cache.set(METADATA_FIELDS_CACHE_KEY, fields, ttl=METADATA_FIELDS_CACHE_TTL)
+            self._metadata_fields_cache.set(METADATA_FIELDS_CACHE_KEY, fields)
+            
+            return list(fields)
         except Exception as e:
             logger.error(f"Erro ao listar campos de metadata: {e}", exc_info=True)
             raise
@@ -475,8 +999,7 @@ class RAGService:
             Campo criado
         """
         try:
-            session = self.SessionLocal()
-            try:
+            def run(session):
                 # Criar campo
                 insert_sql = text("""
                     INSERT INTO rag_metadata_fields 
@@ -500,32 +1023,79 @@ class RAGService:
                 
                 session.commit()
                 
-                # Atualizar todos os documentos existentes: adicionar null para o novo campo
-                # Usar jsonb_set para garantir que o campo seja adicionado mesmo se metadata for null
-                update_sql = text("""
-                    UPDATE document_chunks
-                    SET metadata = COALESCE(metadata, '{}'::jsonb) || jsonb_build_object(:field_key, NULL::jsonb)
-                    WHERE metadata IS NULL OR metadata->>:field_key IS NULL
+                # Documentos existentes não são reescritos: campo ausente no chunk = null
+                # (preenchido na leitura)
+                logger.info(f"Campo de metadata '{field_key}' criado")
+                return self._metadata_field_row_to_dict(result)
+            
+            field = await self._run_in_session(run)
+            await self._invalidate_metadata_fields_cache()
+            return field
+        except Exception as e:
+            logger.error(f"Erro ao criar campo de metadata: {e}", exc_info=True)
+            raise
+    
+    async def create_metadata_fields_bulk(
+        self,
+        fields: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Cria (ou atualiza) vários campos de metadata em uma única transação
+        
+        Mesma semântica de create_metadata_field: campos existentes são atualizados
+        e os documentos existentes não são reescritos (campo ausente = null).
+        
+        Args:
+            fields: Lista de {field_key, field_label, field_type, field_options}.
+                Chaves repetidas na lista: prevalece a última ocorrência.
+            
+        Returns:
+            Campos criados/atualizados
+        """
+        if not fields:
+            return []
+        
+        # ON CONFLICT DO UPDATE não aceita a mesma chave duas vezes no mesmo comando
+        unique_fields = {field["field_key"]: field for field in fields}
+        
+        try:
+            def run(session):
+                insert_sql = text("""
+                    INSERT INTO rag_metadata_fields 
+                    (field_key, field_label, field_type, field_options)
+                    SELECT field_key, field_label, COALESCE(field_type, 'text'), field_options
+                    FROM jsonb_to_recordset(CAST(:fields AS jsonb))
+                        AS v(field_key TEXT, field_label TEXT, field_type TEXT, field_options JSONB)
+                    ON CONFLICT (field_key) 
+                    DO UPDATE SET 
+                        field_label = EXCLUDED.field_label,
+                        field_type = EXCLUDED.field_type,
+                        field_options = EXCLUDED.field_options,
+                        updated_at = CURRENT_TIMESTAMP
+                    RETURNING id, field_key, field_label, field_type, field_options, created_at, updated_at
                 """)
                 
-                session.execute(update_sql, {"field_key": field_key})
+                results = session.execute(insert_sql, {
+                    "fields": json.dumps([
+                        {
+                            "field_key": field["field_key"],
+                            "field_label": field["field_label"],
+                            "field_type": field.get("field_type") or "text",
+                            "field_options": field.get("field_options") or None
+                        }
+                        for field in unique_fields.values()
+                    ])
+                }).fetchall()
                 session.commit()
                 
-                logger.info(f"Campo de metadata '{field_key}' criado e aplicado a documentos existentes")
-                
-                return {
-                    "id": result.id,
-                    "field_key": result.field_key,
-                    "field_label": result.field_label,
-                    "field_type": result.field_type,
-                    "field_options": result.field_options,
-                    "created_at": result.created_at.isoformat() if result.created_at else None,
-                    "updated_at": result.updated_at.isoformat() if result.updated_at else None
-                }
-            finally:
-                session.close()
+                logger.info(f"{len(results)} campos de metadata criados/atualizados em lote")
+                return [self._metadata_field_row_to_dict(row) for row in results]
+            
+            created = await self._run_in_session(run)
+            await self._invalidate_metadata_fields_cache()
+            return created
         except Exception as e:
-            logger.error(f"Erro ao criar campo de metadata: {e}", exc_info=True)
+            logger.error(f"Erro ao criar campos de metadata em lote: {e}", exc_info=True)
             raise
     
     async def delete_metadata_field(self, field_key: str) -> bool:
@@ -539,8 +1109,7 @@ class RAGService:
             True se removido com sucesso
         """
         try:
-            session = self.SessionLocal()
-            try:
+            def run(session):
                 # Remover campo de todos os documentos
                 update_sql = text("""
                     UPDATE document_chunks
@@ -548,20 +1117,24 @@ class RAGService:
                     WHERE metadata ? :field_key
                 """)
                 
-                session.execute(update_sql, {"field_key": field_key})
+                chunks_updated = session.execute(update_sql, {"field_key": field_key}).rowcount
                 
                 # Remover campo da tabela
                 delete_sql = text("DELETE FROM rag_metadata_fields WHERE field_key = :field_key")
                 result = session.execute(delete_sql, {"field_key": field_key})
                 session.commit()
                 
-                deleted = result.rowcount > 0
-                if deleted:
-                    logger.info(f"Campo de metadata '{field_key}' removido")
-                
-                return deleted
-            finally:
-                session.close()
+                return result.rowcount > 0, chunks_updated
+            
+            deleted, chunks_updated = await self._run_in_session(run)
+            if deleted:
+                logger.info(f"Campo de metadata '{field_key}' removido")
+                await self._invalidate_metadata_fields_cache()
+            if chunks_updated:
+                # Chunks perderam a chave: resultados em cache ficaram desatualizados
+                self._notify_change()
+            
+            return deleted
         except Exception as e:
             logger.error(f"Erro ao remover campo de metadata: {e}", exc_info=True)
             raise
@@ -582,17 +1155,8 @@ class RAGService:
             True se atualizado com sucesso
         """
         try:
-            session = self.SessionLocal()
-            try:
-                # Verificar se documento existe
-                check_sql = text("SELECT COUNT(*) FROM document_chunks WHERE document_id = :doc_id")
-                count = session.execute(check_sql, {"doc_id": document_id}).scalar()
-                
-                if count == 0:
-                    logger.warning(f"Documento {document_id} não encontrado")
-                    return False
-                
-                # Atualizar metadata de todos os chunks do documento
+            def run(session):
+                # Atualizar metadata de todos os chunks do documento (rowcount 0: documento não existe)
                 # Atualizar múltiplos campos de uma vez usando jsonb_build_object
                 metadata_json = json.dumps(metadata_updates)
                 update_sql = text("""
@@ -601,16 +1165,23 @@ class RAGService:
                     WHERE document_id = :doc_id
                 """)
                 
-                session.execute(update_sql, {
+                count = session.execute(update_sql, {
                     "doc_id": document_id,
                     "metadata_updates": metadata_json
-                })
-                
+                }).rowcount
                 session.commit()
+                
+                if count == 0:
+                    logger.warning(f"Documento {document_id} não encontrado")
+                    return False
+                
                 logger.info(f"Metadata do documento {document_id} atualizada ({count} chunks)")
                 return True
-            finally:
-                session.close()
+            
+            updated = await self._run_in_session(run)
+            if updated:
+                self._notify_change()
+            return updated
         except Exception as e:
             logger.error(f"Erro ao atualizar metadata do documento: {e}", exc_info=True)
             raise
@@ -633,60 +1204,93 @@ class RAGService:
             True se atualizado com sucesso
         """
         try:
-            session = self.SessionLocal()
-            try:
-                # Verificar se chunk existe
-                check_sql = text("""
-                    SELECT COUNT(*) FROM document_chunks 
+            def run(session):
+                # Merge no próprio banco (atômico, sem ler antes); rowcount 0: chunk não existe
+                update_sql = text("""
+                    UPDATE document_chunks
+                    SET metadata = COALESCE(metadata, '{}'::jsonb) || CAST(:metadata_updates AS jsonb)
                     WHERE document_id = :doc_id AND chunk_index = :chunk_idx
                 """)
-                count = session.execute(check_sql, {
+                
+                count = session.execute(update_sql, {
                     "doc_id": document_id,
-                    "chunk_idx": chunk_index
-                }).scalar()
+                    "chunk_idx": chunk_index,
+                    "metadata_updates": json.dumps(metadata_updates)
+                }).rowcount
+                session.commit()
                 
                 if count == 0:
                     logger.warning(f"Chunk {document_id}:{chunk_index} não encontrado")
                     return False
                 
-                # Buscar metadata atual
-                get_sql = text("""
-                    SELECT metadata FROM document_chunks
-                    WHERE document_id = :doc_id AND chunk_index = :chunk_idx
-                """)
-                result = session.execute(get_sql, {
-                    "doc_id": document_id,
-                    "chunk_idx": chunk_index
-                }).fetchone()
-                
-                # Atualizar metadata
-                current_metadata = result.metadata if result.metadata else {}
-                if not isinstance(current_metadata, dict):
-                    current_metadata = json.loads(current_metadata) if current_metadata else {}
-                
-                # Atualizar campos
-                current_metadata.update(metadata_updates)
-                
-                # Salvar
+                logger.info(f"Metadata do chunk {document_id}:{chunk_index} atualizada")
+                return True
+            
+            updated = await self._run_in_session(run)
+            if updated:
+                self._notify_change()
+            return updated
+        except Exception as e:
+            logger.error(f"Erro ao atualizar metadata do chunk: {e}", exc_info=True)
+            raise
+    
+    async def update_metadata_bulk(
+        self,
+        updates: List[Dict[str, Any]]
+    ) -> Dict[str, int]:
+        """
+        Atualiza metadata de vários documentos/chunks em uma única query
+        
+        Args:
+            updates: Lista de itens {document_id, chunk_index (opcional), metadata_updates}.
+                Sem chunk_index, a atualização vale para todos os chunks do documento.
+                Se um mesmo chunk for alvo de mais de um item, apenas um deles é aplicado.
+            
+        Returns:
+            Número de chunks atualizados por document_id
+        """
+        if not updates:
+            return {}
+        
+        try:
+            def run(session):
+                # Um único UPDATE ... FROM com as atualizações passadas como array JSON
                 update_sql = text("""
-                    UPDATE document_chunks
-                    SET metadata = CAST(:metadata AS jsonb)
-                    WHERE document_id = :doc_id AND chunk_index = :chunk_idx
+                    UPDATE document_chunks AS dc
+                    SET metadata = COALESCE(dc.metadata, '{}'::jsonb) || v.metadata_updates
+                    FROM jsonb_to_recordset(CAST(:updates AS jsonb))
+                        AS v(document_id TEXT, chunk_index INTEGER, metadata_updates JSONB)
+                    WHERE dc.document_id = v.document_id
+                      AND (v.chunk_index IS NULL OR dc.chunk_index = v.chunk_index)
+                    RETURNING dc.document_id
                 """)
                 
-                session.execute(update_sql, {
-                    "doc_id": document_id,
-                    "chunk_idx": chunk_index,
-                    "metadata": json.dumps(current_metadata)
-                })
+                results = session.execute(update_sql, {
+                    "updates": json.dumps([
+                        {
+                            "document_id": item["document_id"],
+                            "chunk_index": item.get("chunk_index"),
+                            "metadata_updates": item.get("metadata_updates") or {}
+                        }
+                        for item in updates
+                    ])
+                }).fetchall()
                 
                 session.commit()
-                logger.info(f"Metadata do chunk {document_id}:{chunk_index} atualizada")
-                return True
-            finally:
-                session.close()
+                
+                updated: Dict[str, int] = {item["document_id"]: 0 for item in updates}
+                for row in results:
+                    updated[row.document_id] += 1
+                
+                logger.info(f"Metadata atualizada em lote ({len(results)} chunks, {len(updates)} itens)")
+                return updated
+            
+            updated = await self._run_in_session(run)
+            if any(updated.values()):
+                self._notify_change()
+            return updated
         except Exception as e:
-            logger.error(f"Erro ao atualizar metadata do chunk: {e}", exc_info=True)
+            logger.error(f"Erro ao atualizar metadata em lote: {e}", exc_info=True)
             raise
     
     async def get_chunk_metadata(
@@ -705,8 +1309,9 @@ class RAGService:
             Metadata do chunk ou None se não encontrado
         """
         try:
-            session = self.SessionLocal()
-            try:
+            field_keys = await self._metadata_field_keys()
+            
+            def run(session):
                 get_sql = text("""
                     SELECT metadata FROM document_chunks
                     WHERE document_id = :doc_id AND chunk_index = :chunk_idx
@@ -716,67 +1321,132 @@ class RAGService:
                     "chunk_idx": chunk_index
                 }).fetchone()
                 
+                # JSONB: o driver já devolve dict
                 if result and result.metadata:
-                    if isinstance(result.metadata, dict):
-                        return result.metadata
-                    return json.loads(result.metadata)
+                    return self._fill_metadata_fields(result.metadata, field_keys)
                 
                 return None
-            finally:
-                session.close()
+            
+            return await self._run_in_session(run)
         except Exception as e:
             logger.error(f"Erro ao obter metadata do chunk: {e}", exc_info=True)
             raise
     
+    # Preview truncado no Postgres; conteúdo completo só trafega quando pedido
+    _DOCUMENT_CHUNKS_SQL = text("""
+        SELECT 
+            chunk_index,
+            LEFT(content, 200) AS preview,
+            LENGTH(content) > 200 AS truncated,
+            CASE WHEN :include_full THEN content ELSE NULL END AS content_full,
+            metadata,
+            source,
+            to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') AS created_at_iso
+        FROM document_chunks
+        WHERE document_id = :doc_id
+        ORDER BY chunk_index
+    """)
+    
+    async def _metadata_field_keys(self) -> List[str]:
+        """Chaves dos campos de metadata configurados"""
+        return [field["field_key"] for field in await self.list_metadata_fields()]
+    
+    @staticmethod
+    def _fill_metadata_fields(metadata: Dict[str, Any], field_keys: List[str]) -> Dict[str, Any]:
+        """Campos configurados ausentes no chunk (criados depois dele) aparecem como null"""
+        return {**dict.fromkeys(field_keys), **metadata}
+    
+    @classmethod
+    def _chunk_row_to_dict(cls, row, field_keys: List[str]) -> Dict[str, Any]:
+        """Converte linha de document_chunks no formato retornado pela API"""
+        return {
+            "chunk_index": row.chunk_index,
+            "content": row.preview + "..." if row.truncated else row.preview,  # Preview
+            "content_full": row.content_full,
+            "metadata": cls._fill_metadata_fields(row.metadata or {}, field_keys),  # JSONB já vem como dict
+            "source": row.source,
+            "created_at": row.created_at_iso  # Já em ISO 8601 (formatado no Postgres)
+        }
+    
     async def get_document_chunks(
         self,
-        document_id: str
+        document_id: str,
+        include_full: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Lista todos os chunks de um documento
         
         Args:
             document_id: ID do documento
+            include_full: Incluir o conteúdo completo (content_full); senão só o preview
             
         Returns:
             Lista de chunks com metadata
         """
         try:
-            session = self.SessionLocal()
-            try:
-                list_sql = text("""
-                    SELECT 
-                        chunk_index,
-                        content,
-                        metadata,
-                        source,
-                        created_at
-                    FROM document_chunks
-                    WHERE document_id = :doc_id
-                    ORDER BY chunk_index
-                """)
-                
-                results = session.execute(list_sql, {"doc_id": document_id}).fetchall()
+            field_keys = await self._metadata_field_keys()
+            
+            def run(session):
+                results = session.execute(
+                    self._DOCUMENT_CHUNKS_SQL,
+                    {"doc_id": document_id, "include_full": include_full}
+                ).fetchall()
                 
-                chunks = []
-                for row in results:
-                    metadata = row.metadata
-                    if metadata and not isinstance(metadata, dict):
-                        metadata = json.loads(metadata)
-                    
-                    chunks.append({
-                        "chunk_index": row.chunk_index,
-                        "content": row.content[:200] + "..." if len(row.content) > 200 else row.content,  # Preview
-                        "content_full": row.content,
-                        "metadata": metadata or {},
-                        "source": row.source,
-                        "created_at": row.created_at.isoformat() if row.created_at else None
-                    })
-                
-                return chunks
-            finally:
-                session.close()
+                return [self._chunk_row_to_dict(row, field_keys) for row in results]
+            
+            return await self._run_in_session(run)
         except Exception as e:
             logger.error(f"Erro ao listar chunks do documento: {e}", exc_info=True)
             raise
     
+    async def stream_document_chunks(
+        self,
+        document_id: str,
+        batch_size: int = 500,
+        include_full: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Itera sobre os chunks de um documento sem carregar todos em memória
+        
+        Usa cursor no servidor (stream_results), buscando batch_size linhas por vez.
+        
+        Args:
+            document_id: ID do documento
+            batch_size: Número de linhas buscadas por vez
+            include_full: Incluir o conteúdo completo (content_full); senão só o preview
+            
+        Yields:
+            Chunks no mesmo formato de get_document_chunks
+        """
+        field_keys = await self._metadata_field_keys()
+        session = self.SessionLocal()
+        try:
+            result = await asyncio.to_thread(
+                session.execute,
+                self._DOCUMENT_CHUNKS_SQL.execution_options(stream_results=True, yield_per=batch_size),
+                {"doc_id": document_id, "include_full": include_full}
+            )
+            partitions = result.partitions()
+            while True:
+                # Cada lote é buscado do cursor em uma thread (não bloqueia o event loop)
+                partition = await asyncio.to_thread(next, partitions, None)
+                if partition is None:
+                    break
+                for row in partition:
+                    yield self._chunk_row_to_dict(row, field_keys)
+        except Exception as e:
+            logger.error(f"Erro ao fazer streaming dos chunks do documento: {e}", exc_info=True)
+            raise
+        finally:
+            session.close()
+
+
+@lru_cache(maxsize=1)
+def get_rag_service() -> RAGService:
+    """
+    Instância única do RAGService no processo (API e agente)
+    
+    Um só engine/pool, batchers e caches: alterações feitas pela API
+    invalidam também os caches usados nas buscas do agente.
+    """
+    return RAGService()
@@ -0,0 +1,98 @@
+"""
+Cache semântico de buscas RAG
+Reaproveita resultados de consultas recentes com embedding quase idêntico (paráfrases)
+"""
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticSearchCache:
+    """
+    Banco das últimas N consultas (embedding normalizado + resultados)
+    
+    A busca compara o embedding da consulta com todo o banco em uma única
+    multiplicação matriz-vetor (BLAS); acima do limiar de cosseno, com os
+    mesmos parâmetros de busca (top_k, threshold, filtros), devolve o
+    resultado guardado sem ir ao banco. Ao encher, sai a entrada usada há
+    mais tempo. Seguro entre threads (o retriever síncrono usa outro loop).
+    """
+    
+    def __init__(self, capacity: int, threshold: float = 0.97, ttl: float = 300):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (capacity, dimensão), criada no primeiro put
+        self._params: List[Optional[Hashable]] = [None] * capacity
+        self._results: List[Optional[List[Dict[str, Any]]]] = [None] * capacity
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+    
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vector = np.ascontiguousarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+    
+    def get(self, embedding: Any, params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Resultado de uma consulta parecida com os mesmos parâmetros, ou None"""
+        return self.get_many([embedding], [params])[0]
+    
+    def get_many(
+        self,
+        embeddings: List[Any],
+        params: List[Hashable]
+    ) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Versão em lote de `get`: o lote inteiro contra o banco em um único
+        produto de matrizes (SGEMM) em vez de uma varredura por consulta
+        """
+        found: List[Optional[List[Dict[str, Any]]]] = [None] * len(embeddings)
+        if self._matrix is None or not embeddings:
+            return found
+        queries = np.stack([self._normalize(embedding) for embedding in embeddings])
+        now = time.monotonic()
+        with self._lock:
+            if queries.shape[1] != self._matrix.shape[1]:
+                return found
+            # (capacity, n): uma coluna de scores por consulta
+            scores = self._matrix @ queries.T
+            # Só entradas válidas (não expiradas) contam
+            scores[self._expires_at <= now] = -1.0
+            for idx, query_params in enumerate(params):
+                column = scores[:, idx]
+                candidates = np.flatnonzero(column >= self.threshold)
+                # Mais parecida primeiro
+                for slot in candidates[np.argsort(-column[candidates])]:
+                    if self._params[slot] == query_params:
+                        self._last_used[slot] = now
+                        found[idx] = list(self._results[slot])
+                        break
+        return found
+    
+    def put(self, embedding: Any, params: Hashable, results: List[Dict[str, Any]]):
+        """Guarda os resultados da consulta (substitui a entrada menos usada)"""
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._expires_at[:] = 0
+            # Slot livre/expirado primeiro; senão o usado há mais tempo
+            expired = np.flatnonzero(self._expires_at <= now)
+            slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+            self._matrix[slot] = vector
+            self._params[slot] = params
+            self._results[slot] = list(results)
+            self._expires_at[slot] = now + self.ttl
+            self._last_used[slot] = now
+    
+    def clear(self):
+        """Descarta todas as entradas (ex: base de conhecimento alterada)"""
+        with self._lock:
+            self._expires_at[:] = 0
+            self._params = [None] * self.capacity
+            self._results = [None] * self.capacity
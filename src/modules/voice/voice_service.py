@@ -1,14 +1,41 @@
 """
 Serviço de processamento de voz (Speech-to-Text e Text-to-Speech)
 """
+import base64
 import logging
-from typing import Optional, BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from typing import AsyncIterator, Optional, BinaryIO, Union
 import asyncio
 
 from src.config.config import config
 
 logger = logging.getLogger(__name__)
 
+# Voz padrão do ElevenLabs (Rachel)
+ELEVENLABS_DEFAULT_VOICE = "21m00Tcm4TlvDq8ikWAM"
+
+AWS_REGION = "us-east-1"
+
+# Tamanho de cada evento de áudio enviado ao Transcribe Streaming (limite do serviço: 32 KB)
+AWS_TRANSCRIBE_CHUNK_SIZE = 8192
+
+
+@lru_cache(maxsize=1)
+def _get_voice_pool() -> ThreadPoolExecutor:
+    """Pool de threads dedicado às chamadas bloqueantes dos SDKs de voz (não disputa o executor padrão do loop)"""
+    return ThreadPoolExecutor(
+        max_workers=config.voice.executor_workers,
+        thread_name_prefix="voice"
+    )
+
+
+def shutdown_voice_pool():
+    """Encerra o pool de voz (chamar no shutdown da aplicação)"""
+    if _get_voice_pool.cache_info().currsize:
+        _get_voice_pool().shutdown(wait=False, cancel_futures=True)
+        _get_voice_pool.cache_clear()
+
 
 class VoiceService:
     """
@@ -18,66 +45,161 @@ class VoiceService:
     def __init__(self):
         self.provider = config.voice.provider.lower()
         self.language_code = config.voice.language_code
-        self._initialize_clients()
-    
-    def _initialize_clients(self):
-        """Inicializa clientes de ASR e TTS"""
-        if self.provider == "google":
-            self._init_google_clients()
-        elif self.provider == "aws":
-            self._init_aws_clients()
-        elif self.provider == "elevenlabs":
-            self._init_elevenlabs_client()
-        else:
+        
+        tts_methods = {
+            "google": self._google_text_to_speech,
+            "aws": self._aws_text_to_speech,
+            "elevenlabs": self._elevenlabs_text_to_speech
+        }
+        stt_methods = {
+            "google": self._google_speech_to_text,
+            "aws": self._aws_speech_to_text
+        }
+        if self.provider not in tts_methods:
             raise ValueError(f"Provedor de voz não suportado: {self.provider}")
+        # Método do provedor resolvido uma vez (sem cadeia de if/elif por chamada)
+        self._tts = tts_methods[self.provider]
+        self._stt = stt_methods.get(self.provider)
+        # Clientes criados no primeiro uso (import dos SDKs é lento):
+        # sessões só de ASR ou só de TTS nem carregam o SDK da outra direção
+    
+    @staticmethod
+    def _configure_google_credentials():
+        """Aponta as credenciais do Google Cloud (se configuradas)"""
+        if config.voice.google_credentials_path:
+            import os
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config.voice.google_credentials_path
+    
+    @cached_property
+    def speech_client(self):
+        """Cliente Google Cloud Speech (criado no primeiro uso)"""
+        return self._get_google_speech_client()
+    
+    @cached_property
+    def tts_client(self):
+        """Cliente Google Cloud Text-to-Speech (criado no primeiro uso)"""
+        return self._get_google_tts_client()
+    
+    @cached_property
+    def transcribe_client(self):
+        """Cliente AWS Transcribe Streaming (criado no primeiro uso)"""
+        return self._get_aws_transcribe_streaming_client()
+    
+    @cached_property
+    def polly_client(self):
+        """Cliente AWS Polly (criado no primeiro uso)"""
+        return self._get_aws_client('polly')
+    
+    @cached_property
+    def elevenlabs_client(self):
+        """Cliente ElevenLabs (criado no primeiro uso)"""
+        return self._get_elevenlabs_client()
+    
+    @cached_property
+    def _google_speech_encodings(self):
+        """Formato do áudio -> enum do Google Speech (montado uma vez)"""
+        from google.cloud.speech_v1 import RecognitionConfig
+        
+        return {
+            "LINEAR16": RecognitionConfig.AudioEncoding.LINEAR16,
+            "OGG_OPUS": RecognitionConfig.AudioEncoding.OGG_OPUS
+        }
+    
+    @cached_property
+    def _google_voice_genders(self):
+        """Gênero da voz -> enum do Google TTS (montado uma vez)"""
+        from google.cloud.texttospeech_v1 import SsmlVoiceGender
+        
+        return {
+            "MALE": SsmlVoiceGender.MALE,
+            "FEMALE": SsmlVoiceGender.FEMALE,
+            "NEUTRAL": SsmlVoiceGender.NEUTRAL
+        }
     
-    def _init_google_clients(self):
-        """Inicializa clientes Google Cloud Speech e Text-to-Speech"""
+    @cached_property
+    def _google_mp3_config(self):
+        """AudioConfig MP3 do Google TTS (igual em todas as chamadas)"""
+        from google.cloud.texttospeech_v1 import AudioConfig, AudioEncoding
+        
+        return AudioConfig(audio_encoding=AudioEncoding.MP3)
+    
+    def _get_google_speech_client(self):
+        """Inicializa cliente Google Cloud Speech"""
         try:
             from google.cloud import speech_v1
-            from google.cloud import texttospeech_v1
             
-            if config.voice.google_credentials_path:
-                import os
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config.voice.google_credentials_path
+            self._configure_google_credentials()
+            client = speech_v1.SpeechClient()
+            logger.info("Cliente Google Cloud Speech inicializado")
+            return client
+        except ImportError:
+            raise ImportError("google-cloud-speech deve ser instalado")
+        except Exception as e:
+            logger.error(f"Erro ao inicializar Google Cloud Speech: {e}")
+            raise
+    
+    def _get_google_tts_client(self):
+        """Inicializa cliente Google Cloud Text-to-Speech"""
+        try:
+            from google.cloud import texttospeech_v1
             
-            self.speech_client = speech_v1.SpeechClient()
-            self.tts_client = texttospeech_v1.TextToSpeechClient()
-            logger.info("Clientes Google Cloud Speech/TTS inicializados")
+            self._configure_google_credentials()
+            client = texttospeech_v1.TextToSpeechClient()
+            logger.info("Cliente Google Cloud Text-to-Speech inicializado")
+            return client
         except ImportError:
-            raise ImportError("google-cloud-speech e google-cloud-texttospeech devem ser instalados")
+            raise ImportError("google-cloud-texttospeech deve ser instalado")
         except Exception as e:
-            logger.error(f"Erro ao inicializar Google Cloud: {e}")
+            logger.error(f"Erro ao inicializar Google Cloud Text-to-Speech: {e}")
             raise
     
-    def _init_aws_clients(self):
-        """Inicializa clientes AWS Transcribe e Polly"""
+    def _get_aws_client(self, service_name: str):
+        """Inicializa cliente AWS (Transcribe ou Polly)"""
         try:
             import boto3
             
             if not config.voice.aws_access_key or not config.voice.aws_secret_key:
                 raise ValueError("Credenciais AWS não configuradas")
             
-            self.transcribe_client = boto3.client(
-                'transcribe',
+            client = boto3.client(
+                service_name,
                 aws_access_key_id=config.voice.aws_access_key,
                 aws_secret_access_key=config.voice.aws_secret_key,
-                region_name='us-east-1'
+                region_name=AWS_REGION
             )
-            self.polly_client = boto3.client(
-                'polly',
-                aws_access_key_id=config.voice.aws_access_key,
-                aws_secret_access_key=config.voice.aws_secret_key,
-                region_name='us-east-1'
-            )
-            logger.info("Clientes AWS Transcribe/Polly inicializados")
+            logger.info(f"Cliente AWS {service_name} inicializado")
+            return client
         except ImportError:
             raise ImportError("boto3 deve ser instalado para usar AWS")
         except Exception as e:
-            logger.error(f"Erro ao inicializar AWS: {e}")
+            logger.error(f"Erro ao inicializar AWS {service_name}: {e}")
+            raise
+    
+    def _get_aws_transcribe_streaming_client(self):
+        """Inicializa cliente AWS Transcribe Streaming"""
+        try:
+            from amazon_transcribe.auth import StaticCredentialResolver
+            from amazon_transcribe.client import TranscribeStreamingClient
+            
+            if not config.voice.aws_access_key or not config.voice.aws_secret_key:
+                raise ValueError("Credenciais AWS não configuradas")
+            
+            client = TranscribeStreamingClient(
+                region=AWS_REGION,
+                credential_resolver=StaticCredentialResolver(
+                    access_key_id=config.voice.aws_access_key,
+                    secret_access_key=config.voice.aws_secret_key
+                )
+            )
+            logger.info("Cliente AWS Transcribe Streaming inicializado")
+            return client
+        except ImportError:
+            raise ImportError("amazon-transcribe deve ser instalado para ASR com AWS")
+        except Exception as e:
+            logger.error(f"Erro ao inicializar AWS Transcribe Streaming: {e}")
             raise
     
-    def _init_elevenlabs_client(self):
+    def _get_elevenlabs_client(self):
         """Inicializa cliente ElevenLabs"""
         try:
             from elevenlabs import ElevenLabs
@@ -85,8 +207,9 @@ class VoiceService:
             if not config.voice.elevenlabs_api_key:
                 raise ValueError("ElevenLabs API key não configurada")
             
-            self.elevenlabs_client = ElevenLabs(api_key=config.voice.elevenlabs_api_key)
+            client = ElevenLabs(api_key=config.voice.elevenlabs_api_key)
             logger.info("Cliente ElevenLabs inicializado")
+            return client
         except ImportError:
             raise ImportError("elevenlabs deve ser instalado")
         except Exception as e:
@@ -95,7 +218,7 @@ class VoiceService:
     
     async def speech_to_text(
         self,
-        audio_data: bytes,
+        audio_data: Union[bytes, str],
         sample_rate: int = 16000,
         encoding: str = "LINEAR16"
     ) -> str:
@@ -103,7 +226,7 @@ class VoiceService:
         Converte áudio em texto (Speech-to-Text)
         
         Args:
-            audio_data: Dados de áudio em bytes
+            audio_data: Dados de áudio em bytes, ou string base64 (como a Evolution API entrega mídias)
             sample_rate: Taxa de amostragem (Hz)
             encoding: Formato de codificação do áudio
             
@@ -111,16 +234,23 @@ class VoiceService:
             Texto transcrito
         """
         try:
-            if self.provider == "google":
-                return await self._google_speech_to_text(audio_data, sample_rate, encoding)
-            elif self.provider == "aws":
-                return await self._aws_speech_to_text(audio_data, sample_rate, encoding)
-            else:
+            if self._stt is None:
                 raise ValueError(f"ASR não implementado para {self.provider}")
+            audio_data = await self._preprocess_audio(audio_data)
+            return await self._stt(audio_data, sample_rate, encoding)
         except Exception as e:
             logger.error(f"Erro no Speech-to-Text: {e}")
             raise
     
+    @staticmethod
+    async def _preprocess_audio(audio_data: Union[bytes, str]) -> bytes:
+        """Decodifica áudio em base64 no pool de voz (áudios de vários MB não travam o event loop)"""
+        if isinstance(audio_data, str):
+            return await asyncio.get_running_loop().run_in_executor(
+                _get_voice_pool(), base64.b64decode, audio_data
+            )
+        return audio_data
+    
     async def _google_speech_to_text(
         self,
         audio_data: bytes,
@@ -130,8 +260,9 @@ class VoiceService:
         """Google Cloud Speech-to-Text"""
         from google.cloud.speech_v1 import RecognitionConfig, RecognitionAudio
         
+        encodings = self._google_speech_encodings
         config_speech = RecognitionConfig(
-            encoding=RecognitionConfig.AudioEncoding.LINEAR16 if encoding == "LINEAR16" else RecognitionConfig.AudioEncoding.OGG_OPUS,
+            encoding=encodings.get(encoding, encodings["OGG_OPUS"]),
             sample_rate_hertz=sample_rate,
             language_code=self.language_code,
         )
@@ -140,7 +271,7 @@ class VoiceService:
         
         loop = asyncio.get_event_loop()
         response = await loop.run_in_executor(
-            None,
+            _get_voice_pool(),
             lambda: self.speech_client.recognize(config=config_speech, audio=audio)
         )
         
@@ -154,27 +285,37 @@ class VoiceService:
         sample_rate: int,
         encoding: str
     ) -> str:
-        """AWS Transcribe Speech-to-Text"""
-        # AWS Transcribe requer arquivo em S3 ou streaming
-        # Implementação simplificada - em produção usar streaming ou S3
-        import uuid
-        import tempfile
+        """
+        AWS Transcribe Streaming Speech-to-Text
+        
+        O áudio vai da memória direto para o stream (sem arquivo temporário,
+        S3 ou job em lote); envio e leitura das transcrições correm juntos.
+        """
+        stream = await self.transcribe_client.start_stream_transcription(
+            language_code=self.language_code,
+            media_sample_rate_hz=sample_rate,
+            media_encoding="pcm" if encoding == "LINEAR16" else "ogg-opus"
+        )
         
-        # Salvar temporariamente e processar
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            tmp_file.write(audio_data)
-            tmp_file_path = tmp_file.name
+        async def send_audio():
+            audio = memoryview(audio_data)
+            for start in range(0, len(audio), AWS_TRANSCRIBE_CHUNK_SIZE):
+                await stream.input_stream.send_audio_event(
+                    audio_chunk=bytes(audio[start:start + AWS_TRANSCRIBE_CHUNK_SIZE])
+                )
+            await stream.input_stream.end_stream()
         
-        try:
-            job_name = f"transcribe-{uuid.uuid4()}"
-            # Upload e processamento (implementação completa requer S3)
-            # Por enquanto, retornar placeholder
-            logger.warning("AWS Transcribe requer implementação completa com S3")
-            return ""
-        finally:
-            import os
-            if os.path.exists(tmp_file_path):
-                os.unlink(tmp_file_path)
+        async def collect_transcripts() -> str:
+            transcripts = []
+            async for event in stream.output_stream:
+                for result in event.transcript.results:
+                    # Resultados parciais são revisados depois: só os finais entram no texto
+                    if not result.is_partial and result.alternatives:
+                        transcripts.append(result.alternatives[0].transcript)
+            return " ".join(transcripts)
+        
+        _, transcript = await asyncio.gather(send_audio(), collect_transcripts())
+        return transcript
     
     async def text_to_speech(
         self,
@@ -194,14 +335,7 @@ class VoiceService:
             Dados de áudio em bytes
         """
         try:
-            if self.provider == "google":
-                return await self._google_text_to_speech(text, voice_name, gender)
-            elif self.provider == "aws":
-                return await self._aws_text_to_speech(text, voice_name, gender)
-            elif self.provider == "elevenlabs":
-                return await self._elevenlabs_text_to_speech(text, voice_name)
-            else:
-                raise ValueError(f"TTS não implementado para {self.provider}")
+            return await self._tts(text, voice_name, gender)
         except Exception as e:
             logger.error(f"Erro no Text-to-Speech: {e}")
             raise
@@ -213,28 +347,25 @@ class VoiceService:
         gender: str
     ) -> bytes:
         """Google Cloud Text-to-Speech"""
-        from google.cloud.texttospeech_v1 import SynthesisInput, VoiceSelectionParams, AudioConfig
+        from google.cloud.texttospeech_v1 import SynthesisInput, VoiceSelectionParams
         
         input_text = SynthesisInput(text=text)
         
         # Selecionar voz
+        genders = self._google_voice_genders
         voice = VoiceSelectionParams(
             language_code=self.language_code,
-            ssml_gender=(
-                self.tts_client.SsmlVoiceGender.MALE if gender == "MALE"
-                else self.tts_client.SsmlVoiceGender.FEMALE if gender == "FEMALE"
-                else self.tts_client.SsmlVoiceGender.NEUTRAL
-            )
+            ssml_gender=genders.get(gender, genders["NEUTRAL"])
         )
         
         if voice_name:
             voice.name = voice_name
         
-        audio_config = AudioConfig(audio_encoding=self.tts_client.AudioEncoding.MP3)
+        audio_config = self._google_mp3_config
         
         loop = asyncio.get_event_loop()
         response = await loop.run_in_executor(
-            None,
+            _get_voice_pool(),
             lambda: self.tts_client.synthesize_speech(
                 input=input_text,
                 voice=voice,
@@ -255,7 +386,7 @@ class VoiceService:
         
         loop = asyncio.get_event_loop()
         response = await loop.run_in_executor(
-            None,
+            _get_voice_pool(),
             lambda: self.polly_client.synthesize_speech(
                 Text=text,
                 OutputFormat='mp3',
@@ -269,21 +400,55 @@ class VoiceService:
     async def _elevenlabs_text_to_speech(
         self,
         text: str,
-        voice_name: Optional[str]
+        voice_name: Optional[str],
+        gender: str = "NEUTRAL"
     ) -> bytes:
-        """ElevenLabs Text-to-Speech"""
-        voice_id = voice_name or "21m00Tcm4TlvDq8ikWAM"  # Voz padrão
+        """ElevenLabs Text-to-Speech (gênero definido pela própria voz)"""
+        voice_id = voice_name or ELEVENLABS_DEFAULT_VOICE
         
-        loop = asyncio.get_event_loop()
-        audio_generator = await loop.run_in_executor(
-            None,
-            lambda: self.elevenlabs_client.generate(
-                text=text,
-                voice=voice_id
-            )
-        )
+        def collect() -> bytearray:
+            # Acumula no executor: sem lista de chunks + cópia extra do b"".join
+            audio = bytearray()
+            for chunk in self.elevenlabs_client.generate(text=text, voice=voice_id):
+                audio.extend(chunk)
+            return audio
         
-        # Converter generator para bytes
-        audio_bytes = b"".join(audio_generator)
-        return audio_bytes
-
+        return await asyncio.get_running_loop().run_in_executor(_get_voice_pool(), collect)
+    
+    async def text_to_speech_stream(
+        self,
+        text: str,
+        voice_name: Optional[str] = None,
+        gender: str = "NEUTRAL"
+    ) -> AsyncIterator[bytes]:
+        """
+        Converte texto em áudio entregando os chunks conforme chegam
+        
+        No ElevenLabs o áudio é repassado chunk a chunk (sem manter o áudio
+        inteiro em memória); nos demais provedores sai em um único chunk.
+        
+        Args:
+            text: Texto a ser convertido
+            voice_name: Nome da voz a usar (opcional)
+            gender: Gênero da voz (MALE, FEMALE, NEUTRAL)
+        """
+        if self.provider != "elevenlabs":
+            yield await self.text_to_speech(text, voice_name, gender)
+            return
+        
+        voice_id = voice_name or ELEVENLABS_DEFAULT_VOICE
+        try:
+            loop = asyncio.get_running_loop()
+            chunks = await loop.run_in_executor(
+                _get_voice_pool(),
+                lambda: iter(self.elevenlabs_client.generate(text=text, voice=voice_id))
+            )
+            while True:
+                # Cada chunk vem da rede: lido fora do event loop
+                chunk = await loop.run_in_executor(_get_voice_pool(), next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        except Exception as e:
+            logger.error(f"Erro no Text-to-Speech (stream): {e}")
+            raise
@@ -1,14 +1,80 @@
 """
 Serviço de integração com WhatsApp via Evolution API
 """
+import asyncio
+import importlib.util
+import json
 import logging
-from typing import Dict, Optional, Any, List
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import httpx
 
+try:
+    import simdjson  # Parse parcial dos webhooks: só os campos lidos viram objetos Python (opcional)
+except ImportError:
+    simdjson = None
+
+try:
+    import orjson  # Parse mais rápido dos webhooks quando simdjson não está instalado (opcional)
+except ImportError:
+    orjson = None
+
 from src.config.config import config
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexões compartilhado por todas as instâncias (keep-alive; HTTP/2 se h2 estiver instalado)
+_WHATSAPP_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+_WHATSAPP_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Status da instância (stale-while-revalidate): até FRESH segundos servido do cache;
+# até STALE, servido do cache enquanto é atualizado em segundo plano
+INSTANCE_STATUS_FRESH_TTL = 5
+INSTANCE_STATUS_STALE_TTL = 60
+
+
+@lru_cache(maxsize=1)
+def get_whatsapp_http_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP reutilizado nas chamadas à Evolution API"""
+    return httpx.AsyncClient(
+        http2=_WHATSAPP_HTTP2,
+        limits=_WHATSAPP_HTTP_LIMITS,
+        timeout=30.0  # Envio de mídia pode demorar mais que o padrão (5s) do httpx
+    )
+
+
+# Chave da mensagem na Evolution API -> (tipo, extrator do conteúdo); a ordem define a prioridade
+_MESSAGE_TYPE_HANDLERS: Dict[str, Tuple[str, Callable[[Any], Optional[str]]]] = {
+    "conversation": ("text", lambda message: message["conversation"]),
+    "extendedTextMessage": ("text", lambda message: message["extendedTextMessage"].get("text", "")),
+    "imageMessage": ("image", lambda message: message["imageMessage"].get("caption", "")),
+    "videoMessage": ("video", lambda message: message["videoMessage"].get("caption", "")),
+    "audioMessage": ("audio", lambda message: None),
+    "documentMessage": ("document", lambda message: message["documentMessage"].get("caption", "")),
+}
+
+
+# Parser reutilizado (buffers internos alocados uma vez). Cada parse invalida o
+# documento anterior: os campos são extraídos antes de retornar, sem await no meio
+_WEBHOOK_PARSER = simdjson.Parser() if simdjson is not None else None
+
+
+def _parse_webhook_body(raw: bytes) -> Any:
+    """Documento do webhook: proxy preguiçoso (simdjson), ou dict (orjson/json)"""
+    if _WEBHOOK_PARSER is not None:
+        return _WEBHOOK_PARSER.parse(raw)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+async def close_whatsapp_http_client():
+    """Fecha o cliente HTTP compartilhado (chamar no shutdown da aplicação)"""
+    if get_whatsapp_http_client.cache_info().currsize:
+        await get_whatsapp_http_client().aclose()
+        get_whatsapp_http_client.cache_clear()
+
 
 class WhatsAppService:
     """
@@ -24,6 +90,10 @@ class WhatsAppService:
             logger.warning("Evolution API key não configurada")
         if not self.instance_name:
             logger.warning("Evolution API instance name não configurada")
+        
+        # (momento da consulta, status) da última resposta da Evolution API
+        self._status_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._status_refresh_task: Optional[asyncio.Task] = None
     
     async def send_text_message(
         self,
@@ -62,10 +132,9 @@ class WhatsAppService:
                     }
                 }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                return response.json()
+            response = await get_whatsapp_http_client().post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
                 
         except Exception as e:
             logger.error(f"Erro ao enviar mensagem WhatsApp: {e}")
@@ -106,10 +175,9 @@ class WhatsAppService:
             if caption:
                 payload["caption"] = caption
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                return response.json()
+            response = await get_whatsapp_http_client().post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
                 
         except Exception as e:
             logger.error(f"Erro ao enviar mídia WhatsApp: {e}")
@@ -127,6 +195,20 @@ class WhatsAppService:
             message_id: ID da mensagem
             phone_number: Número do remetente
         """
+        return await self.mark_messages_as_read([message_id], phone_number)
+    
+    async def mark_messages_as_read(
+        self,
+        message_ids: List[str],
+        phone_number: str
+    ) -> Dict[str, Any]:
+        """
+        Marca várias mensagens do mesmo remetente como lidas em uma única requisição
+        
+        Args:
+            message_ids: IDs das mensagens
+            phone_number: Número do remetente
+        """
         try:
             url = f"{self.api_url}/chat/markMessageAsRead/{self.instance_name}"
             headers = {
@@ -134,23 +216,44 @@ class WhatsAppService:
                 "Content-Type": "application/json"
             }
             
+            remote_jid = f"{phone_number}@s.whatsapp.net"
             payload = {
-                "read_messages": [{
-                    "id": message_id,
-                    "fromMe": False,
-                    "remoteJid": f"{phone_number}@s.whatsapp.net"
-                }]
+                "read_messages": [
+                    {"id": message_id, "fromMe": False, "remoteJid": remote_jid}
+                    for message_id in message_ids
+                ]
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                return response.json()
+            response = await get_whatsapp_http_client().post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
                 
         except Exception as e:
-            logger.error(f"Erro ao marcar mensagem como lida: {e}")
+            logger.error(f"Erro ao marcar mensagens como lidas: {e}")
             raise
     
+    def parse_webhook_bytes(self, raw: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Processa o corpo bruto do webhook da Evolution API
+        
+        Com simdjson só os campos usados são convertidos (mídias e o restante
+        do payload não viram objetos Python); sem ele, orjson/json.
+        
+        Args:
+            raw: Corpo da requisição
+            
+        Returns:
+            Mesmo formato de parse_webhook_message, com raw_data = corpo bruto (bytes)
+            
+        Raises:
+            ValueError: Corpo não é um JSON válido
+        """
+        message = self.parse_webhook_message(_parse_webhook_body(raw))
+        if message is not None:
+            # O proxy do simdjson não sobrevive ao próximo parse
+            message["raw_data"] = raw
+        return message
+    
     def parse_webhook_message(self, webhook_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Processa dados recebidos do webhook da Evolution API
@@ -185,24 +288,15 @@ class WhatsAppService:
             content = None
             message_type = None
             
-            # Verificar diferentes tipos de mensagem
-            if "conversation" in message_data:
-                content = message_data["conversation"]
-                message_type = "text"
-            elif "extendedTextMessage" in message_data:
-                content = message_data["extendedTextMessage"].get("text", "")
-                message_type = "text"
-            elif "imageMessage" in message_data:
-                content = message_data["imageMessage"].get("caption", "")
-                message_type = "image"
-            elif "videoMessage" in message_data:
-                content = message_data["videoMessage"].get("caption", "")
-                message_type = "video"
-            elif "audioMessage" in message_data:
-                message_type = "audio"
-            elif "documentMessage" in message_data:
-                content = message_data["documentMessage"].get("caption", "")
-                message_type = "document"
+            # Tipo da mensagem: interseção das chaves com a tabela (uma operação de conjunto)
+            matched = _MESSAGE_TYPE_HANDLERS.keys() & message_data.keys()
+            if matched:
+                # Mais de um tipo na mesma mensagem é raro: vale a ordem da tabela
+                message_key = matched.pop() if len(matched) == 1 else next(
+                    key for key in _MESSAGE_TYPE_HANDLERS if key in matched
+                )
+                message_type, extract_content = _MESSAGE_TYPE_HANDLERS[message_key]
+                content = extract_content(message_data)
             
             if not content and message_type == "text":
                 return None
@@ -223,26 +317,54 @@ class WhatsAppService:
     async def get_instance_status(self) -> Dict[str, Any]:
         """
         Verifica status da instância WhatsApp
+        
+        Stale-while-revalidate: dentro de INSTANCE_STATUS_FRESH_TTL responde do
+        cache; até INSTANCE_STATUS_STALE_TTL responde do cache e atualiza em
+        segundo plano. Se a Evolution API falhar, o último status conhecido
+        continua sendo servido.
         """
+        cached = self._status_cache
+        if cached is not None:
+            fetched_at, status = cached
+            age = time.monotonic() - fetched_at
+            if age < INSTANCE_STATUS_FRESH_TTL:
+                return status
+            if age < INSTANCE_STATUS_STALE_TTL:
+                if self._status_refresh_task is None or self._status_refresh_task.done():
+                    self._status_refresh_task = asyncio.create_task(self._refresh_instance_status())
+                return status
+        
         try:
-            url = f"{self.api_url}/instance/fetchInstances"
-            headers = {
-                "apikey": self.api_key
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers)
-                response.raise_for_status()
-                instances = response.json()
-                
-                # Encontrar nossa instância
-                for instance in instances:
-                    if instance.get("instanceName") == self.instance_name:
-                        return instance
-                
-                return {"status": "not_found"}
-                
+            return await self._fetch_instance_status()
         except Exception as e:
+            if cached is not None:
+                logger.warning(f"Erro ao verificar status (servindo último status conhecido): {e}")
+                return cached[1]
             logger.error(f"Erro ao verificar status: {e}")
             return {"status": "error", "error": str(e)}
-
+    
+    async def _fetch_instance_status(self) -> Dict[str, Any]:
+        """Consulta a Evolution API e atualiza o cache do status"""
+        url = f"{self.api_url}/instance/fetchInstances"
+        headers = {
+            "apikey": self.api_key
+        }
+        
+        response = await get_whatsapp_http_client().get(url, headers=headers)
+        response.raise_for_status()
+        instances = response.json()
+        
+        # Encontrar nossa instância
+        status = next(
+            (instance for instance in instances if instance.get("instanceName") == self.instance_name),
+            {"status": "not_found"}
+        )
+        self._status_cache = (time.monotonic(), status)
+        return status
+    
+    async def _refresh_instance_status(self):
+        """Atualização em segundo plano (falha mantém o status em cache)"""
+        try:
+            await self._fetch_instance_status()
+        except Exception as e:
+            logger.warning(f"Erro ao atualizar status em segundo plano: {e}")
@@ -0,0 +1,95 @@
+"""
+Micro-batcher assíncrono (estilo DataLoader)
+Agrupa chamadas concorrentes em uma única chamada em lote
+"""
+import asyncio
+import logging
+import weakref
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _LoopBatch:
+    """Lote em formação de um event loop"""
+    
+    __slots__ = ("pending", "flush_handle")
+    
+    def __init__(self):
+        self.pending: List[Tuple[Any, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    Coalesce chamadas `load(key)` feitas dentro de uma janela curta
+    
+    As chaves acumuladas são entregues juntas para `batch_load_fn`, que deve
+    retornar uma lista de resultados na mesma ordem. Sem cache: chaves
+    repetidas são repassadas como vieram.
+    
+    Cada event loop tem seu próprio lote (futures nunca cruzam loops), então a
+    mesma instância pode ser usada pelo loop principal e por loops em threads.
+    """
+    
+    def __init__(
+        self,
+        batch_load_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait: float = 0.002
+    ):
+        self._batch_load_fn = batch_load_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._batches: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopBatch]" = weakref.WeakKeyDictionary()
+        self._running: Set[asyncio.Task] = set()
+    
+    async def load(self, key: Any) -> Any:
+        """Enfileira a chave e aguarda o resultado do lote"""
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(loop)
+        if batch is None:
+            batch = self._batches[loop] = _LoopBatch()
+        
+        future = loop.create_future()
+        batch.pending.append((key, future))
+        
+        if len(batch.pending) >= self._max_batch_size:
+            self._dispatch(batch)
+        elif batch.flush_handle is None:
+            batch.flush_handle = loop.call_later(self._max_wait, self._dispatch, batch)
+        
+        return await future
+    
+    def _dispatch(self, batch: _LoopBatch):
+        """Dispara o lote acumulado (sempre no loop dono do lote)"""
+        if batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+            batch.flush_handle = None
+        
+        items, batch.pending = batch.pending, []
+        if not items:
+            return
+        
+        task = asyncio.ensure_future(self._run_batch(items))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Executa batch_load_fn e distribui resultados (ou a exceção) entre os chamadores"""
+        try:
+            results = await self._batch_load_fn([key for key, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"batch_load_fn retornou {len(results)} resultados para {len(batch)} chaves"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            # Chamadores cancelados já têm o future concluído
+            if not future.done():
+                future.set_result(result)
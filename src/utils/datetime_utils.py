@@ -0,0 +1,9 @@
+"""
+Utilitários de data/hora
+"""
+from datetime import datetime, timezone
+
+
+def utc_now_iso() -> str:
+    """Retorna o instante atual em UTC no formato ISO 8601 (com offset +00:00)"""
+    return datetime.now(timezone.utc).isoformat()
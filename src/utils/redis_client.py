@@ -1,16 +1,57 @@
 """
 Cliente Redis para cache e filas
 """
+import asyncio
 import logging
-from typing import Optional, Any, Dict, List
+import socket
+import time
+from typing import Optional, Any, Dict, List, Tuple, Union
 import json
 import redis.asyncio as redis
 from redis.asyncio import Redis
 
+try:
+    import orjson  # Serialização rápida dos valores de cache/filas (opcional)
+except ImportError:
+    orjson = None
+
 from src.config.config import config
+from src.utils.batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+# Intervalo mínimo entre tentativas de conexão após uma falha (evita reconectar a cada chamada)
+RECONNECT_BACKOFF_SECONDS = 30
+
+# Janela de agrupamento de enqueue_batched: itens por LPUSH e espera máxima
+ENQUEUE_BATCH_MAX_SIZE = 100
+ENQUEUE_BATCH_MAX_WAIT = 0.005
+
+# Keepalive TCP: conexões ociosas do pool mortas pela rede são detectadas (opções só existem no Linux)
+_KEEPALIVE_OPTIONS = {
+    option: value
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 30), ("TCP_KEEPCNT", 3))
+    if (option := getattr(socket, name, None)) is not None
+}
+
+if orjson is not None:
+    # datetime/dataclass passam pelo default=str, como no json: mesmo formato gravado
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _dumps(value: Any) -> Union[bytes, str]:
+    """Serializa valor para o Redis (orjson quando disponível; tipos desconhecidos via str)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS)
+    return json.dumps(value, default=str)
+
+
+def _loads(value: Union[bytes, str]) -> Any:
+    """Desserializa valor lido do Redis (bytes ou str)"""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
 
 class RedisClient:
     """
@@ -20,28 +61,71 @@ class RedisClient:
     def __init__(self):
         self._client: Optional[Redis] = None
         self._connection_url = config.redis.connection_url
+        self._connect_lock = asyncio.Lock()
+        self._last_failure: Optional[float] = None
+        # Produtores concorrentes de enqueue_batched compartilham um LPUSH por fila
+        self._enqueue_batcher = MicroBatcher(
+            self._enqueue_entries,
+            max_batch_size=ENQUEUE_BATCH_MAX_SIZE,
+            max_wait=ENQUEUE_BATCH_MAX_WAIT
+        )
+        # BLMPOP exige Redis >= 7; desligado na primeira recusa do servidor
+        self._blmpop_supported = True
     
     async def connect(self):
-        """Conecta ao Redis"""
-        try:
-            self._client = await redis.from_url(
+        """
+        Conecta ao Redis (um único pool compartilhado pelo processo)
+        
+        Chamadas concorrentes aguardam a mesma conexão; após uma falha, novas
+        tentativas só ocorrem depois de RECONNECT_BACKOFF_SECONDS.
+        """
+        async with self._connect_lock:
+            if self._client:
+                return
+            if self._last_failure is not None and time.monotonic() - self._last_failure < RECONNECT_BACKOFF_SECONDS:
+                raise ConnectionError("Redis indisponível (aguardando nova tentativa de conexão)")
+            
+            client = redis.from_url(
                 self._connection_url,
                 decode_responses=config.redis.decode_responses,
-                encoding="utf-8"
+                encoding="utf-8",
+                max_connections=config.redis.max_connections,
+                socket_keepalive=True,
+                socket_keepalive_options=_KEEPALIVE_OPTIONS,
+                # PING antes de reutilizar conexão ociosa há mais tempo que o intervalo
+                health_check_interval=config.redis.health_check_interval,
+                retry_on_timeout=True
             )
-            # Testar conexão
-            await self._client.ping()
+            try:
+                # Testar conexão
+                await client.ping()
+            except Exception as e:
+                self._last_failure = time.monotonic()
+                await client.aclose()
+                logger.error(f"Erro ao conectar ao Redis: {e}")
+                raise
+            
+            self._client = client
+            self._last_failure = None
             logger.info("Conectado ao Redis com sucesso")
-        except Exception as e:
-            logger.error(f"Erro ao conectar ao Redis: {e}")
-            raise
     
     async def disconnect(self):
         """Desconecta do Redis"""
         if self._client:
-            await self._client.close()
+            await self._client.aclose()
+            self._client = None
             logger.info("Desconectado do Redis")
     
+    async def ping(self) -> bool:
+        """Verifica se o Redis responde (conecta se necessário)"""
+        try:
+            if not self._client:
+                await self.connect()
+            return bool(await self.client.ping())
+        except Exception as e:
+            logger.warning(f"Redis não respondeu ao ping: {e}")
+            return False
+    
     @property
     def client(self) -> Redis:
         """Retorna cliente Redis"""
@@ -56,7 +140,7 @@ class RedisClient:
         try:
             value = await self.client.get(key)
             if value:
-                return json.loads(value)
+                return _loads(value)
             return None
         except Exception as e:
             logger.error(f"Erro ao obter chave {key}: {e}")
@@ -70,7 +154,7 @@ class RedisClient:
     ):
         """Define valor no cache com TTL opcional (segundos)"""
         try:
-            serialized = json.dumps(value, default=str)
+            serialized = _dumps(value)
             if ttl:
                 await self.client.setex(key, ttl, serialized)
             else:
@@ -78,6 +162,51 @@ class RedisClient:
         except Exception as e:
             logger.error(f"Erro ao definir chave {key}: {e}")
     
+    async def set_if_absent(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[int] = None
+    ) -> bool:
+        """
+        Define valor só se a chave não existir (SET ... NX [EX ttl], um único comando atômico)
+        
+        Returns:
+            True se o valor foi gravado; False se a chave já existia (ou em erro)
+        """
+        try:
+            return bool(await self.client.set(key, _dumps(value), ex=ttl or None, nx=True))
+        except Exception as e:
+            logger.error(f"Erro ao definir chave {key} (NX): {e}")
+            return False
+    
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Obtém vários valores do cache em um único round-trip (None para ausentes)"""
+        if not keys:
+            return []
+        try:
+            values = await self.client.mget(keys)
+            return [_loads(value) if value else None for value in values]
+        except Exception as e:
+            logger.error(f"Erro ao obter {len(keys)} chaves: {e}")
+            return [None] * len(keys)
+    
+    async def mset(
+        self,
+        items: Dict[str, Any],
+        ttl: Optional[int] = None
+    ):
+        """Define vários valores no cache em um único round-trip, com TTL opcional (segundos)"""
+        if not items:
+            return
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, _dumps(value), ex=ttl or None)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Erro ao definir {len(items)} chaves: {e}")
+    
     async def delete(self, key: str):
         """Remove chave do cache"""
         try:
@@ -98,24 +227,106 @@ class RedisClient:
     async def enqueue(self, queue_name: str, data: Dict[str, Any]):
         """Adiciona item à fila"""
         try:
-            serialized = json.dumps(data, default=str)
+            serialized = _dumps(data)
             await self.client.lpush(queue_name, serialized)
         except Exception as e:
             logger.error(f"Erro ao adicionar à fila {queue_name}: {e}")
             raise
     
+    async def enqueue_many(self, queue_name: str, items: List[Dict[str, Any]]):
+        """Adiciona vários itens à fila em um único LPUSH (mesma ordem de consumo de enqueue)"""
+        if not items:
+            return
+        try:
+            await self.client.lpush(queue_name, *[_dumps(item) for item in items])
+        except Exception as e:
+            logger.error(f"Erro ao adicionar {len(items)} itens à fila {queue_name}: {e}")
+            raise
+    
+    async def enqueue_batched(self, queue_name: str, data: Dict[str, Any]):
+        """
+        Como enqueue, mas agrupa chamadas concorrentes (ex: rajadas de webhooks)
+        
+        Itens enfileirados dentro de ENQUEUE_BATCH_MAX_WAIT viram um LPUSH por
+        fila; retorna quando o lote foi gravado.
+        """
+        await self._enqueue_batcher.load((queue_name, data))
+    
+    async def _enqueue_entries(self, entries: List[Tuple[str, Dict[str, Any]]]) -> List[None]:
+        """Grava um lote de enqueue_batched: um LPUSH por fila, todos no mesmo pipeline"""
+        by_queue: Dict[str, List[Union[bytes, str]]] = {}
+        for queue_name, data in entries:
+            by_queue.setdefault(queue_name, []).append(_dumps(data))
+        
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for queue_name, serialized in by_queue.items():
+                    pipe.lpush(queue_name, *serialized)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Erro ao adicionar lote de {len(entries)} itens às filas: {e}")
+            raise
+        return [None] * len(entries)
+    
     async def dequeue(self, queue_name: str, timeout: int = 0) -> Optional[Dict[str, Any]]:
         """Remove e retorna item da fila (blocking)"""
         try:
             result = await self.client.brpop(queue_name, timeout=timeout)
             if result:
                 _, value = result
-                return json.loads(value)
+                return _loads(value)
             return None
         except Exception as e:
             logger.error(f"Erro ao remover da fila {queue_name}: {e}")
             return None
     
+    async def dequeue_batch(
+        self,
+        queue_names: Union[str, List[str]],
+        count: int = 32,
+        timeout: float = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Remove até `count` itens de uma vez (blocking até chegar o primeiro)
+        
+        Com várias filas, lê da primeira não vazia (na ordem dada). Usa BLMPOP
+        (Redis >= 7); em versões antigas, BRPOP + RPOPs no mesmo pipeline.
+        
+        Returns:
+            Itens na ordem de consumo (lista vazia no timeout)
+        """
+        queues = [queue_names] if isinstance(queue_names, str) else list(queue_names)
+        try:
+            if self._blmpop_supported:
+                try:
+                    result = await self.client.execute_command(
+                        "BLMPOP", timeout, len(queues), *queues, "RIGHT", "COUNT", count
+                    )
+                    if not result:
+                        return []
+                    _, values = result
+                    return [_loads(value) for value in values]
+                except redis.ResponseError as e:
+                    if "unknown command" not in str(e).lower():
+                        raise
+                    self._blmpop_supported = False
+                    logger.info("Redis sem BLMPOP (< 7): dequeue_batch usando BRPOP + RPOP")
+            
+            first = await self.client.brpop(queues, timeout=timeout)
+            if not first:
+                return []
+            queue_name, value = first
+            values = [value]
+            if count > 1:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for _ in range(count - 1):
+                        pipe.rpop(queue_name)
+                    values.extend(item for item in await pipe.execute() if item is not None)
+            return [_loads(value) for value in values]
+        except Exception as e:
+            logger.error(f"Erro ao remover lote das filas {queues}: {e}")
+            return []
+    
     async def queue_length(self, queue_name: str) -> int:
         """Retorna tamanho da fila"""
         try:
@@ -129,7 +340,7 @@ class RedisClient:
     async def hset(self, key: str, field: str, value: Any):
         """Define campo em hash"""
         try:
-            serialized = json.dumps(value, default=str)
+            serialized = _dumps(value)
             await self.client.hset(key, field, serialized)
         except Exception as e:
             logger.error(f"Erro ao definir hash {key}.{field}: {e}")
@@ -139,7 +350,7 @@ class RedisClient:
         try:
             value = await self.client.hget(key, field)
             if value:
-                return json.loads(value)
+                return _loads(value)
             return None
         except Exception as e:
             logger.error(f"Erro ao obter hash {key}.{field}: {e}")
@@ -149,7 +360,7 @@ class RedisClient:
         """Obtém todos os campos de hash"""
         try:
             data = await self.client.hgetall(key)
-            return {k: json.loads(v) for k, v in data.items()}
+            return {k: _loads(v) for k, v in data.items()}
         except Exception as e:
             logger.error(f"Erro ao obter hash completo {key}: {e}")
             return {}
@@ -0,0 +1,50 @@
+"""
+Cache em memória com expiração (TTL) e limite de tamanho (LRU)
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Cache local ao processo: entradas expiram após `ttl` segundos e as menos
+    usadas recentemente são descartadas quando `maxsize` é atingido
+    
+    Não é thread-safe; pensado para uso no event loop.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Retorna valor em cache ou `default` se ausente/expirado"""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Armazena valor (renova o TTL da chave; `ttl` sobrescreve o padrão)"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable):
+        """Remove a chave, se existir"""
+        self._data.pop(key, None)
+    
+    def clear(self):
+        """Remove todas as entradas"""
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)